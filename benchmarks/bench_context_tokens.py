@@ -0,0 +1,79 @@
+"""Per-turn input tokens with and without history trimming/summarization.
+
+Replays a scripted 30-turn conversation (with premium lookups) through the real
+graph and prints the input tokens the model receives on every turn.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_context_tokens.py [--turns 30] [--budget 8000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot.context import CONTEXT_TOKEN_BUDGET, ContextManager, TokenCounter
+from chatbot.graph import setup_graph
+from chatbot.prompt import sys_prompt
+
+counter = TokenCounter()
+
+
+class ScriptedModel:
+    """Calls premium_filter every fifth turn and otherwise answers with a paragraph."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def ainvoke(self, messages):
+        self.sent.append(counter.count(messages))
+        if messages[-1].type == "human" and "quote" in messages[-1].content:
+            return AIMessage("", tool_calls=[{"name": "premium_filter", "id": str(uuid.uuid4()), "args": {
+                "age": "32", "cancer": "Lung Cancer", "gender": "Female"}}])
+        return AIMessage("That makes a lot of sense, and many of our customers felt the same way at first. " * 6)
+
+
+class ScriptedSummarizer:
+    async def ainvoke(self, messages, config=None):
+        return AIMessage("Customer is a 32 year old woman interested in lung cancer cover; "
+                         "options were pitched and she is weighing the price.")
+
+
+async def replay(turns, context):
+    model = ScriptedModel()
+    app = setup_graph(model, checkpointer=MemorySaver(), context=context)
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    await app.ainvoke({"messages": [SystemMessage(sys_prompt), ("user", "Hi")]}, config)
+    per_turn = []
+    for turn in range(turns):
+        before = len(model.sent)
+        text = "Can I get a quote?" if turn % 5 == 4 else f"Tell me more about point {turn}, I'm still deciding."
+        await app.ainvoke({"messages": [("user", text)]}, config)
+        per_turn.append(sum(model.sent[before:]))
+    return per_turn
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--keep-turns", type=int, default=4)
+    args = parser.parse_args()
+
+    full = await replay(args.turns, None)
+    trimmed = await replay(args.turns, ContextManager(ScriptedSummarizer(), budget=args.budget,
+                                                      keep_turns=args.keep_turns, counter=counter))
+    print(f"{'turn':>4} {'full history':>13} {'trimmed':>9}")
+    for turn, (a, b) in enumerate(zip(full, trimmed), 1):
+        print(f"{turn:>4} {a:>13} {b:>9}")
+    print(f"total {sum(full):>12} {sum(trimmed):>9}  ({100 * (1 - sum(trimmed) / sum(full)):.0f}% fewer input tokens)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
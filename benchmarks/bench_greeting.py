@@ -0,0 +1,71 @@
+"""Connect-to-first-message latency: LLM greeting per connection vs cached/templated greeting.
+
+Drives the real /chat endpoint in-process (Starlette TestClient) with a scripted
+model that sleeps for --llm-latency seconds per call, like a GPT-4o round trip.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_greeting.py [--connections 20] [--llm-latency 1.5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import main
+from chatbot import websocket
+from chatbot.graph import setup_graph
+from chatbot.greeting import GreetingCache
+
+
+class ScriptedModel:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = []
+
+    async def ainvoke(self, messages):
+        self.calls.append(len(messages))
+        await asyncio.sleep(self.latency)
+        return AIMessage("Hello! Do you have a few minutes to chat?", response_metadata={"finish_reason": "stop"})
+
+
+def measure(mode, connections, latency, language):
+    model = ScriptedModel(latency)
+    websocket._app = setup_graph(model, checkpointer=MemorySaver())
+    websocket._greetings = GreetingCache(model, mode=mode)
+    timings = []
+    with TestClient(main.app) as client:
+        for _ in range(connections):
+            start = time.perf_counter()
+            with client.websocket_connect(f"/chat?language={language}") as ws:
+                ws.receive_text()
+                timings.append((time.perf_counter() - start) * 1000)
+                # The greeting must be part of the thread: the next model call sees system, Hi, greeting, user
+                ws.send_text("Tell me more")
+                ws.receive_text()
+                assert model.calls[-1] == 4, model.calls
+    return timings
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=1.5)
+    args = parser.parse_args()
+    for mode, language in (("llm", "English"), ("template", "English"), ("generate", "Bahasa Indonesia")):
+        timings = measure(mode, args.connections, args.llm_latency, language)
+        print(f"{mode:<9} ({language:<16}) connect-to-first-message p50 {statistics.median(timings):8.1f} ms  "
+              f"max {max(timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main_()
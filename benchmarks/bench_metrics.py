@@ -0,0 +1,55 @@
+"""Micro-benchmark: cost of the /metrics instrumentation per observation, per turn and per scrape.
+
+Usage:
+    python benchmarks/bench_metrics.py [--n 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from chatbot import metrics
+
+
+def per_call(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def instrumented_turn(response):
+    """Everything the hot path records for one turn with a tool call (two agent calls, one tools call)."""
+    for _ in range(2):
+        started = time.perf_counter()
+        metrics.LLM_SECONDS.observe(time.perf_counter() - started)
+        metrics.observe_tokens(response, None)
+        metrics.NODE_SECONDS.labels("agent").observe(time.perf_counter() - started)
+    metrics.NODE_SECONDS.labels("tools").observe(0.002)
+    metrics.TOOL_SECONDS.labels("premium_filter").observe(0.00001)
+    metrics.TURNS.labels("ok").inc()
+    metrics.TURN_SECONDS.observe(1.2)
+    metrics.WS_SEND_SECONDS.observe(0.001)
+    metrics.FIRST_TOKEN_SECONDS.observe(0.3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    args = parser.parse_args()
+    response = AIMessage("hi", usage_metadata={"input_tokens": 4000, "output_tokens": 60, "total_tokens": 4060})
+
+    print(f"histogram observe          {per_call(lambda: metrics.TURN_SECONDS.observe(0.5), args.n):8.0f} ns")
+    print(f"labelled histogram observe {per_call(lambda: metrics.NODE_SECONDS.labels('agent').observe(0.5), args.n):8.0f} ns")
+    print(f"counter inc                {per_call(lambda: metrics.TURNS.labels('ok').inc(), args.n):8.0f} ns")
+    turn_ns = per_call(lambda: instrumented_turn(response), args.n // 10)
+    print(f"instrumentation per turn   {turn_ns:8.0f} ns ({turn_ns / 1e6:.4f} ms)")
+    print(f"render /metrics            {per_call(metrics.render, 1000) / 1e3:8.0f} us")
+
+
+if __name__ == "__main__":
+    main()
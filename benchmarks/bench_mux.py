@@ -0,0 +1,136 @@
+"""Many sessions over one multiplexed socket vs one socket per session.
+
+Starts a server with the offline fake model, then runs the load test's
+scripted conversations for --sessions concurrent sessions twice: each session
+on its own /chat?protocol=frames socket, and every session on a single
+/chat/mux socket. Reports the sockets used, the time until every session was
+greeted, turn latency, bytes on the wire per turn (both directions, WebSocket
+payloads only; each socket also costs a TCP and WebSocket handshake) and the
+share of those bytes that is framing rather than reply text.
+
+Usage:
+    python benchmarks/bench_mux.py [--sessions 200] [--turns 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import CONVERSATIONS, percentile, rss_kib, start_server
+
+
+class Wire:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.text = 0  # Reply text carried in delta frames
+
+    def frame(self, raw):
+        self.received += len(raw)
+        frame = json.loads(raw)
+        if frame["type"] == "delta":
+            self.text += len(frame["text"])
+        return frame
+
+
+async def read_until_end(recv, wire):
+    while True:
+        frame = wire.frame(await recv())
+        if frame["type"] in ("end", "error", "busy") and not frame.get("discarded"):
+            return frame
+
+
+async def converse(index, args, send, recv, wire, results):
+    conversation = CONVERSATIONS[index % len(CONVERSATIONS)][:args.turns]
+    await asyncio.wait_for(read_until_end(recv, wire), args.timeout)  # Greeting
+    results["greeted"].append(time.perf_counter())
+    for number, text in enumerate(conversation):
+        started = time.perf_counter()
+        await send(text, number)
+        frame = await asyncio.wait_for(read_until_end(recv, wire), args.timeout)
+        if frame["type"] != "end":
+            results["errors"].append(frame.get("message", frame["type"]))
+            continue
+        results["turn"].append(time.perf_counter() - started)
+
+
+async def run_sockets(args, url, wire, results):
+    async def session(index):
+        async with websockets.connect(f"{url}?protocol=frames", max_size=None, open_timeout=args.timeout) as ws:
+            async def send(text, _):
+                wire.sent += len(text)
+                await ws.send(text)
+
+            await converse(index, args, send, ws.recv, wire, results)
+
+    await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    return args.sessions
+
+
+async def run_mux(args, url, wire, results):
+    async with websockets.connect(f"{url}/mux", max_size=None, open_timeout=args.timeout) as ws:
+        queues = {str(i): asyncio.Queue() for i in range(args.sessions)}
+
+        async def send_frame(frame):
+            raw = json.dumps(frame)
+            wire.sent += len(raw)
+            await ws.send(raw)
+
+        async def demux():
+            async for raw in ws:
+                await queues[json.loads(raw)["session"]].put(raw)
+
+        async def session(index):
+            session_id = str(index)
+
+            async def send(text, number):
+                await send_frame({"type": "message", "session": session_id, "id": number, "text": text})
+
+            await send_frame({"type": "open", "session": session_id})
+            await converse(index, args, send, queues[session_id].get, wire, results)
+
+        reader = asyncio.create_task(demux())
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+        reader.cancel()
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=4, help="User messages per session (max 4)")
+    parser.add_argument("--latency", default="lognormal:0.3,0.4", help="Fake model time to first token")
+    parser.add_argument("--token-delay", default="fixed:0.01", help="Fake model delay between tokens")
+    args = parser.parse_args()
+    args.reply_words, args.server_logs, args.timeout = 60, False, 120.0
+    os.environ.setdefault("MUX_MAX_SESSIONS", str(args.sessions))
+
+    print(f"{args.sessions} sessions x {args.turns} turns")
+    print(f"{'transport':<10} {'sockets':>8} {'all greeted ms':>15} {'turn p50 ms':>12} {'turn p95 ms':>12} "
+          f"{'bytes/turn':>11} {'framing':>8} {'errors':>7} {'RSS MiB':>8}")
+    for mode, runner in (("sockets", run_sockets), ("mux", run_mux)):
+        proc, url = start_server(args)
+        try:
+            wire, results = Wire(), {"greeted": [], "turn": [], "errors": []}
+            started = time.perf_counter()
+            sockets = asyncio.run(runner(args, url, wire, results))
+            rss = (rss_kib(proc.pid) or 0) / 1024
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        greeted = (max(results["greeted"]) - started) * 1000 if results["greeted"] else 0
+        turns = results["turn"]
+        total = wire.sent + wire.received
+        print(f"{mode:<10} {sockets:>8} {greeted:>15.0f} {percentile(turns, 50) * 1000:>12.0f} "
+              f"{percentile(turns, 95) * 1000:>12.0f} {total / max(len(turns), 1):>11.0f} "
+              f"{(total - wire.text) / total:>8.1%} {len(results['errors']):>7} {rss:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Throughput of bulk premium quotes: POST /premiums/batch vs one premium_filter call per profile.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_premium_batch.py [--profiles 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+
+import orjson
+from fastapi.testclient import TestClient
+
+import main
+from chatbot.batch import quote_chunk
+from chatbot.tools import premium_filter, premium_store
+
+
+def make_profiles(n, index, seed=0):
+    rng = random.Random(seed)
+    return [{"id": i, "age": rng.randint(15, 60), "cancer": rng.choice(index.cancers).lower(),
+             "gender": rng.choice(index.genders)} for i in range(n)]
+
+
+def scalar(profiles, index):
+    """One index lookup per profile, serialized individually (the best a per-profile loop can do)."""
+    lines = []
+    for i, p in enumerate(profiles):
+        band = index.resolve_age(str(p["age"]))
+        quotes = index.lookup(band, p["cancer"].title(), p["gender"].capitalize())
+        lines.append(orjson.dumps({"index": i, "id": p["id"], "age_band": band, "quotes": {
+            q.stage: {opt: int(price) for opt, price in q.prices.items()} for q in quotes}}))
+    return b"\n".join(lines)
+
+
+def check_bad_input(client):
+    """A bad profile or line gets its own error result; the valid profiles around it are still quoted."""
+    good = {"age": 32, "cancer": "Lung Cancer", "gender": "Female"}
+    bad_age = dict(good, age=2 ** 63)
+    for content_type, body in (("application/json", orjson.dumps([good, bad_age, good])),
+                               ("application/x-ndjson", b"\n".join([orjson.dumps(good), orjson.dumps(bad_age),
+                                                                   b"{not json", orjson.dumps(good)]))):
+        response = client.post("/premiums/batch", content=body, headers={"content-type": content_type})
+        results = [orjson.loads(line) for line in response.text.splitlines()]
+        assert response.status_code == 200 and "quotes" in results[0] and "quotes" in results[-1], results
+        assert results[1] == {"index": 1, "error": "invalid age"}, results
+        if content_type == "application/x-ndjson":
+            assert results[2] == {"index": 2, "error": "line is not valid JSON"}, results
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--tool-calls", type=int, default=2_000)
+    args = parser.parse_args()
+    index = premium_store.index
+    profiles = make_profiles(args.profiles, index)
+    n = len(profiles)
+
+    tool_profiles = profiles[:args.tool_calls]
+    tool_s, _ = timed(lambda: [premium_filter.invoke({"age": str(p["age"]), "cancer": p["cancer"],
+                                                      "gender": p["gender"]}) for p in tool_profiles])
+    scalar_s, _ = timed(scalar, profiles, index)
+    index.batch()  # Build the tables outside the timing
+    vector_s, body = timed(quote_chunk, index.batch(), profiles, 0)
+
+    with TestClient(main.app) as client:
+        payload = orjson.dumps(profiles)
+        http_json_s, response = timed(lambda: client.post("/premiums/batch", content=payload,
+                                                          headers={"content-type": "application/json"}))
+        assert response.status_code == 200 and response.text.count("\n") == n
+        ndjson = b"\n".join(orjson.dumps(p) for p in profiles)
+        http_ndjson_s, response = timed(lambda: client.post("/premiums/batch", content=ndjson,
+                                                            headers={"content-type": "application/x-ndjson"}))
+        assert response.status_code == 200 and response.text.count("\n") == n
+        check_bad_input(client)
+
+    def row(name, seconds, count=n):
+        print(f"{name:<40} {seconds * 1000:>9.1f} ms {count / seconds:>12,.0f} profiles/s")
+
+    print(f"{n:,} profiles")
+    row(f"premium_filter tool ({len(tool_profiles):,} calls)", tool_s, len(tool_profiles))
+    row("per-profile index lookup + JSON", scalar_s)
+    row("vectorized BatchQuoter (resolve + render)", vector_s)
+    row("POST /premiums/batch (JSON list)", http_json_s)
+    row("POST /premiums/batch (NDJSON)", http_ndjson_s)
+    print(f"response size {len(body) / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main_()
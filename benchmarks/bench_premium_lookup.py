@@ -0,0 +1,99 @@
+"""Micro-benchmark: premium_filter via the precomputed index vs the old per-call pandas scan.
+
+Usage:
+    python benchmarks/bench_premium_lookup.py [--scale 1 10 100] [--calls 2000]
+
+`--scale` replicates the premium table with extra synthetic cancer types to show
+how each path behaves as the table grows.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from chatbot import tools
+from chatbot.premiums import PremiumIndex, load_premium_rows
+
+
+def legacy_lookup(df, age_unique, age, cancer, gender, option="A"):
+    """The pre-index premium_filter data path: boolean masks + iterrows()."""
+    option_column = f"Option {option}"
+    if age not in age_unique:
+        age_int = int(age)
+        for age_range in age_unique:
+            if "-" in age_range:
+                lower, upper = map(int, age_range.split("-"))
+                if lower <= age_int < upper:
+                    age = age_range
+                    break
+        if age not in age_unique:
+            age = min(age_unique, key=lambda x: abs(int(x.split("-")[0]) - age_int))
+    df_filter = df[(df['Age'] == age) & (df['Cancer_type'] == cancer) & (df['Gender'] == gender)]
+    stages = {}
+    for _, row in df_filter.iterrows():
+        stages[row['Stage']] = row[option_column]
+    return stages
+
+
+def index_lookup(index, age, cancer, gender, option="A"):
+    quotes = index.lookup(index.resolve_age(age), cancer, gender)
+    return {quote.stage: quote.prices[option] for quote in quotes}
+
+
+def scaled_table(df, scale):
+    if scale == 1:
+        return df
+    copies = [df]
+    for i in range(1, scale):
+        extra = df.copy()
+        extra['Cancer_type'] = extra['Cancer_type'] + f" {i}"
+        copies.append(extra)
+    return pd.concat(copies, ignore_index=True)
+
+
+def bench(fn, profiles):
+    start = time.perf_counter()
+    for profile in profiles:
+        fn(*profile)
+    return (time.perf_counter() - start) / len(profiles) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    base = pd.DataFrame(load_premium_rows(tools.EXCEL_FILE_PATH))
+    current = tools.premium_store.index
+    rng = random.Random(0)
+    cancers = sorted(base['Cancer_type'].unique())
+    genders = sorted(base['Gender'].unique())
+    profiles = [(str(rng.randint(14, 60)), rng.choice(cancers), rng.choice(genders), rng.choice("ABC"))
+                for _ in range(args.calls)]
+
+    # Both paths must agree before timing them
+    for age, cancer, gender, option in profiles[:200]:
+        assert legacy_lookup(base, list(current.ages), age, cancer, gender, option) == \
+            index_lookup(current, age, cancer, gender, option)
+
+    print(f"{'rows':>8} {'pandas us/call':>15} {'index us/call':>14} {'speedup':>8}")
+    for scale in args.scale:
+        df = scaled_table(base, scale)
+        age_unique = sorted(df['Age'].unique().tolist())
+        index = PremiumIndex(df.to_dict("records"))
+        legacy_us = bench(lambda *p: legacy_lookup(df, age_unique, *p), profiles[:max(50, args.calls // scale)])
+        index_us = bench(lambda *p: index_lookup(index, *p), profiles)
+        print(f"{len(df):>8} {legacy_us:>15.1f} {index_us:>14.2f} {legacy_us / index_us:>7.0f}x")
+
+    tool_us = bench(lambda *p: tools.premium_filter.func(*p[:3]), profiles)
+    print(f"\npremium_filter end to end (index + formatting): {tool_us:.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
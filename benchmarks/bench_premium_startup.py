@@ -0,0 +1,68 @@
+"""Cold-start benchmark: loading the premium table with and without the snapshot.
+
+Each sample is a fresh interpreter that imports chatbot.tools and reads the
+premium store's index (what the warm-up does), so the numbers include module
+imports. The runs use a copy of premium.xlsx in a temporary directory, so the
+repository's own snapshot is never rewritten or deleted.
+
+Usage:
+    python benchmarks/bench_premium_startup.py [--runs 7]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKBOOK_PATH = os.path.join(ROOT, "premium.xlsx")
+
+# Like premium_store in chatbot.tools, but over the copy (argv: workbook path, "1" to use its snapshot)
+PROBE = (
+    "import sys, time; t = time.perf_counter(); import chatbot.tools; "
+    "store = chatbot.tools.PremiumStore(sys.argv[1], use_snapshot=sys.argv[2] == '1', load=False); "
+    "rows = len(store.index); "
+    "print(time.perf_counter() - t, rows, 'pandas' in sys.modules, 'openpyxl' in sys.modules)"
+)
+
+
+def sample(workbook, use_snapshot):
+    out = subprocess.run([sys.executable, "-c", PROBE, workbook, "1" if use_snapshot else "0"], cwd=ROOT,
+                         env=os.environ, capture_output=True, text=True, check=True).stdout.split()
+    return float(out[0]), int(out[1]), out[2] == "True", out[3] == "True"
+
+
+def run(label, runs, workbook, use_snapshot, before=None):
+    times, pandas_loaded, openpyxl_loaded = [], False, False
+    for _ in range(runs):
+        if before:
+            before()
+        elapsed, rows, pandas_loaded, openpyxl_loaded = sample(workbook, use_snapshot)
+        assert rows, "premium table loaded empty"
+        times.append(elapsed * 1000)
+    print(f"{label:<32} median {statistics.median(times):7.1f} ms  min {min(times):7.1f} ms  "
+          f"pandas={pandas_loaded} openpyxl={openpyxl_loaded}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workbook = shutil.copy(WORKBOOK_PATH, os.path.join(tmp, "premium.xlsx"))
+        snapshot = workbook + ".snapshot"
+
+        def remove_snapshot():
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+
+        run("workbook (PREMIUM_SNAPSHOT=0)", args.runs, workbook, use_snapshot=False)
+        run("stale snapshot (parse + write)", args.runs, workbook, use_snapshot=True, before=remove_snapshot)
+        run("warm snapshot", args.runs, workbook, use_snapshot=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Prompt compilation cost and the cached/fresh token split per session.
+
+Usage:
+    python benchmarks/bench_prompt_compile.py [--personas 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import prompt
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--personas", type=int, default=200)
+    args = parser.parse_args()
+    personas = [prompt.get_persona_details(user_name=f"Customer {i}", user_gender="Female", user_age=20 + i % 40)
+                for i in range(args.personas)]
+
+    start = time.perf_counter()
+    for persona in personas:
+        prompt.get_prompt(persona, tmr_name=prompt.DEFAULT_TMR_NAME, product_name=prompt.product_name,
+                          language="English", close_ended_ques_excitement=prompt.close_ended_ques_excitement,
+                          unpredictable_reasons=prompt.unpredictable_reasons, open_ended_ques=prompt.open_ended_ques,
+                          key_selling_points=prompt.key_selling_points, coverage_benefits=prompt.coverage_benefits,
+                          policy_details_and_exclusions=prompt.policy_details_and_exclusions,
+                          terms_and_conditions=prompt.terms_and_conditions, value_proposition=prompt.value_proposition,
+                          product_benefits=prompt.product_benefits, statistical_examples=prompt.statistical_examples,
+                          objection_rule=prompt.objection_rule)
+    full_us = (time.perf_counter() - start) / len(personas) * 1e6
+
+    start = time.perf_counter()
+    compiled = [prompt.compile_prompt(persona) for persona in personas]
+    cold_us = (time.perf_counter() - start) / len(personas) * 1e6
+    start = time.perf_counter()
+    for persona in personas:
+        prompt.compile_prompt(persona)
+    warm_us = (time.perf_counter() - start) / len(personas) * 1e6
+
+    assert len({id(c.prefix) for c in compiled}) == 1, "prefix must be the same object for every session"
+    tokens = [c.section_tokens for c in compiled]
+    prefix = tokens[0]["prefix"]
+    suffix = sum(t["suffix"] for t in tokens) / len(tokens)
+    print(f"full re-render        {full_us:8.1f} us/session")
+    print(f"compile (new persona) {cold_us:8.1f} us/session")
+    print(f"compile (memoized)    {warm_us:8.1f} us/session")
+    print(f"prefix tokens {prefix} (cacheable), mean suffix tokens {suffix:.0f} (fresh): "
+          f"{100 * prefix / (prefix + suffix):.1f}% of the system prompt is cacheable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Micro-benchmark: per-check cost and memory of the rate limiter as key cardinality grows.
+
+Compares the old fixed-window defaultdict (which never forgets an IP) with the
+token-bucket limiter on the in-process and SQLite backends.
+
+Usage:
+    python benchmarks/bench_ratelimit.py [--keys 1000 100000 1000000] [--checks 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.ratelimit import InProcessBackend, Limit, RateLimiter, SqliteBackend
+
+
+class LegacyLimiter:
+    """The pre-token-bucket main.py logic."""
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self.store = defaultdict(lambda: {"count": 0, "reset_time": datetime.now() + timedelta(hours=1)})
+
+    def allow(self, name, key):
+        now = datetime.now()
+        if now >= self.store[key]["reset_time"]:
+            self.store[key] = {"count": 0, "reset_time": now + timedelta(hours=1)}
+        if self.store[key]["count"] >= self.limit:
+            return False
+        self.store[key]["count"] += 1
+        return True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(limiter, keys, checks, clock=None):
+    # Populate every key once, then time random checks across them
+    for key in keys:
+        limiter.allow("connections_per_ip", key)
+    sample = [random.choice(keys) for _ in range(checks)]
+    start = time.perf_counter()
+    for key in sample:
+        if clock is not None:
+            clock.now += 0.0001
+        limiter.allow("connections_per_ip", key)
+    return (time.perf_counter() - start) / checks * 1e9
+
+
+def memory_of(factory, keys):
+    tracemalloc.start()
+    limiter = factory()
+    for key in keys:
+        limiter.allow("connections_per_ip", key)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return limiter, current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--checks", type=int, default=200_000)
+    args = parser.parse_args()
+    limits = {"connections_per_ip": Limit.parse("100/hour")}
+
+    print(f"{'keys':>9} {'legacy ns':>10} {'memory ns':>10} {'sqlite ns':>10} "
+          f"{'legacy MiB':>11} {'memory MiB':>11} {'after sweep':>12} {'sweep ms':>9}")
+    for n in args.keys:
+        keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(n)]
+        legacy_ns = run(LegacyLimiter(), keys, args.checks)
+        memory_ns = run(RateLimiter(InProcessBackend(), limits), keys, args.checks)
+        with tempfile.TemporaryDirectory() as tmp:
+            sqlite_keys = keys[:min(n, 100_000)]  # populating a million rows one transaction at a time takes minutes
+            sqlite_ns = run(RateLimiter(SqliteBackend(os.path.join(tmp, "rl.sqlite")), limits), sqlite_keys,
+                            min(args.checks, 50_000))
+
+        _, legacy_bytes = memory_of(LegacyLimiter, keys)
+        clock = FakeClock()
+        limiter, memory_bytes = memory_of(lambda: RateLimiter(InProcessBackend(), limits, clock=clock), keys)
+        # An hour later every bucket has refilled; the sweeper drops all of them
+        clock.now += 3600
+        start = time.perf_counter()
+        limiter.sweep()
+        sweep_ms = (time.perf_counter() - start) * 1000
+        print(f"{n:>9} {legacy_ns:>10.0f} {memory_ns:>10.0f} {sqlite_ns:>10.0f} "
+              f"{legacy_bytes / 2**20:>11.1f} {memory_bytes / 2**20:>11.1f} {len(limiter.backend):>12} "
+              f"{sweep_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Response cache: hit rate and model calls for a FAQ-heavy workload.
+
+Sessions open with the same greeting and ask policy questions (waiting
+period, exclusions, eligibility...) with varied casing and punctuation, some
+after getting a quote. Replies are only reused for identical conversations,
+so hits come from the opening questions. Runs the real graph with the
+offline fake model.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_response_cache.py [--sessions 200] [--latency 1.0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot import metrics
+from chatbot.fake_llm import FakeChatModel
+from chatbot.graph import setup_graph
+from chatbot.greeting import render_greeting
+from chatbot.prompt import compile_prompt, persona_info
+from chatbot.response_cache import ResponseCache
+from chatbot.tools import premium_filter
+
+QUESTIONS = [
+    "Is there a waiting period?",
+    "What are the exclusions?",
+    "Who is eligible for this policy?",
+    "Does it cover pre-existing conditions?",
+    "How do I make a claim?",
+    "Can I cancel the policy?",
+    "What does the Early Stage cover?",
+    "Is chemotherapy covered?",
+]
+PROFILES = ["I'm 32, female, lung cancer", "I am a 45 year old male, skin cancer", "28, woman, thyroid cancer"]
+
+
+def vary(text: str, rng: random.Random) -> str:
+    """The same question as a user might type it."""
+    text = rng.choice([text, text.lower(), text.rstrip("?"), text.upper(), "  " + text.lower() + " ?"])
+    return text
+
+
+async def run(cache, args):
+    model = FakeChatModel(latency=f"fixed:{args.latency}", token_delay="fixed:0", reply_words=40)
+    app = setup_graph(model.bind_tools([premium_filter]), checkpointer=MemorySaver(), cache=cache)
+    prompt = compile_prompt(persona_info)
+    greeting = render_greeting(prompt.persona, prompt.product)
+    rng = random.Random(0)
+    calls_before = sum(metrics.LLM_SECONDS.labels().counts)
+    turns = 0
+    started = time.perf_counter()
+
+    async def session():
+        nonlocal turns
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        await app.aupdate_state(config, {"messages": [SystemMessage(prompt.text), ("user", "Hi"),
+                                                      AIMessage(greeting)]}, as_node="agent")
+        script = [vary(rng.choice(QUESTIONS), rng)]
+        if rng.random() < 0.5:
+            script.append(rng.choice(PROFILES))
+        script.append(vary(rng.choice(QUESTIONS), rng))
+        for text in script:
+            await app.ainvoke({"messages": [("user", text)]}, config)
+            turns += 1
+
+    await asyncio.gather(*(session() for _ in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    return turns, sum(metrics.LLM_SECONDS.labels().counts) - calls_before, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds per fake model call")
+    args = parser.parse_args()
+
+    print(f"{'cache':<6} {'turns':>6} {'model calls':>12} {'calls/turn':>11} {'elapsed s':>10}")
+    for label, cache in (("off", None), ("on", ResponseCache())):
+        turns, calls, elapsed = await run(cache, args)
+        print(f"{label:<6} {turns:>6} {calls:>12} {calls / turns:>11.2f} {elapsed:>10.2f}")
+    print("\n" + "\n".join(line for line in metrics.render().splitlines()
+                            if line.startswith("chatbot_response_cache_total")))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Reconnect cost: resuming the thread vs starting over in a new session.
+
+A customer who has given their profile drops the connection and reconnects.
+Without resume they get a new greeting and must repeat their profile (a
+premium lookup turn). With resume the thread is reattached: after an idle
+drop nothing needs replaying, and after a drop mid-turn the reply finishes
+server-side and is replayed. Runs in-process with the offline fake model.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_resume.py [--reconnects 20] [--latency 0.8]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["FAKE_LLM_TOKEN_DELAY"] = "fixed:0"
+os.environ["ROUTER_MODE"] = "off"  # Measure the model round-trips the reconnect used to need
+os.environ["RESPONSE_CACHE"] = "0"  # The mid-turn question repeats every iteration
+
+PROFILE = "I'm 32, female, lung cancer"
+
+
+def read_until(ws, kind):
+    frames = []
+    while True:
+        frame = json.loads(ws.receive_text())
+        frames.append(frame)
+        if frame["type"] == kind:
+            return frames
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reconnects", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.8, help="Seconds per fake model call")
+    args = parser.parse_args()
+    os.environ["FAKE_LLM_LATENCY"] = f"fixed:{args.latency}"
+
+    from fastapi.testclient import TestClient
+
+    import main
+    from chatbot import metrics
+
+    fresh, resumed, resumed_mid_turn, calls = [], [], [], {"fresh": 0, "resumed": 0}
+
+    def connect_and_quote():
+        ws = client.websocket_connect("/chat?protocol=frames").__enter__()
+        token = read_until(ws, "end")[0]["resume_token"]
+        ws.send_text(PROFILE)
+        return ws, token, read_until(ws, "end")[-1]["seq"]
+
+    def resume(token, last_seq, timings):
+        calls_before = sum(metrics.LLM_SECONDS.labels().counts)
+        started = time.perf_counter()
+        with client.websocket_connect(f"/chat?protocol=frames&resume={token}&last_seq={last_seq}") as ws:
+            read_until(ws, "resumed")
+            timings.append(time.perf_counter() - started)
+        calls["resumed"] += sum(metrics.LLM_SECONDS.labels().counts) - calls_before
+
+    with TestClient(main.app) as client:
+        for _ in range(args.reconnects):
+            ws, token, last_seq = connect_and_quote()
+            ws.__exit__(None, None, None)  # Connection drops while idle
+            resume(token, last_seq, resumed)
+
+            ws, token, last_seq = connect_and_quote()
+            ws.send_text("What does the Early Stage cover?")
+            time.sleep(0.05)
+            ws.__exit__(None, None, None)  # Connection drops before the reply arrives
+            resume(token, last_seq, resumed_mid_turn)
+
+            calls_before = sum(metrics.LLM_SECONDS.labels().counts)
+            started = time.perf_counter()
+            with client.websocket_connect("/chat?protocol=frames") as ws:
+                read_until(ws, "end")  # New greeting
+                ws.send_text(PROFILE)  # Profile collected again
+                read_until(ws, "end")
+                fresh.append(time.perf_counter() - started)
+            calls["fresh"] += sum(metrics.LLM_SECONDS.labels().counts) - calls_before
+
+    def p50(values):
+        return sorted(values)[len(values) // 2] * 1000
+
+    print(f"{args.reconnects} reconnects each, {args.latency}s per model call")
+    print(f"new session + repeat profile:        p50 {p50(fresh):8.1f} ms, "
+          f"{calls['fresh'] / args.reconnects:.1f} model calls")
+    print(f"resume after an idle drop:           p50 {p50(resumed):8.1f} ms")
+    print(f"resume after a drop mid-turn:        p50 {p50(resumed_mid_turn):8.1f} ms (includes the rest of the turn)")
+    print(f"model calls while resuming:          {calls['resumed'] / args.reconnects:.1f} per reconnect "
+          f"(the dropped turn's own call; nothing is asked again)")
+
+
+if __name__ == "__main__":
+    main_()
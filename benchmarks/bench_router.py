@@ -0,0 +1,106 @@
+"""Premium router: hit rate on sample user messages and per-turn latency with and without it.
+
+Runs the real graph with the offline fake model (fixed time per model call),
+so the saving is measured in model calls avoided; with GPT-4o each avoided
+call is typically 1-3 s.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_router.py [--latency 0.8] [--turns 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+
+from langchain_core.messages import SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot import metrics
+from chatbot.fake_llm import FakeChatModel
+from chatbot.graph import setup_graph
+from chatbot.prompt import sys_prompt
+from chatbot.router import PremiumRouter, extract_profile
+from chatbot.tools import premium_filter
+
+# (message, expected profile or None when the model should handle it)
+SAMPLES = [
+    ("I'm 32, female, lung cancer", ("32", "Lung Cancer", "Female")),
+    ("I am a 35 year old male, please quote for skin cancer", ("35", "Skin Cancer", "Male")),
+    ("Quote for thyroid cancer, woman, 28", ("28", "Thyroid Cancer", "Female")),
+    ("I'm 42, female, and worried about lung cancer. How much would it cost?", ("42", "Lung Cancer", "Female")),
+    ("male, 20-25, bone cancer", ("20-25", "Bone Cancer", "Male")),
+    ("I have 2 kids, I'm a 33 yo man, kidney cancer please", ("33", "Kidney Cancer", "Male")),
+    ("Female aged 47 - cervical cancer", ("47", "Cervical Cancer", "Female")),
+    ("51 year old lady, throat", ("51", "Throat Cancer", "Female")),
+    ("Is a 15% discount possible for a man aged 50 with bladder cancer?", ("50", "Bladder Cancer", "Male")),
+    ("Hi, what does this insurance cover?", None),
+    ("What's the difference between the options?", None),
+    ("And for bladder cancer?", None),
+    ("my wife is 40 and I'm 45, lung cancer for her", None),
+    ("lung or skin cancer for a 30 year old woman", None),
+    ("That's too expensive for me.", None),
+    ("How do I apply?", None),
+    ("Can you explain the stages?", None),
+    ("Is there a waiting period?", None),
+    ("Saya perempuan 30 tahun, kanker paru", None),
+    ("Thanks, that's helpful.", None),
+]
+PROFILE_TURNS = [text for text, expected in SAMPLES if expected]
+
+
+def hit_rate():
+    hits = correct = wrong = 0
+    for text, expected in SAMPLES:
+        profile = extract_profile(text)
+        hits += profile is not None
+        correct += profile is not None and profile == expected
+        wrong += profile is not None and profile != expected
+    profile_messages = sum(1 for _, expected in SAMPLES if expected)
+    print(f"{len(SAMPLES)} sample messages, {profile_messages} state a full profile")
+    print(f"router hits {hits} ({hits / len(SAMPLES):.0%} of all messages, {correct / profile_messages:.0%} of "
+          f"profile messages), wrong profile on {wrong}")
+
+
+async def run_turns(mode, latency, turns):
+    model = FakeChatModel(latency="fixed:%s" % latency, token_delay="fixed:0", reply_words=20)
+    router = PremiumRouter(mode) if mode != "off" else None
+    app = setup_graph(model.bind_tools([premium_filter]), checkpointer=MemorySaver(), router=router)
+    calls_before = sum(metrics.LLM_SECONDS.labels().counts)
+    seconds = []
+    for i in range(turns):
+        config = {"configurable": {"thread_id": str(uuid.uuid4()), "language": "English"}}
+        started = time.perf_counter()
+        await app.ainvoke({"messages": [SystemMessage(sys_prompt), ("user", PROFILE_TURNS[i % len(PROFILE_TURNS)])]},
+                          config)
+        seconds.append(time.perf_counter() - started)
+    calls = sum(metrics.LLM_SECONDS.labels().counts) - calls_before
+    seconds.sort()
+    return calls / turns, sum(seconds) / turns, seconds[len(seconds) // 2]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.8, help="Seconds per fake model call")
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    hit_rate()
+    print(f"\nprofile turns ({args.turns}, {args.latency}s per model call)")
+    print(f"{'router mode':<12} {'model calls/turn':>17} {'mean turn ms':>13} {'p50 ms':>8} {'saved ms/turn':>14}")
+    baseline = None
+    for mode in ("off", "tool", "template"):
+        calls, mean, p50 = await run_turns(mode, args.latency, args.turns)
+        baseline = mean if baseline is None else baseline
+        print(f"{mode:<12} {calls:>17.2f} {mean * 1000:>13.1f} {p50 * 1000:>8.1f} {(baseline - mean) * 1000:>14.1f}")
+    print("\n" + "\n".join(line for line in metrics.render().splitlines() if line.startswith("chatbot_router_")
+                            and "_bucket" not in line))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
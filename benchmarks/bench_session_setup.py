@@ -0,0 +1,85 @@
+"""Connection setup cost and memory per idle session: per-connection graph vs shared graph.
+
+Opens N concurrent "sessions" the way websocket_chat does, without a socket or
+an LLM call. Each session is seeded with the system prompt and a greeting so it
+holds a realistic idle checkpoint.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_session_setup.py [--sessions 300]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot import websocket
+from chatbot.graph import setup_graph
+from chatbot.llm import OPENAI_API_KEY
+from chatbot.prompt import sys_prompt
+from chatbot.tools import premium_filter
+
+GREETING = "Hi there! I'm Jordan from Medical Insurance. Do you have a few minutes to chat?"
+
+
+def per_connection_app():
+    """What websocket_chat did before: a new client, ToolNode, MemorySaver and compile per socket."""
+    model = ChatOpenAI(model="gpt-4o", temperature=0, api_key=OPENAI_API_KEY).bind_tools([premium_filter])
+    return setup_graph(model, checkpointer=MemorySaver())
+
+
+async def open_session(make_app):
+    start = time.perf_counter()
+    app = make_app()
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    await app.aupdate_state(config, {"messages": [SystemMessage(sys_prompt), HumanMessage("Hi"), AIMessage(GREETING)]},
+                            as_node="agent")
+    return (app, config), time.perf_counter() - start
+
+
+async def run(label, make_app, n):
+    # Setup cost: sessions opened one after another, without tracing overhead
+    held = []
+    setup_ms = []
+    for _ in range(n):
+        session, elapsed = await open_session(make_app)
+        held.append(session)
+        setup_ms.append(elapsed * 1000)
+    del held
+    setup_ms.sort()
+
+    # Memory: all sessions open concurrently and idle
+    gc.collect()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    sessions = await asyncio.gather(*(open_session(make_app) for _ in range(n)))
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<16} setup p50 {setup_ms[n // 2]:7.2f} ms  p99 {setup_ms[int(n * 0.99)]:7.2f} ms  "
+          f"memory/idle session {(current - base) / n / 1024:8.1f} KiB")
+    del sessions
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=300)
+    args = parser.parse_args()
+
+    websocket.get_app()  # Build the shared graph outside the measurement, as the first connection would
+    await run("per-connection", per_connection_app, args.sessions)
+    await run("shared", websocket.get_app, args.sessions)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
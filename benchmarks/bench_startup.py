@@ -0,0 +1,122 @@
+"""Server startup: import time, time to listening, time to ready and the first session.
+
+1. Import profile: `python -X importtime -c "import main"`, repeated, reporting
+   the median import time and the slowest top-level packages and chatbot modules.
+2. Startup: starts `python main.py`, polls `/` (listening) and `/ready` (warm-up
+   finished; servers without the endpoint count as ready once listening), and
+   opens a framed session the moment the server listens, timing its greeting.
+
+The default backend is the real OpenAI client with a dummy key, so its imports
+are counted. The greeting is a template, so no request leaves the machine.
+Warming the LLM connection pool fails fast without network access.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--backend openai|fake] [--root PATH]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import ROOT, free_port
+
+
+def environment(args, **extra):
+    return dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-benchmark"),
+                LLM_BACKEND=args.backend, PREMIUM_RELOAD_INTERVAL="0", TRANSCRIPTS="0", **extra)
+
+
+def import_profile(args):
+    totals, modules = [], {}
+    for _ in range(args.repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=args.root,
+                                env=environment(args), capture_output=True, text=True)
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            name = name.rstrip()
+            depth = (len(name) - len(name.lstrip())) // 2
+            name = name.strip()
+            if name == "main":
+                totals.append(int(cumulative) / 1e6)
+            elif depth == 1 or name.startswith("chatbot."):
+                modules.setdefault(name, []).append(int(cumulative) / 1e6)
+    print(f"import main: median {statistics.median(totals) * 1000:.0f} ms over {args.repeat} runs")
+    slowest = sorted(((statistics.median(times), name) for name, times in modules.items()), reverse=True)
+    for seconds, name in slowest[:args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+
+def http_status(url):
+    try:
+        return urllib.request.urlopen(url, timeout=1).status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+async def first_session(url):
+    started = time.perf_counter()
+    async with websockets.connect(f"{url}?protocol=frames", max_size=None) as ws:
+        while json.loads(await ws.recv())["type"] != "end":
+            pass
+    return time.perf_counter() - started
+
+
+def startup(args):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "main.py"], cwd=args.root,
+                            env=environment(args, PORT=str(port), HOST="127.0.0.1"),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening = ready = greeting = None
+    try:
+        while time.perf_counter() - started < 120:
+            if proc.poll() is not None:
+                raise SystemExit(f"Server exited with code {proc.returncode}")
+            try:
+                if listening is None and http_status(f"{base}/") == 200:
+                    listening = time.perf_counter() - started
+                    greeting = asyncio.run(first_session(f"ws://127.0.0.1:{port}/chat"))
+                if listening is not None:
+                    status = http_status(f"{base}/ready")
+                    if status in (200, 404):
+                        ready = time.perf_counter() - started
+                        break
+            except OSError:
+                pass
+            time.sleep(0.02)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return listening, ready, greeting
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="Modules listed in the import profile")
+    parser.add_argument("--backend", choices=["openai", "fake"], default="openai")
+    parser.add_argument("--root", default=ROOT, help="Checkout to measure (e.g. a worktree of an older commit)")
+    args = parser.parse_args()
+
+    import_profile(args)
+    runs = [startup(args) for _ in range(args.repeat)]
+    print(f"\nstartup over {args.repeat} runs (median)")
+    for label, values in zip(("listening", "ready", "first greeting (connect at listening)"), zip(*runs)):
+        print(f"  {label:<40} {statistics.median(values) * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Time to first token: full-message replies (plain text) vs token streaming (?protocol=frames).
+
+Drives the real /chat endpoint in-process with a fake chat model that streams
+its reply token by token with --token-delay seconds between tokens.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_streaming.py [--turns 10] [--tokens 120] [--token-delay 0.01]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+
+from fastapi.testclient import TestClient
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.checkpoint.memory import MemorySaver
+
+import main
+from chatbot import websocket
+from chatbot.graph import setup_graph
+from chatbot.greeting import GreetingCache
+
+
+class StreamingFakeModel(BaseChatModel):
+    tokens: int = 120
+    token_delay: float = 0.01
+
+    @property
+    def _llm_type(self) -> str:
+        return "streaming-fake"
+
+    def _words(self):
+        return [f"word{i} " for i in range(self.tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("".join(self._words())))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._words()
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.token_delay)
+            metadata = {"finish_reason": "stop"} if i == len(words) - 1 else {}
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word, response_metadata=metadata))
+            if run_manager:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+
+def measure(protocol, turns, model):
+    websocket._app = setup_graph(model, checkpointer=MemorySaver())
+    websocket._greetings = GreetingCache(model, mode="template")
+    first, total, frames = [], [], []
+    with TestClient(main.app) as client:
+        with client.websocket_connect(f"/chat?protocol={protocol}") as ws:
+            greeting = ws.receive_text()
+            while protocol == "frames" and orjson.loads(greeting)["type"] != "end":
+                greeting = ws.receive_text()
+            for turn in range(turns):
+                start = time.perf_counter()
+                ws.send_text(f"question {turn}")
+                if protocol == "text":
+                    ws.receive_text()
+                    first.append(time.perf_counter() - start)
+                    frames.append(1)
+                else:
+                    count = 0
+                    while True:
+                        frame = orjson.loads(ws.receive_text())
+                        count += 1
+                        if frame["type"] == "delta" and len(first) == turn:
+                            first.append(time.perf_counter() - start)
+                        if frame["type"] == "end":
+                            break
+                    frames.append(count)
+                total.append(time.perf_counter() - start)
+    return first, total, frames
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=120)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    model = StreamingFakeModel(tokens=args.tokens, token_delay=args.token_delay)
+    for protocol in ("text", "frames"):
+        first, total, frames = measure(protocol, args.turns, model)
+        print(f"{protocol:<7} time to first text p50 {statistics.median(first) * 1000:8.1f} ms  "
+              f"full reply p50 {statistics.median(total) * 1000:8.1f} ms  "
+              f"frames/reply {statistics.mean(frames):5.1f} (for {args.tokens} tokens)")
+
+
+if __name__ == "__main__":
+    main_()
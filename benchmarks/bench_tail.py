@@ -0,0 +1,92 @@
+"""Tail latency under a slow, flaky model: no control vs deadline + retries vs hedging.
+
+Starts a server with the offline fake model made heavy-tailed (a fresh
+lognormal time to first token on every call, FAKE_LLM_VARY_LATENCY=1) and
+flaky (--error-rate of calls fail before their first token), then runs the
+load test against it (response cache off, admission limit raised, so every
+turn calls the model) with:
+
+    none      no turn deadline, no retries, no hedging
+    retries   TURN_DEADLINE=--deadline, LLM_RETRIES=2
+    hedged    as retries, plus LLM_HEDGE_PERCENTILE=--hedge-percentile
+
+Reports turn latency percentiles and failed turns from the client side, and the
+server's retry, hedge and deadline-miss counters from /metrics.
+
+Usage:
+    python benchmarks/bench_tail.py [--sessions 100] [--latency lognormal:0.3,0.8] [--error-rate 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import percentile, run, start_server
+
+COUNTERS = {"retries": "chatbot_llm_retries_total", "hedges": "chatbot_llm_hedges_total",
+            "hedge wins": 'chatbot_llm_hedges_total{winner="hedge"}',
+            "misses": "chatbot_turn_deadline_misses_total"}
+
+
+def counters(url):
+    """Sum the benchmark's counters (over all label values) from the server's /metrics."""
+    base = url.replace("ws://", "http://").rsplit("/chat", 1)[0]
+    text = urllib.request.urlopen(f"{base}/metrics", timeout=5).read().decode()
+    totals = dict.fromkeys(COUNTERS, 0.0)
+    for line in text.splitlines():
+        if line.startswith("#") or not line:
+            continue
+        name, _, value = line.rpartition(" ")
+        for label, prefix in COUNTERS.items():
+            if name == prefix or (name.startswith(prefix + "{") and "{" not in prefix):
+                totals[label] += float(value)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=4, help="User messages per session (max 4)")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which sessions are opened")
+    parser.add_argument("--latency", default="lognormal:0.3,0.8", help="Fake model time to first token")
+    parser.add_argument("--token-delay", default="fixed:0.01", help="Fake model delay between tokens")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Share of model calls failing")
+    parser.add_argument("--deadline", type=float, default=10.0, help="TURN_DEADLINE for the controlled runs")
+    parser.add_argument("--hedge-percentile", type=float, default=90.0)
+    args = parser.parse_args()
+    args.protocol, args.think, args.timeout = "frames", 0.0, 120.0
+    args.reply_words, args.server_logs = 30, False
+
+    controlled = {"TURN_DEADLINE": str(args.deadline), "LLM_RETRIES": "2", "TOOL_RETRIES": "1"}
+    modes = (("none", {"TURN_DEADLINE": "0", "LLM_RETRIES": "0", "TOOL_RETRIES": "0", "LLM_HEDGE_PERCENTILE": "0"}),
+             ("retries", dict(controlled, LLM_HEDGE_PERCENTILE="0")),
+             ("hedged", dict(controlled, LLM_HEDGE_PERCENTILE=str(args.hedge_percentile))))
+    # Every turn reaches the model: no cached answers, no queueing for admission slots
+    os.environ.update(FAKE_LLM_VARY_LATENCY="1", FAKE_LLM_ERROR_RATE=str(args.error_rate), RESPONSE_CACHE="0",
+                      LLM_CONCURRENCY=str(4 * args.sessions))
+
+    print(f"{args.sessions} sessions x {args.turns} turns, first token {args.latency}, "
+          f"{args.error_rate:.0%} of model calls failing")
+    print(f"{'mode':<9} {'turns':>6} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'retries':>8} {'hedges':>7} {'hedge wins':>11} {'misses':>7}")
+    for mode, env in modes:
+        os.environ.update(env)
+        proc, url = start_server(args)
+        try:
+            results, _, _, _ = asyncio.run(run(args, url, None))
+            totals = counters(url)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        turns = results["turn"]
+        print(f"{mode:<9} {len(turns):>6} {len(results['errors']):>7} "
+              + " ".join(f"{percentile(turns, p) * 1000:>8.0f}" for p in (50, 95, 99))
+              + f" {max(turns, default=0) * 1000:>8.0f} {totals['retries']:>8.0f} {totals['hedges']:>7.0f} "
+              f"{totals['hedge wins']:>11.0f} {totals['misses']:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
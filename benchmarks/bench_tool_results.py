@@ -0,0 +1,164 @@
+"""Tool calls and tool-result tokens per sales conversation: prose single-option results vs compact all-options JSON.
+
+Replays scripted conversations through the real graph. The customer gives a
+profile, then pushes back on price zero to three times (accepting Option A, B,
+C or nothing). With the old tool the agent fetched each option separately as
+an English paragraph; with the new one it fetches every option once and
+phrases the quotes itself.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_tool_results.py
+"""
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot.context import TokenCounter
+from chatbot.graph import setup_graph
+from chatbot.prompt import coverage_benefits, sys_prompt
+from chatbot.tools import premium_filter, premium_store
+
+counter = TokenCounter()
+
+# The previous premium_filter output: one option per call, as prose
+_DESC_MAJOR = "offering balanced benefits for more intensive treatments and care"
+_DESC_ADVANCED = "ensuring appropriate support for advanced treatments and hospitalizations"
+OPTION_DETAILS = {
+    "A": {"name": "Premium", "desc_early": "provides extensive coverage for treatments, hospital stays, and specialized care",
+          "desc_major": _DESC_MAJOR, "desc_advanced": _DESC_ADVANCED},
+    "B": {"name": "Standard", "desc_early": "provides essential support for treatments and hospital stays at a moderate price",
+          "desc_major": _DESC_MAJOR, "desc_advanced": _DESC_ADVANCED},
+    "C": {"name": "Basic", "desc_early": "offers basic coverage for essential treatments at our most affordable rate",
+          "desc_major": _DESC_MAJOR, "desc_advanced": _DESC_ADVANCED},
+}
+STAGE_TEMPLATES = {
+    "Early Stage": "- **{stage}**: The {plan} plan is IDR {price}. It {desc_early}.\n",
+    "Major Stage": "- **{stage}**: The {plan} plan is IDR {price}, {desc_major}.\n",
+    "Advanced Stage": "- **{stage}**: The {plan} plan is IDR {price}, {desc_advanced}.\n",
+}
+
+
+@tool("premium_filter")
+def legacy_premium_filter(age: str, cancer: str, gender: str, option: str = "A"):
+    """It is used for getting premium of different types of cancer on the basis of Age, Gender, Type of Cancer and Stage."""
+    index = premium_store.index
+    cancer, gender = cancer.strip().title(), gender.strip().capitalize()
+    details = OPTION_DETAILS[option]
+    quotes = index.lookup(index.resolve_age(age), cancer, gender)
+    result = (f"For someone in your situation, we have several coverage options available for {cancer}. "
+              f"Let's look at the {details['name']} plan:\n\n")
+    for quote in quotes:
+        result += STAGE_TEMPLATES[quote.stage].format(stage=quote.stage, plan=details["name"],
+                                                      price=quote.prices[option], **details)
+    return result + ("\nThis plan is designed to give you peace of mind, knowing that your medical expenses are "
+                     "covered, allowing you to focus on your recovery. Would you be interested in exploring this "
+                     "option further?")
+
+
+# The previous prompt section, which asked for one option per tool call
+legacy_coverage_benefits = """
+ You have access to "premium_filter" tool which takes input as Age of Customer, Type of Cancer of Customer and Gender of customer.
+Unique values supported by tools are   age_unique = ['15-20', '20-25', '25-30', '30-35', '35-40', '40-45', '45-50', '50-55'] , gender_unique = ['Male', 'Female'],
+cancer_unique = ['Kidney Cancer', 'Lung Cancer', 'Throat Cancer', 'Skin Cancer','Thyroid Cancer', 'Cervical Cancer', 'Bone Cancer','Bladder Cancer'].
+In age-unique each age band includes the lower limit and excludes the upper limit (e.g., 15 ≤ age < 20).
+
+Get Age, Cancer_type and Gender of customer to call this tool. The tool will give you the premium details , your Job is to sell for `Option A`, if user doesnt agree as its costly
+then quote for `Option B` with all THREE STAGES (Early, Major, Advanced) still user says its costly then quote `Option C` with all THREE STAGES (Early, Major, Advanced). If still customer says its costly after `Option C` then greet them and disconnect the chat. ALWAYS Pitch QUote ONE at a time.
+"""
+legacy_prompt = sys_prompt.replace(coverage_benefits, legacy_coverage_benefits)
+assert legacy_prompt != sys_prompt
+
+PROFILES = [("42", "Lung Cancer", "Female"), ("28", "Skin Cancer", "Male"), ("51", "Thyroid Cancer", "Female")]
+OUTCOMES = {"accepts A": 0, "accepts B": 1, "accepts C": 2, "declines all": 3}
+
+
+class SalesAgent:
+    """Scripted agent following the prompt's sales flow (pitch A, then B, then C)."""
+
+    def __init__(self, legacy: bool, profile):
+        self.legacy = legacy
+        self.profile = profile
+        self.input_tokens = 0
+        self.model_calls = 0
+
+    async def ainvoke(self, messages):
+        self.model_calls += 1
+        self.input_tokens += counter.count(messages)
+        last = messages[-1]
+        pushbacks = sum(1 for m in messages if m.type == "human" and "expensive" in m.content)
+        age, cancer, gender = self.profile
+        if last.type == "tool":
+            return AIMessage(self._pitch(pushbacks))
+        if "years old" in last.content or (self.legacy and "expensive" in last.content and pushbacks < 3):
+            args = {"age": age, "cancer": cancer, "gender": gender}
+            if self.legacy:
+                args["option"] = "ABC"[pushbacks]
+            return AIMessage("", tool_calls=[{"name": "premium_filter", "id": str(uuid.uuid4()), "args": args}])
+        if "expensive" in last.content:
+            if pushbacks >= 3:
+                return AIMessage("I understand. Thank you for your time, and please reach out if anything changes.")
+            return AIMessage(self._pitch(pushbacks))
+        return AIMessage("Thank you! I'll have an agent call you to complete the application.")
+
+    def _pitch(self, option_index):
+        plan = ("Premium", "Standard", "Basic")[option_index]
+        return (f"For {self.profile[1]} the {plan} plan costs IDR 294,000 for the Early Stage, IDR 441,000 for the "
+                f"Major Stage and IDR 588,000 for the Advanced Stage. It gives you cover for treatment and hospital "
+                f"stays so you can focus on recovery. Would this work for you?")
+
+
+async def replay(legacy: bool, profile, pushbacks: int):
+    agent = SalesAgent(legacy, profile)
+    app = setup_graph(agent, checkpointer=MemorySaver(), tools=[legacy_premium_filter if legacy else premium_filter])
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    age, cancer, gender = profile
+    turns = [f"I'm {age} years old, {gender.lower()}, and I'd like cover for {cancer.lower()}."]
+    turns += ["Hmm, that's too expensive for me."] * pushbacks
+    if pushbacks < 3:
+        turns.append("OK, that sounds good.")
+    prompt = legacy_prompt if legacy else sys_prompt
+    await app.ainvoke({"messages": [SystemMessage(prompt), ("user", "Hi")]}, config)
+    for text in turns:
+        await app.ainvoke({"messages": [("user", text)]}, config)
+    history = (await app.aget_state(config)).values["messages"]
+    tool_results = [m for m in history if isinstance(m, ToolMessage)]
+    return {
+        "tool_calls": len(tool_results),
+        "tool_tokens": counter.count(tool_results),
+        "model_calls": agent.model_calls,
+        "input_tokens": agent.input_tokens,
+    }
+
+
+async def main():
+    print(f"{'outcome':<14} {'tool calls':>14} {'tool-result tok':>16} {'model calls':>13} {'input tokens':>19}")
+    totals = {False: {}, True: {}}
+    for outcome, pushbacks in OUTCOMES.items():
+        rows = {}
+        for legacy in (True, False):
+            results = [await replay(legacy, profile, pushbacks) for profile in PROFILES]
+            rows[legacy] = {k: sum(r[k] for r in results) / len(results) for k in results[0]}
+            for k, v in rows[legacy].items():
+                totals[legacy][k] = totals[legacy].get(k, 0) + v / len(OUTCOMES)
+        old, new = rows[True], rows[False]
+        print(f"{outcome:<14} {old['tool_calls']:>6.1f} -> {new['tool_calls']:<4.1f} "
+              f"{old['tool_tokens']:>7.0f} -> {new['tool_tokens']:<5.0f} "
+              f"{old['model_calls']:>5.1f} -> {new['model_calls']:<4.1f} "
+              f"{old['input_tokens']:>8.0f} -> {new['input_tokens']:<7.0f}")
+    old, new = totals[True], totals[False]
+    print(f"{'mean':<14} {old['tool_calls']:>6.1f} -> {new['tool_calls']:<4.1f} "
+          f"{old['tool_tokens']:>7.0f} -> {new['tool_tokens']:<5.0f} "
+          f"{old['model_calls']:>5.1f} -> {new['model_calls']:<4.1f} "
+          f"{old['input_tokens']:>8.0f} -> {new['input_tokens']:<7.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Added per-turn latency of transcript recording.
+
+1. In-process: the event-loop time one emit() costs while the writer is
+   busy compressing and writing batches.
+2. Under load: the load test's scripted conversations against a server with
+   transcripts off, on with the "drop" policy and on with the "block"
+   policy. Reports turn latency and throughput, and decompresses the written
+   files to count the recorded events.
+
+Usage:
+    python benchmarks/bench_transcripts.py [--sessions 100] [--emits 100000]
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import orjson
+import zstandard
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chatbot.transcripts import TranscriptSink
+from loadtest import percentile, run, start_server
+
+TURN = {"thread_id": "6f1c0c8e-2b1e-4f9a-9d51-0d7c4f1e2a3b", "user": "I'm 32, female, lung cancer",
+        "outcome": "ok", "replies": ["Here are your premiums for the 30-35 band. " * 6],
+        "tool_calls": [{"name": "premium_filter", "args": {"age": "32", "cancer": "Lung Cancer", "gender": "Female"},
+                        "result": '{"age_band":"30-35","plans":{"A Premium":{"Early":252000}}}' * 3}],
+        "first_token_ms": 812.4, "total_ms": 1533.0}
+
+
+def count_events(directory):
+    counts = {}
+    for path in glob.glob(os.path.join(directory, "*.jsonl.zst")):
+        with open(path, "rb") as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read()
+        for line in data.splitlines():
+            kind = orjson.loads(line)["type"]
+            counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+async def emit_cost(emits):
+    with tempfile.TemporaryDirectory() as directory:
+        sink = TranscriptSink(directory, queue_size=emits + 1)
+        sink.start()
+        started = time.perf_counter()
+        for i in range(emits):
+            await sink.emit("turn", **TURN)
+            if i % 100 == 0:
+                await asyncio.sleep(0)  # Let the writer run, as it would between turns
+        per_emit = (time.perf_counter() - started) / emits
+        await sink.aclose()
+    print(f"emit(): {per_emit * 1e6:.2f} us per event on the event loop (2 events per turn)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--emits", type=int, default=100000)
+    parser.add_argument("--latency", default="lognormal:0.3,0.4", help="Fake model time to first token")
+    parser.add_argument("--token-delay", default="fixed:0.01", help="Fake model delay between tokens")
+    args = parser.parse_args()
+    args.ramp, args.think, args.timeout, args.protocol = 1.0, 0.0, 60.0, "frames"
+    args.reply_words, args.server_logs = 60, False
+
+    asyncio.run(emit_cost(args.emits))
+
+    print(f"\n{args.sessions} sessions x {args.turns} turns")
+    print(f"{'transcripts':<12} {'msg/s':>7} {'turn p50 ms':>12} {'turn p95 ms':>12} {'events written':>15} "
+          f"{'bytes/event':>12}")
+    for mode in ("off", "drop", "block"):
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ.update(TRANSCRIPTS="0" if mode == "off" else "1", TRANSCRIPT_DIR=directory,
+                              TRANSCRIPT_FULL_POLICY="block" if mode == "block" else "drop")
+            proc, url = start_server(args)
+            try:
+                results, elapsed, _, _ = asyncio.run(run(args, url, None))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)  # Shutdown writes out the queued events
+            events = sum(count_events(directory).values())
+            size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, "*")))
+        turns = results["turn"]
+        print(f"{mode:<12} {len(turns) / elapsed:>7.1f} {percentile(turns, 50) * 1000:>12.0f} "
+              f"{percentile(turns, 95) * 1000:>12.0f} {events:>15} {size / events if events else 0:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
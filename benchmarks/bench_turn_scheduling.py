@@ -0,0 +1,104 @@
+"""Bursts of quick user messages: sequential turns vs coalescing and superseding.
+
+Each session sends its profile as three messages 150 ms apart ("hi", "I'm 32",
+"female, lung cancer") and waits for the answer. Runs the real graph and the
+turn scheduler with the offline fake model and reports model calls, replies
+the user had to read, and the time from the last message to the final reply.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/bench_turn_scheduling.py [--sessions 50] [--latency 0.6]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PREMIUM_RELOAD_INTERVAL", "0")
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot import metrics
+from chatbot.fake_llm import FakeChatModel
+from chatbot.graph import setup_graph
+from chatbot.streaming import stream_turn
+from chatbot.tools import premium_filter
+from chatbot.turns import TurnScheduler
+
+BURST = ["hi", "I'm 32", "female, lung cancer"]
+GAP = 0.15
+
+
+class CountingTransport:
+    framed = True
+
+    def __init__(self):
+        self.send_seconds = 0.0
+        self.replies = 0
+        self.last_reply = None
+
+    async def start(self, message_id):
+        pass
+
+    async def delta(self, text):
+        pass
+
+    async def end(self, discard=False):
+        if not discard:
+            self.replies += 1
+            self.last_reply = time.perf_counter()
+
+
+async def session(app, supersede):
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    await app.aupdate_state(config, {"messages": [SystemMessage("You sell cancer insurance."),
+                                                  AIMessage("Hello! How can I help?")]}, as_node="agent")
+    transport = CountingTransport()
+    scheduler = None
+
+    async def run_turn(message):
+        await stream_turn(app, {"messages": [message]}, config, transport, scheduler and scheduler.reply_started)
+
+    if supersede == "sequential":
+        started = time.perf_counter()
+        for text in BURST:  # The previous handler: one full turn per message, in order
+            await run_turn(("user", text))
+        last_sent = started + GAP * (len(BURST) - 1)
+        return transport.replies, max(0.0, transport.last_reply - last_sent)
+
+    scheduler = TurnScheduler(app, config, run_turn, supersede=supersede)
+    runner = asyncio.create_task(scheduler.run())
+    for text in BURST:
+        scheduler.submit(text)
+        last_sent = time.perf_counter()
+        await asyncio.sleep(GAP)
+    while not scheduler.idle:
+        await asyncio.sleep(0.01)
+    runner.cancel()
+    return transport.replies, transport.last_reply - last_sent
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.6, help="Seconds per fake model call")
+    args = parser.parse_args()
+
+    print(f"{'mode':<14} {'model calls/session':>20} {'replies/session':>16} {'last msg -> final reply ms':>27}")
+    for mode in ("sequential", "never", "before_reply"):
+        model = FakeChatModel(latency=f"fixed:{args.latency}", token_delay="fixed:0.01", reply_words=30)
+        app = setup_graph(model.bind_tools([premium_filter]), checkpointer=MemorySaver())
+        calls_before = sum(metrics.LLM_SECONDS.labels().counts)
+        results = await asyncio.gather(*(session(app, mode) for _ in range(args.sessions)))
+        calls = sum(metrics.LLM_SECONDS.labels().counts) - calls_before
+        replies = sum(r[0] for r in results) / len(results)
+        wait = sorted(r[1] for r in results)[len(results) // 2]
+        print(f"{mode:<14} {calls / args.sessions:>20.2f} {replies:>16.2f} {wait * 1000:>27.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""Throughput as the server scales from 1 to N worker processes on one host.
+
+Starts `python main.py` with WORKERS=n for each n (sessions, rate limits and
+the resume outbox in shared SQLite files under a temporary directory, the
+offline fake model), drives it with the load test's scripted conversations
+and reports messages/sec, turn latency and the RSS of all server processes.
+Use a short model latency so the workers, not the fake model, are the limit.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--sessions 200] [--latency fixed:0.05]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import ROOT, free_port, percentile, rss_kib, run
+
+
+def process_tree(pid):
+    pids = [pid]
+    for child in open(f"/proc/{pid}/task/{pid}/children").read().split():
+        pids.extend(process_tree(int(child)))
+    return pids
+
+
+def start_server(args, workers, state_dir):
+    port = free_port()
+    env = dict(os.environ, WORKERS=str(workers), PORT=str(port), HOST="127.0.0.1",
+               OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-benchmark"), LLM_BACKEND="fake",
+               PREMIUM_RELOAD_INTERVAL="0", FAKE_LLM_LATENCY=args.latency, FAKE_LLM_TOKEN_DELAY=args.token_delay,
+               RATE_LIMIT_CONNECTIONS_PER_IP="1000000/second", RATE_LIMIT_MESSAGES_PER_IP="1000000/second",
+               RATE_LIMIT_MESSAGES_PER_SESSION="1000000/second",
+               CHECKPOINT_SQLITE_PATH=os.path.join(state_dir, "checkpoints.sqlite"),
+               RATE_LIMIT_SQLITE_PATH=os.path.join(state_dir, "ratelimit.sqlite"),
+               SESSION_SQLITE_PATH=os.path.join(state_dir, "sessions.sqlite"),
+               RESUME_OUTBOX_SQLITE_PATH=os.path.join(state_dir, "outbox.sqlite"))
+    if workers == 1 and args.shared_single:
+        env.update({name: "sqlite" for name in ("CHECKPOINT_BACKEND", "RATE_LIMIT_BACKEND", "SESSION_BACKEND",
+                                                "RESUME_OUTBOX_BACKEND")})
+    proc = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Server exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+            if len(process_tree(proc.pid)) > workers or workers == 1:
+                time.sleep(2 if workers > 1 else 0)  # Let every worker finish starting up
+                return proc, f"ws://127.0.0.1:{port}/chat"
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("Server did not start within 120 s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=f"1,2,{max(os.cpu_count() or 1, 4)}", help="Worker counts to try")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--ramp", type=float, default=1.0)
+    parser.add_argument("--latency", default="fixed:0.05", help="Fake model time to first token")
+    parser.add_argument("--token-delay", default="fixed:0.002", help="Fake model delay between tokens")
+    parser.add_argument("--shared-single", action="store_true",
+                        help="Use the SQLite stores for 1 worker too (isolates their cost from scaling)")
+    args = parser.parse_args()
+    args.protocol, args.think, args.timeout = "frames", 0.0, 120.0
+
+    print(f"{os.cpu_count()} CPUs, {args.sessions} sessions x {args.turns} turns, model latency {args.latency}")
+    print(f"{'workers':>7} {'msg/s':>8} {'turn p50 ms':>12} {'turn p95 ms':>12} {'errors':>7} {'RSS MiB':>8}")
+    for workers in [int(n) for n in args.workers.split(",")]:
+        with tempfile.TemporaryDirectory() as state_dir:
+            proc, url = start_server(args, workers, state_dir)
+            try:
+                results, elapsed, _, _ = asyncio.run(run(args, url, None))
+                rss = sum(rss_kib(pid) or 0 for pid in process_tree(proc.pid)) / 1024
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+        turns = results["turn"]
+        print(f"{workers:>7} {len(turns) / elapsed:>8.1f} {percentile(turns, 50) * 1000:>12.0f} "
+              f"{percentile(turns, 95) * 1000:>12.0f} {len(results['errors']):>7} {rss:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Concurrent WebSocket load test for /chat.
+
+Opens --sessions concurrent sessions, replays scripted conversations and
+reports connect latency, time to first message, time to first token, turn
+latency percentiles, messages/sec and server RSS.
+
+By default it starts its own server (uvicorn main:app) with the offline fake
+model (LLM_BACKEND=fake) and relaxed rate limits, so nothing reaches OpenAI:
+
+    python benchmarks/loadtest.py --sessions 200 --turns 4
+    python benchmarks/loadtest.py --sessions 500 --latency lognormal:0.5,0.5 --token-delay fixed:0.02
+
+Point it at an already running server with --url (RSS is then reported only
+if --pid is given):
+
+    python benchmarks/loadtest.py --url ws://localhost:8000/chat --pid 12345
+
+Add --json to print the results as one JSON object for regression tracking.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONVERSATIONS = [
+    ["Hi, what does this insurance cover?",
+     "I'm 42, female, and worried about lung cancer. How much would it cost?",
+     "What's the difference between the options?",
+     "Thanks, that's helpful."],
+    ["Hello",
+     "I am a 35 year old male, please quote for skin cancer",
+     "And for bladder cancer?",
+     "How do I apply?"],
+    ["Can you explain the stages?",
+     "Quote for thyroid cancer, woman, 28",
+     "Is there a waiting period?",
+     "Bye for now"],
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+
+def rss_kib(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+async def sample_rss(pid, samples, interval=0.5):
+    while True:
+        value = rss_kib(pid)
+        if value is not None:
+            samples.append(value)
+        await asyncio.sleep(interval)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    env = dict(os.environ, LLM_BACKEND="fake", PREMIUM_RELOAD_INTERVAL="0",
+               FAKE_LLM_LATENCY=args.latency, FAKE_LLM_TOKEN_DELAY=args.token_delay,
+               FAKE_LLM_REPLY_WORDS=str(args.reply_words),
+               RATE_LIMIT_CONNECTIONS_PER_IP="1000000/second", RATE_LIMIT_MESSAGES_PER_IP="1000000/second",
+               RATE_LIMIT_MESSAGES_PER_SESSION="1000000/second")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                             "--log-level", "warning", "--no-access-log"],
+                            cwd=ROOT, env=env, stderr=None if args.server_logs else subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Server exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc, f"ws://127.0.0.1:{port}/chat"
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("Server did not start within 60 s")
+
+
+async def read_message(ws, framed):
+    """Receive one assistant message. Returns (seconds to first delta or None, error text or None)."""
+    start = time.perf_counter()
+    if not framed:
+        await ws.recv()
+        return None, None
+    first = None
+    while True:
+        frame = json.loads(await ws.recv())
+        if frame["type"] == "delta" and first is None:
+            first = time.perf_counter() - start
+        elif frame["type"] == "end" and not frame.get("discarded"):
+            return first, None
+        elif frame["type"] == "error":
+            return first, frame.get("message")
+        elif frame["type"] == "busy":
+            return first, "busy (admission control)"
+        elif frame["type"] == "timeout":
+            return first, "timeout (turn deadline)"
+
+
+async def run_session(index, url, args, results):
+    await asyncio.sleep(args.ramp * index / max(args.sessions, 1))
+    conversation = CONVERSATIONS[index % len(CONVERSATIONS)][:args.turns]
+    framed = args.protocol == "frames"
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(f"{url}?protocol={args.protocol}", max_size=None,
+                                      open_timeout=args.timeout) as ws:
+            results["connect"].append(time.perf_counter() - started)
+            await asyncio.wait_for(read_message(ws, framed), args.timeout)
+            results["first_message"].append(time.perf_counter() - started)
+            for text in conversation:
+                if args.think:
+                    await asyncio.sleep(args.think)
+                turn_start = time.perf_counter()
+                await ws.send(text)
+                first_token, error = await asyncio.wait_for(read_message(ws, framed), args.timeout)
+                if error:
+                    results["errors"].append(error)
+                    continue
+                results["turn"].append(time.perf_counter() - turn_start)
+                if first_token is not None:
+                    results["first_token"].append(first_token)
+    except Exception as e:
+        results["errors"].append(f"{type(e).__name__}: {e}")
+
+
+async def run(args, url, pid):
+    results = {"connect": [], "first_message": [], "first_token": [], "turn": [], "errors": []}
+    rss = []
+    baseline = rss_kib(pid) if pid else None
+    sampler = asyncio.create_task(sample_rss(pid, rss)) if pid else None
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(i, url, args, results) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    if sampler:
+        sampler.cancel()
+    return results, elapsed, baseline, rss
+
+
+def summarize(args, results, elapsed, baseline, rss):
+    def ms(values):
+        return {f"p{p}": round(percentile(values, p) * 1000, 1) if values else None for p in (50, 95, 99)}
+
+    return {
+        "sessions": args.sessions,
+        "turns_completed": len(results["turn"]),
+        "errors": len(results["errors"]),
+        "elapsed_s": round(elapsed, 2),
+        "messages_per_s": round(len(results["turn"]) / elapsed, 1),
+        "connect_ms": ms(results["connect"]),
+        "first_message_ms": ms(results["first_message"]),
+        "first_token_ms": ms(results["first_token"]),
+        "turn_ms": ms(results["turn"]),
+        "rss_mib": {"baseline": round(baseline / 1024, 1) if baseline else None,
+                    "peak": round(max(rss) / 1024, 1) if rss else None,
+                    "end": round(rss[-1] / 1024, 1) if rss else None},
+        "sample_errors": sorted(set(results["errors"]))[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="WebSocket URL of a running server (default: start one with the fake model)")
+    parser.add_argument("--pid", type=int, help="PID of the server behind --url, for RSS sampling")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=4, help="User messages per session (max 4)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which sessions are opened")
+    parser.add_argument("--think", type=float, default=0.0, help="Seconds between a reply and the next message")
+    parser.add_argument("--protocol", choices=["frames", "text"], default="frames")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latency", default="lognormal:0.3,0.4", help="Fake model time to first token")
+    parser.add_argument("--token-delay", default="fixed:0.01", help="Fake model delay between tokens")
+    parser.add_argument("--reply-words", type=int, default=60)
+    parser.add_argument("--server-logs", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    proc = None
+    url, pid = args.url, args.pid
+    if url is None:
+        proc, url = start_server(args)
+        pid = proc.pid
+    try:
+        summary = summarize(args, *asyncio.run(run(args, url, pid)))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(summary))
+        return
+    print(f"sessions={summary['sessions']} turns={summary['turns_completed']} errors={summary['errors']} "
+          f"elapsed={summary['elapsed_s']}s throughput={summary['messages_per_s']} msg/s")
+    for key in ("connect_ms", "first_message_ms", "first_token_ms", "turn_ms"):
+        values = summary[key]
+        print(f"{key:<17} p50={values['p50']} p95={values['p95']} p99={values['p99']}")
+    rss = summary["rss_mib"]
+    print(f"server RSS MiB     baseline={rss['baseline']} peak={rss['peak']} end={rss['end']}")
+    for error in summary["sample_errors"]:
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    main()
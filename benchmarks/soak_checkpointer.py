@@ -0,0 +1,90 @@
+"""Soak test for the conversation checkpointer: thousands of sessions through the real graph.
+
+A scripted model stands in for the LLM (every third turn it calls premium_filter).
+Compares LangGraph's unbounded MemorySaver with the bounded memory and SQLite
+backends and reports retained memory and checkpoint store stats.
+
+Usage:
+    OPENAI_API_KEY=dummy python benchmarks/soak_checkpointer.py [--sessions 3000] [--turns 6]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from chatbot.checkpoint import BoundedMemorySaver, SqliteCheckpointSaver
+from chatbot.graph import setup_graph
+from chatbot.prompt import sys_prompt
+
+
+class ScriptedModel:
+    async def ainvoke(self, messages):
+        turns = sum(1 for m in messages if m.type == "human")
+        if messages[-1].type == "human" and turns % 3 == 0:
+            return AIMessage("", tool_calls=[{"name": "premium_filter", "id": str(uuid.uuid4()),
+                                              "args": {"age": "32", "cancer": "Lung Cancer", "gender": "Female"}}])
+        return AIMessage(f"Reply {turns}: " + "Let me tell you more about our coverage. " * 8)
+
+
+async def session(app, turns, check):
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    await app.ainvoke({"messages": [SystemMessage(sys_prompt), ("user", "Hi")]}, config)
+    for turn in range(turns):
+        await app.ainvoke({"messages": [("user", f"Message {turn}")]}, config)
+    if check:
+        # Pruning must never lose conversation history for a live thread
+        state = await app.aget_state(config)
+        assert sum(1 for m in state.values["messages"] if m.type == "human") == turns + 1
+
+
+async def run(label, checkpointer, sessions, turns, concurrency):
+    app = setup_graph(ScriptedModel(), checkpointer=checkpointer)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await session(app, turns, check=i % 100 == 0)
+
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if hasattr(checkpointer, "asweep"):
+        await checkpointer.asweep()  # Also recounts the SQLite store, whose stats are as of the last sweep
+    stats = checkpointer.stats() if hasattr(checkpointer, "stats") else {}
+    print(f"{label:<22} {elapsed:6.1f}s  retained {current / 2**20:7.1f} MiB  peak {peak / 2**20:7.1f} MiB  {stats}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=3000)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--budget-mib", type=int, default=32)
+    args = parser.parse_args()
+
+    await run("MemorySaver", MemorySaver(), args.sessions, args.turns, args.concurrency)
+    await run(f"Bounded ({args.budget_mib} MiB)", BoundedMemorySaver(max_bytes=args.budget_mib * 2**20),
+              args.sessions, args.turns, args.concurrency)
+    with tempfile.TemporaryDirectory() as tmp:
+        await run("SQLite", SqliteCheckpointSaver(os.path.join(tmp, "checkpoints.sqlite")),
+                  args.sessions, args.turns, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
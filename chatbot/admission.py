@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from chatbot import metrics
+
+# Concurrent model calls per process (the agent node)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+# Calls allowed to wait for a slot; beyond this new calls are rejected at once
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+# Longest a call may wait for a slot before it is rejected
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# What a rejected client gets: "busy" (busy message, socket stays open) or "close" (close with 1013)
+ADMISSION_REJECT = os.getenv("ADMISSION_REJECT", "busy")
+
+QUEUE_WAIT_SECONDS = metrics.Histogram("chatbot_admission_wait_seconds", "Time a model call waited for a slot")
+QUEUE_DEPTH = metrics.Gauge("chatbot_admission_queue_depth", "Model calls waiting for a slot")
+ACTIVE_CALLS = metrics.Gauge("chatbot_admission_active", "Model calls holding a slot")
+REJECTED = metrics.Counter("chatbot_admission_rejected_total", "Model calls rejected by admission control", ["reason"])
+
+
+class AdmissionRejected(Exception):
+    """A model call was shed because the queue was full or its wait exceeded the deadline."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Admission rejected ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Caps concurrent model calls, queueing the excess fairly across sessions.
+
+    Waiters are queued per session key and slots are handed out round-robin
+    across keys, so one busy session can't starve the others. A call waits at
+    most `queue_timeout` seconds, and at most `max_queue` calls wait at once.
+    """
+
+    def __init__(self, limit: int = LLM_CONCURRENCY, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._queues = OrderedDict()  # key -> deque of futures, in round-robin order
+
+    def _retry_after(self) -> float:
+        return round(min(self.queue_timeout, 1.0 + self.waiting / max(self.limit, 1)), 1)
+
+    def _reject(self, reason: str):
+        REJECTED.labels(reason).inc()
+        return AdmissionRejected(reason, self._retry_after())
+
+    def _dequeue(self, key, future) -> None:
+        queue = self._queues.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[key]
+
+    async def acquire(self, key: str) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            QUEUE_WAIT_SECONDS.observe(0.0)
+            return
+        if self.waiting >= self.max_queue:
+            raise self._reject("queue_full")
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(future)
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._dequeue(key, future)
+            raise self._reject("deadline") from None
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()  # Granted just as the caller went away; pass the slot on
+            else:
+                self._dequeue(key, future)
+            raise
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    def release(self) -> None:
+        # Hand the slot straight to the next waiter, taking sessions in turn
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_admission = None
+
+
+def get_admission() -> AdmissionController:
+    """The process-wide admission controller for model calls."""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+        QUEUE_DEPTH.set_function(lambda: _admission.waiting)
+        ACTIVE_CALLS.set_function(lambda: _admission.active)
+    return _admission
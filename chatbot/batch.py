@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+# Profiles quoted per vectorized pass; results are streamed back chunk by chunk
+PREMIUM_BATCH_CHUNK = int(os.getenv("PREMIUM_BATCH_CHUNK", "10000"))
+# Largest request accepted by POST /premiums/batch
+PREMIUM_BATCH_MAX_PROFILES = int(os.getenv("PREMIUM_BATCH_MAX_PROFILES", "1000000"))
+
+
+_FIELDS = {"age", "cancer", "gender"}
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+# Stands in for an NDJSON line that isn't valid JSON; quoted as an error result
+MALFORMED = object()
+
+
+def _parse_line(line: bytes):
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError:
+        return MALFORMED
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for bodies generated while the request body is still being read.
+
+    The stock class listens for http.disconnect on receive() while streaming,
+    which would swallow request body messages; here the body reader sees the
+    disconnect instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def chunked(profiles: list, size: int = PREMIUM_BATCH_CHUNK):
+    for start in range(0, len(profiles), size):
+        yield profiles[start:start + size]
+
+
+async def ndjson_chunks(stream, size: int = PREMIUM_BATCH_CHUNK):
+    """Parse an NDJSON byte stream into lists of profiles as it arrives.
+
+    A line that isn't valid JSON becomes MALFORMED, so it gets its own error result and the rest of the
+    stream is still quoted.
+    """
+    buffer, chunk, total = b"", [], 0
+    async for data in stream:
+        buffer += data
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                chunk.append(_parse_line(line))
+        if len(chunk) >= size:
+            total += len(chunk)
+            if total > PREMIUM_BATCH_MAX_PROFILES:
+                raise BatchTooLarge(f"More than {PREMIUM_BATCH_MAX_PROFILES} profiles")
+            yield chunk
+            chunk = []
+    if buffer.strip():
+        chunk.append(_parse_line(buffer))
+    if chunk:
+        if total + len(chunk) > PREMIUM_BATCH_MAX_PROFILES:
+            raise BatchTooLarge(f"More than {PREMIUM_BATCH_MAX_PROFILES} profiles")
+        yield chunk
+
+
+def quote_chunk(quoter, profiles: list, start: int) -> bytes:
+    """NDJSON results for one chunk of profiles (dicts with age, cancer, gender and an optional id)."""
+    complete = [isinstance(p, dict) and _FIELDS <= p.keys() for p in profiles]
+    ids = quoter.resolve([p["age"] if ok else "" for p, ok in zip(profiles, complete)],
+                         [p["cancer"] if ok else "" for p, ok in zip(profiles, complete)],
+                         [p["gender"] if ok else "" for p, ok in zip(profiles, complete)])
+    if not all(complete):
+        ids[~quoter.np.array(complete, dtype=bool)] = quoter.INVALID_PROFILE
+        ids[quoter.np.array([p is MALFORMED for p in profiles], dtype=bool)] = quoter.INVALID_JSON
+    return quoter.render(ids, start, [p.get("id") if isinstance(p, dict) else None for p in profiles])
+
+
+async def stream_quotes(quoter, chunks):
+    """Yield NDJSON result bytes for an (async) iterable of profile chunks, quoting off the event loop."""
+    start = 0
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield await asyncio.to_thread(quote_chunk, quoter, chunk, start)
+            start += len(chunk)
+    else:
+        for chunk in chunks:
+            yield await asyncio.to_thread(quote_chunk, quoter, chunk, start)
+            start += len(chunk)
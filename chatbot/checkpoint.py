@@ -0,0 +1,453 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.types import TASKS
+
+# Checkpointer settings
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "memory")  # "memory" or "sqlite"
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", "checkpoints.sqlite")
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", str(6 * 3600)))  # Seconds a thread may sit idle
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024)))  # Memory backend only
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", "4"))  # Checkpoints kept per thread
+CHECKPOINT_SWEEP_INTERVAL = float(os.getenv("CHECKPOINT_SWEEP_INTERVAL", "60"))
+# Seconds a SQLite write waits for another worker's lock before failing (it waits in a worker thread)
+CHECKPOINT_SQLITE_BUSY_TIMEOUT = float(os.getenv("CHECKPOINT_SQLITE_BUSY_TIMEOUT", "5"))
+
+
+def _typed_size(value) -> int:
+    # Serialized values are (type, bytes) pairs
+    return len(value[1]) if value else 0
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer with per-thread TTL, a global byte budget and checkpoint pruning.
+
+    Only the newest `keep` checkpoints of each thread are retained; older ones
+    (and the channel blobs and writes only they reference) are dropped. Threads
+    idle for longer than `ttl` are swept, and when the serialized size of all
+    threads exceeds `max_bytes` the least recently used threads are evicted.
+    """
+
+    def __init__(self, *, ttl: float = CHECKPOINT_TTL, max_bytes: int = CHECKPOINT_MAX_BYTES,
+                 keep: int = CHECKPOINT_KEEP, sweep_interval: float = CHECKPOINT_SWEEP_INTERVAL, serde=None):
+        super().__init__(serde=serde)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.keep = max(keep, 2)  # The latest checkpoint and its parent are always kept
+        self.sweep_interval = sweep_interval
+        self._lock = threading.RLock()
+        self._last_access = OrderedDict()  # thread_id -> monotonic time, least recently used first
+        self._thread_bytes = {}
+        self._blob_keys = {}  # thread_id -> set of blob keys
+        self._write_keys = {}  # thread_id -> set of writes keys
+        self._total_bytes = 0
+        self._next_sweep = time.monotonic() + sweep_interval
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+        self.pruned_checkpoints = 0
+
+    # --- accounting -------------------------------------------------------
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _measure(self, thread_id: str) -> int:
+        size = sum(_typed_size(self.blobs.get(key)) for key in self._blob_keys.get(thread_id, ()))
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += _typed_size(checkpoint) + _typed_size(metadata)
+        for key in self._write_keys.get(thread_id, ()):
+            size += sum(_typed_size(w[2]) for w in self.writes.get(key, {}).values())
+        return size
+
+    def _account(self, thread_id: str) -> None:
+        size = self._measure(thread_id)
+        self._total_bytes += size - self._thread_bytes.get(thread_id, 0)
+        self._thread_bytes[thread_id] = size
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep:
+            return
+        ordered = sorted(checkpoints)
+        stale, retained = ordered[:-self.keep], ordered[-self.keep:]
+        for checkpoint_id in stale:
+            del checkpoints[checkpoint_id]
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(key, None)
+            self._write_keys.get(thread_id, set()).discard(key)
+        # Drop channel blobs that no retained checkpoint points at
+        referenced = set()
+        for checkpoint_id in retained:
+            versions = self.serde.loads_typed(checkpoints[checkpoint_id][0])["channel_versions"]
+            referenced.update((thread_id, checkpoint_ns, channel, version) for channel, version in versions.items())
+        blob_keys = self._blob_keys.get(thread_id, set())
+        for key in [k for k in blob_keys if k[1] == checkpoint_ns and k not in referenced]:
+            self.blobs.pop(key, None)
+            blob_keys.discard(key)
+        self.pruned_checkpoints += len(stale)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Drop every checkpoint, write and blob of a thread."""
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            for key in self._write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            self._total_bytes -= self._thread_bytes.pop(thread_id, 0)
+            self._last_access.pop(thread_id, None)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    async def asweep(self) -> None:
+        self.sweep()
+
+    def sweep(self, exclude: str = None) -> None:
+        """Evict threads past their TTL, then least recently used threads until within budget."""
+        with self._lock:
+            now = time.monotonic()
+            self._next_sweep = now + self.sweep_interval
+            while self._last_access:
+                thread_id, last = next(iter(self._last_access.items()))
+                if now - last < self.ttl or thread_id == exclude:
+                    break
+                self.delete_thread(thread_id)
+                self.evicted_ttl += 1
+            for thread_id in list(self._last_access):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                if thread_id != exclude:
+                    self.delete_thread(thread_id)
+                    self.evicted_lru += 1
+
+    def stats(self) -> dict:
+        return {
+            "threads": len(self._thread_bytes),
+            "bytes": self._total_bytes,
+            "evicted_ttl": self.evicted_ttl,
+            "evicted_lru": self.evicted_lru,
+            "pruned_checkpoints": self.pruned_checkpoints,
+        }
+
+    # --- BaseCheckpointSaver ----------------------------------------------
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id not in self.storage:
+                return None  # Don't let the defaultdict create empty entries
+            self._touch(thread_id)
+            result = super().get_tuple(config)
+            if result:
+                # Reads create (empty) writes entries for the checkpoint and its parent; track them too
+                write_keys = self._write_keys.setdefault(thread_id, set())
+                for c in (result.config, result.parent_config):
+                    if c:
+                        write_keys.add((thread_id, c["configurable"]["checkpoint_ns"], c["configurable"]["checkpoint_id"]))
+            return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._lock:
+            if config and config["configurable"]["thread_id"] not in self.storage:
+                return iter(())
+            return iter(list(super().list(config, filter=filter, before=before, limit=limit)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            self._blob_keys.setdefault(thread_id, set()).update(
+                (thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items())
+            self._prune(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            self._account(thread_id)
+            if self._total_bytes > self.max_bytes or time.monotonic() >= self._next_sweep:
+                self.sweep(exclude=thread_id)
+        return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys.setdefault(thread_id, set()).add(
+                (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"]))
+            self._touch(thread_id)
+            self._account(thread_id)
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """Checkpointer persisted to a local SQLite file (WAL mode), so sessions survive worker restarts.
+
+    Each checkpoint row stores the full serialized checkpoint. Only the newest
+    `keep` checkpoints per thread are kept and threads idle past `ttl` are swept.
+    sqlite3 blocks (and waits up to `busy_timeout` for other workers' locks), so
+    the async methods run it in a worker thread, never on the event loop.
+    """
+
+    get_next_version = InMemorySaver.get_next_version
+
+    def __init__(self, path: str = CHECKPOINT_SQLITE_PATH, *, ttl: float = CHECKPOINT_TTL,
+                 keep: int = CHECKPOINT_KEEP, sweep_interval: float = CHECKPOINT_SWEEP_INTERVAL,
+                 busy_timeout: float = CHECKPOINT_SQLITE_BUSY_TIMEOUT, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.ttl = ttl
+        self.keep = max(keep, 2)
+        self.sweep_interval = sweep_interval
+        self.evicted_ttl = 0
+        self.pruned_checkpoints = 0
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                type TEXT NOT NULL,
+                checkpoint BLOB NOT NULL,
+                metadata_type TEXT NOT NULL,
+                metadata BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints (updated_at);
+        """)
+        self._stats = None
+        self._refresh_stats()
+
+    def _tuple_from_row(self, thread_id, checkpoint_ns, row):
+        checkpoint_id, parent_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? "
+            "ORDER BY task_id, idx", (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        sends = []
+        if parent_id:
+            sends = self._conn.execute(
+                "SELECT type, value FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? AND channel=? "
+                "ORDER BY task_path, task_id, idx", (thread_id, checkpoint_ns, parent_id, TASKS)).fetchall()
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "pending_sends": [self.serde.loads_typed(s) for s in sends]},
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                             "checkpoint_id": parent_id}} if parent_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                    (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+            return self._tuple_from_row(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata " \
+                "FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns=?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id<?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            results = []
+            for thread_id, checkpoint_ns, *row in self._conn.execute(query, params).fetchall():
+                if limit is not None and len(results) >= limit:
+                    break
+                result = self._tuple_from_row(thread_id, checkpoint_ns, row)
+                if filter and not all(result.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(result)
+        return iter(results)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        c = checkpoint.copy()
+        c.pop("pending_sends", None)
+        type_, checkpoint_b = self.serde.dumps_typed(c)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     type_, checkpoint_b, metadata_type, metadata_b, time.time()))
+                self._prune(thread_id, checkpoint_ns)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if time.monotonic() >= self._next_sweep:
+                self.sweep(exclude=thread_id)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, value_b = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, value_b, task_path))
+        # Special channels (negative idx) overwrite; regular writes are kept if already present
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row in rows:
+                    verb = "INSERT OR REPLACE" if row[4] < 0 else "INSERT OR IGNORE"
+                    self._conn.execute(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        stale = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?", (thread_id, checkpoint_ns, self.keep)).fetchall()
+        for (checkpoint_id,) in stale:
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                                   (thread_id, checkpoint_ns, checkpoint_id))
+        self.pruned_checkpoints += len(stale)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (thread_id,))
+
+    def sweep(self, exclude: str = None) -> None:
+        """Delete threads whose newest checkpoint is older than the TTL, then recount the store."""
+        with self._lock:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            expired = self._conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(updated_at) < ?",
+                (time.time() - self.ttl,)).fetchall()
+            for (thread_id,) in expired:
+                if thread_id != exclude:
+                    self.delete_thread(thread_id)
+                    self.evicted_ttl += 1
+            self._refresh_stats()
+
+    def _refresh_stats(self) -> None:
+        # A full scan of both tables: done when sweeping, not on every /metrics scrape
+        with self._lock:
+            threads, size = self._conn.execute(
+                "SELECT COUNT(DISTINCT thread_id), COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) "
+                "FROM checkpoints").fetchone()
+            size += self._conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0]
+            self._stats = {"threads": threads, "bytes": size}
+
+    def stats(self) -> dict:
+        """Store size as of the last sweep, and eviction counters."""
+        return {
+            **self._stats,
+            "evicted_ttl": self.evicted_ttl,
+            "evicted_lru": 0,
+            "pruned_checkpoints": self.pruned_checkpoints,
+        }
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def asweep(self) -> None:
+        await asyncio.to_thread(self.sweep)
+
+
+_checkpointer = None
+
+
+def get_checkpointer():
+    """The process-wide checkpointer selected by CHECKPOINT_BACKEND."""
+    global _checkpointer
+    if _checkpointer is None:
+        if CHECKPOINT_BACKEND == "sqlite":
+            _checkpointer = SqliteCheckpointSaver(CHECKPOINT_SQLITE_PATH)
+        elif CHECKPOINT_BACKEND == "memory":
+            _checkpointer = BoundedMemorySaver()
+        else:
+            raise ValueError(f"Unknown CHECKPOINT_BACKEND {CHECKPOINT_BACKEND!r} (expected 'memory' or 'sqlite')")
+    return _checkpointer
+
+
+async def run_sweeper(checkpointer, interval: float = CHECKPOINT_SWEEP_INTERVAL) -> None:
+    """Periodically sweep expired threads and log checkpoint memory usage."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await checkpointer.asweep()
+            logging.info(f"Checkpoint store: {checkpointer.stats()}")
+        except Exception as e:
+            logging.error(f"Checkpoint sweep failed: {e}")
@@ -0,0 +1,149 @@
+import logging
+import os
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from chatbot.prompt import summary_prompt
+
+# Input-token budget for a model call; older turns are summarized beyond it (0 disables trimming)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+# Most recent user turns always sent verbatim
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "4"))
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "o200k_base")  # gpt-4o tokenizer
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators per chat message
+_MAX_CACHED_COUNTS = 50_000
+_MAX_CACHED_SUMMARIES = 10_000
+
+
+def _load_encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; without them fall back to an estimate
+        logging.warning(f"tiktoken encoding {name!r} unavailable, estimating tokens from characters: {e}")
+        return None
+
+
+class TokenCounter:
+    """Counts chat tokens with tiktoken, caching per message id so long histories aren't re-encoded."""
+
+    def __init__(self, encoding_name: str = CONTEXT_ENCODING):
+        self.encoding = _load_encoding(encoding_name)
+        self._cache = OrderedDict()
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message) -> int:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        tool_calls = getattr(message, "tool_calls", None) or ()
+        key = (message.id, len(content), len(tool_calls)) if message.id else None
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(content)
+        for call in tool_calls:
+            tokens += self.count_text(call["name"]) + self.count_text(str(call["args"]))
+        if key is not None:
+            self._cache[key] = tokens
+            if len(self._cache) > _MAX_CACHED_COUNTS:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count(self, messages) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+
+def _render(message) -> str:
+    if isinstance(message, HumanMessage):
+        return f"Customer: {message.content}"
+    if isinstance(message, AIMessage):
+        if message.tool_calls:
+            return "Agent looked up: " + ", ".join(f"{c['name']}({c['args']})" for c in message.tool_calls)
+        return f"Agent: {message.content}"
+    if isinstance(message, ToolMessage):
+        return f"Tool {message.name}: {message.content}"
+    return f"{message.type}: {message.content}"
+
+
+class ContextManager:
+    """Keeps model input within a token budget.
+
+    The system prompt and the last `keep_turns` user turns are sent verbatim.
+    Once the history exceeds `budget`, older turns are folded into a rolling
+    summary (cached per thread and extended incrementally). premium_filter
+    results from the folded turns are carried over word for word.
+    """
+
+    def __init__(self, summarizer, budget: int = CONTEXT_TOKEN_BUDGET, keep_turns: int = CONTEXT_KEEP_TURNS,
+                 counter: TokenCounter = None):
+        self.summarizer = summarizer
+        self.budget = budget
+        self.keep_turns = max(keep_turns, 1)
+        self.counter = counter or TokenCounter()
+        # thread_id -> (number of summarized messages, id of the last one, summary text, preserved quotes)
+        self._summaries = OrderedDict()
+
+    async def _summarize(self, thread_id: str, history: list, boundary: int):
+        cached = self._summaries.get(thread_id)
+        start, summary, quotes = 0, "", []
+        if cached and cached[0] <= boundary and history[cached[0] - 1].id == cached[1]:
+            start, _, summary, quotes = cached
+            quotes = list(quotes)
+        if start < boundary:
+            folded = history[start:boundary]
+            quotes += [m for m in folded if isinstance(m, ToolMessage) and m.name == "premium_filter"]
+            transcript = "\n".join(_render(m) for m in folded)
+            request = f"Summary so far:\n{summary or '(none)'}\n\nNew conversation:\n{transcript}"
+            # Tagged nostream so the summary never leaks into the token stream sent to the client
+            response = await self.summarizer.ainvoke([SystemMessage(summary_prompt), HumanMessage(request)],
+                                                     config={"tags": ["nostream"]})
+            summary = response.content
+            self._summaries[thread_id] = (boundary, history[boundary - 1].id, summary, tuple(quotes))
+            if len(self._summaries) > _MAX_CACHED_SUMMARIES:
+                self._summaries.popitem(last=False)
+        self._summaries.move_to_end(thread_id)
+        return summary, quotes
+
+    def forget(self, thread_id: str) -> None:
+        self._summaries.pop(thread_id, None)
+
+    async def prepare(self, thread_id: str, messages: list):
+        """Return (messages to send, token stats) for one model call."""
+        history_tokens = self.counter.count(messages)
+        stats = {"history_tokens": history_tokens, "sent_tokens": history_tokens, "summarized_messages": 0}
+        if not self.budget or history_tokens <= self.budget:
+            return messages, stats
+
+        # Leading system messages are always kept; the rest is split into turns at each user message
+        head = 0
+        while head < len(messages) and isinstance(messages[head], SystemMessage):
+            head += 1
+        system, history = messages[:head], messages[head:]
+        turn_starts = [i for i, m in enumerate(history) if isinstance(m, HumanMessage)]
+        if len(turn_starts) <= self.keep_turns:
+            return messages, stats
+        boundary = turn_starts[-self.keep_turns]
+
+        try:
+            summary, quotes = await self._summarize(thread_id, history, boundary)
+        except Exception as e:
+            logging.warning(f"Summarizing history failed, dropping older turns instead: {e}")
+            summary = ""
+            quotes = [m for m in history[:boundary] if isinstance(m, ToolMessage) and m.name == "premium_filter"]
+
+        note = f"Summary of the earlier conversation:\n{summary}" if summary else "Earlier conversation omitted."
+        if quotes:
+            note += "\n\nPremium quotes already fetched earlier (exact tool results):\n" + \
+                    "\n\n".join(q.content for q in quotes)
+        compacted = system + [SystemMessage(note)] + history[boundary:]
+        stats["sent_tokens"] = self.counter.count(compacted)
+        stats["summarized_messages"] = boundary
+        return compacted, stats
@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import httpx
+
+from chatbot import metrics
+
+# Seconds a whole turn (model calls and tools) may take before it is cut off and the user asked to retry (0 disables)
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", "45"))
+# Retries of a model call that failed before its first token, with full-jitter exponential backoff between them
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.25"))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv("LLM_RETRY_BACKOFF_MAX", "4"))
+# Retries of a failed call to a tool marked idempotent; other tools are never re-run
+TOOL_RETRIES = int(os.getenv("TOOL_RETRIES", "1"))
+# Hedging: a model call with no token after this percentile of recent times to first token gets a second
+# attempt, and whichever answers first wins (0 disables)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.25"))
+# Recent times to first token the percentile is taken over; hedging starts once this many are known
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "500"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+DEADLINE_MISSES = metrics.Counter("chatbot_turn_deadline_misses_total", "Turns cut off at TURN_DEADLINE")
+LLM_RETRIED = metrics.Counter("chatbot_llm_retries_total", "Model calls retried after failing before their first token",
+                              ["error"])
+HEDGES = metrics.Counter("chatbot_llm_hedges_total", "Hedged model calls by the attempt that answered first",
+                         ["winner"])
+HEDGE_DELAY = metrics.Gauge("chatbot_llm_hedge_delay_seconds", "Wait before a model call is hedged")
+TOOL_RETRIED = metrics.Counter("chatbot_tool_retries_total", "Idempotent tool calls retried after an error", ["tool"])
+
+_deadline = contextvars.ContextVar("turn_deadline", default=None)  # Event-loop time the running turn must end by
+
+
+@asynccontextmanager
+async def turn_deadline(seconds: float = TURN_DEADLINE):
+    """Cut the enclosed turn off after `seconds` (raises TimeoutError); calls inside it see the time left.
+
+    Yields the asyncio.Timeout (None when disabled), whose expired() tells a miss from other timeouts.
+    """
+    if seconds <= 0:
+        yield None
+        return
+    token = _deadline.set(asyncio.get_running_loop().time() + seconds)
+    try:
+        async with asyncio.timeout(seconds) as timeout:
+            yield timeout
+    finally:
+        _deadline.reset(token)
+
+
+def time_left():
+    """Seconds until the running turn's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - asyncio.get_running_loop().time()
+
+
+def backoff(retry: int, base: float = LLM_RETRY_BACKOFF, cap: float = LLM_RETRY_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff before the given retry (1 for the first)."""
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+def is_transient(error: Exception) -> bool:
+    """Failures worth retrying: connection errors, timeouts, rate limits and 5xx responses."""
+    if isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return True
+    openai = sys.modules.get("openai")  # Only loaded with the OpenAI backend
+    if openai is not None and isinstance(error, openai.APIConnectionError):  # Includes APITimeoutError
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def is_idempotent(tool) -> bool:
+    return tool is not None and bool((tool.metadata or {}).get("idempotent"))
+
+
+async def sleep_before_retry(retry: int) -> bool:
+    """Back off before a retry; False if the turn's deadline would pass first."""
+    delay = backoff(retry)
+    left = time_left()
+    if left is not None and delay >= left:
+        return False
+    await asyncio.sleep(delay)
+    return True
+
+
+class ModelCaller:
+    """Calls the chat model with retries and optional hedging.
+
+    Each attempt streams privately (tagged nostream, so LangGraph doesn't
+    forward its tokens). Until an attempt yields its first chunk, it is retried
+    after a transient failure and, when hedging is on, raced by a second
+    attempt once it is slower than `hedge_percentile` of recent calls. The
+    first attempt to yield a chunk wins and the others are cancelled. Its
+    chunks are then passed to `emit`, so only one attempt ever reaches the
+    client. After the first token nothing is retried. A model that is not a
+    Runnable (a test double with only `ainvoke`) is called whole instead.
+    """
+
+    def __init__(self, model, retries: int = LLM_RETRIES, hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+                 hedge_min_delay: float = LLM_HEDGE_MIN_DELAY, window: int = LLM_HEDGE_WINDOW):
+        from langchain_core.runnables import Runnable
+        from langgraph.constants import TAG_NOSTREAM
+
+        self.streams = isinstance(model, Runnable)
+        self.model = model.with_config(tags=[TAG_NOSTREAM]) if self.streams else model
+        self.retries = retries
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self._first_token = deque(maxlen=window)  # Recent times to first chunk, in seconds
+        HEDGE_DELAY.set_function(lambda: self.hedge_delay() or 0.0)
+
+    def hedge_delay(self):
+        """Seconds to wait for a first token before hedging, or None (off, or too few samples yet)."""
+        if self.hedge_percentile <= 0 or len(self._first_token) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._first_token)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return max(self.hedge_min_delay, ordered[index])
+
+    async def ainvoke(self, messages, emit):
+        """The model's reply to `messages`; each chunk of the winning attempt is passed to `emit` as it arrives."""
+        from langchain_core.messages import message_chunk_to_message
+
+        retry = 0
+        while True:
+            try:
+                stream, response = await self._first_chunk(messages)
+                break
+            except Exception as e:
+                retry += 1
+                if not is_transient(e) or retry > self.retries or not await sleep_before_retry(retry):
+                    raise
+                LLM_RETRIED.labels(type(e).__name__).inc()
+                logging.warning(f"Model call failed before its first token ({e!r}), retry {retry}/{self.retries}")
+        if stream is None:
+            return response  # Whole message; LangGraph streams it when the node returns
+        emit(response)
+        async for chunk in stream:
+            emit(chunk)
+            response += chunk
+        return message_chunk_to_message(response)
+
+    async def _open(self, messages):
+        started = time.perf_counter()
+        if not self.streams:
+            stream, chunk = None, await self.model.ainvoke(messages)
+        else:
+            stream = self.model.astream(messages)
+            chunk = await anext(stream)
+        self._first_token.append(time.perf_counter() - started)
+        return stream, chunk
+
+    async def _first_chunk(self, messages):
+        """Start the call (hedged if slow) and return the winning attempt's stream and first chunk."""
+        attempts = [asyncio.create_task(self._open(messages))]
+        winner = None
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    attempts.append(asyncio.create_task(self._open(messages)))
+            error = None
+            pending = list(attempts)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in attempts:
+                    if task in done and task.exception() is None:
+                        winner = task
+                        if len(attempts) > 1:
+                            HEDGES.labels("primary" if task is attempts[0] else "hedge").inc()
+                        return task.result()
+                for task in done:
+                    pending.remove(task)
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+            await asyncio.gather(*attempts, return_exceptions=True)
+            for task in attempts:  # A loser that got its first chunk too still holds its stream open
+                if task is not winner and not task.cancelled() and task.exception() is None and task.result()[0]:
+                    await task.result()[0].aclose()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import zlib
+from functools import lru_cache
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Latencies are "fixed:S", "uniform:LO,HI", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (seconds)
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "lognormal:0.3,0.4")  # before the first token
+FAKE_LLM_TOKEN_DELAY = os.getenv("FAKE_LLM_TOKEN_DELAY", "fixed:0.01")  # between tokens
+FAKE_LLM_REPLY_WORDS = int(os.getenv("FAKE_LLM_REPLY_WORDS", "60"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+# Draw the time to first token afresh on every call instead of from the conversation, so a repeated
+# (retried or hedged) call can be faster than the first
+FAKE_LLM_VARY_LATENCY = os.getenv("FAKE_LLM_VARY_LATENCY", "0") == "1"
+# Share of calls failing with a ConnectionError before their first token
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+# Optional JSON file of rules: [{"match": "regex", "reply": "..."} or {"match": ..., "tool_call": {"name", "args"}}]
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+
+_FILLER = ("our plans cover diagnosis treatment and recovery with a lump sum paid on confirmation of the "
+           "covered stage so you can focus on getting better while we take care of the costs").split()
+
+
+@lru_cache(maxsize=None)
+def parse_distribution(spec: str):
+    """Return a function rng -> seconds for a latency spec."""
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    values = [float(v) for v in params.split(",")]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: values[0] * rng.lognormvariate(0.0, values[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+def load_script(path: str) -> list:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _text(message) -> str:
+    return message.content if isinstance(message.content, str) else str(message.content)
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for ChatOpenAI (LLM_BACKEND=fake) with configurable latency.
+
+    Replies are a function of the conversation and the seed, so a replayed
+    conversation always gets the same answers and (unless vary_latency is set)
+    timings. When premium_filter
+    is bound and the last user message names an age, gender and cancer type,
+    the model calls the tool; after a tool result it quotes it back.
+    """
+
+    latency: str = FAKE_LLM_LATENCY
+    token_delay: str = FAKE_LLM_TOKEN_DELAY
+    reply_words: int = FAKE_LLM_REPLY_WORDS
+    seed: int = FAKE_LLM_SEED
+    vary_latency: bool = FAKE_LLM_VARY_LATENCY
+    error_rate: float = FAKE_LLM_ERROR_RATE
+    script: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _rng(self, messages) -> random.Random:
+        digest = zlib.crc32("\x1e".join(_text(m) for m in messages).encode())
+        return random.Random(self.seed * 1_000_003 + digest)
+
+    def _respond(self, messages, rng: random.Random, tools) -> AIMessage:
+        tool_names = {t["function"]["name"] for t in tools or ()}
+        last = messages[-1] if messages else None
+        if isinstance(last, ToolMessage):
+            return AIMessage(self._pad(f"Here are the premiums I found: {_text(last)[:200]}", rng))
+        text = _text(last) if isinstance(last, HumanMessage) else ""
+        for rule in self.script:
+            if re.search(rule["match"], text, re.IGNORECASE):
+                if "tool_call" in rule and rule["tool_call"]["name"] in tool_names:
+                    return self._tool_call(rule["tool_call"]["name"], rule["tool_call"]["args"], rng)
+                if "reply" in rule:
+                    return AIMessage(rule["reply"])
+        if "premium_filter" in tool_names:
+            from chatbot.router import extract_profile  # The router's matching, against the live premium table
+
+            profile = extract_profile(text)
+            if profile:
+                age, cancer, gender = profile
+                return self._tool_call("premium_filter", {"age": age, "cancer": cancer, "gender": gender}, rng)
+        return AIMessage(self._pad("Thanks for your message.", rng))
+
+    def _tool_call(self, name: str, args: dict, rng: random.Random) -> AIMessage:
+        return AIMessage("", tool_calls=[{"name": name, "args": args, "id": f"call_{rng.getrandbits(48):012x}"}])
+
+    def _pad(self, text: str, rng: random.Random) -> str:
+        words = text.split()
+        words += [rng.choice(_FILLER) for _ in range(max(0, self.reply_words - len(words)))]
+        return " ".join(words)
+
+    def _plan(self, messages, tools):
+        """The reply, its tokens and the delay before each token."""
+        rng = self._rng(messages)
+        message = self._respond(messages, rng, tools)
+        tokens = [w + " " for w in message.content.split(" ")] if message.content else [""]
+        tokens[-1] = tokens[-1].rstrip(" ")
+        # Rough usage so token metrics are populated: ~4 characters per prompt token, one token per word
+        input_tokens = sum(len(_text(m)) // 4 + 1 for m in messages)
+        output_tokens = len(message.content.split()) + 10 * len(message.tool_calls)
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": input_tokens + output_tokens}
+        first, between = parse_distribution(self.latency), parse_distribution(self.token_delay)
+        delays = [first(random.Random() if self.vary_latency else rng)] + [between(rng) for _ in tokens[1:]]
+        return message, tokens, delays
+
+    async def _maybe_fail(self, delay: float) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            await asyncio.sleep(delay)
+            raise ConnectionError("Fake LLM connection reset")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, _, delays = self._plan(messages, kwargs.get("tools"))
+        time.sleep(sum(delays))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, _, delays = self._plan(messages, kwargs.get("tools"))
+        await self._maybe_fail(delays[0])
+        await asyncio.sleep(sum(delays))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message, tokens, delays = self._plan(messages, kwargs.get("tools"))
+        await self._maybe_fail(delays[0])
+        if message.tool_calls:
+            await asyncio.sleep(sum(delays))
+            call = message.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=message.usage_metadata,
+                                                             tool_call_chunks=[tool_call_chunk(
+                name=call["name"], args=json.dumps(call["args"]), id=call["id"], index=0)]))
+            return
+        for i, (token, delay) in enumerate(zip(tokens, delays)):
+            await asyncio.sleep(delay)
+            last = i == len(tokens) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=token, response_metadata={"finish_reason": "stop"} if last else {},
+                usage_metadata=message.usage_metadata if last else None))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def from_env() -> FakeChatModel:
+    return FakeChatModel(script=load_script(FAKE_LLM_SCRIPT) if FAKE_LLM_SCRIPT else [])
@@ -1,31 +1,103 @@
+import logging
+import time
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 from typing import Annotated
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
+from chatbot import metrics
+from chatbot.checkpoint import get_checkpointer
+from chatbot.deadlines import TOOL_RETRIED, TOOL_RETRIES, ModelCaller, is_idempotent, sleep_before_retry
 from chatbot.tools import premium_filter
 
 class State(TypedDict):
     messages: Annotated[list, add_messages]
 
-def setup_graph(model):
-    tools = [premium_filter]
+def setup_graph(model, checkpointer=None, context=None, admission=None, tools=None, router=None,
+                cache=None):
+    tools = tools if tools is not None else [premium_filter]
     tool_node = ToolNode(tools)
+    # Retries and (optionally) hedges the model call; its tokens are streamed through the custom stream writer
+    caller = ModelCaller(model)
 
-    async def call_model(state: State):
-        response = await model.ainvoke(state["messages"])
+    async def call_model(state: State, config: RunnableConfig):
+        key = cache.key(state["messages"]) if cache is not None else None
+        if key is None:
+            return await _admitted_call(state, config)
+
+        async def ask_model():
+            return (await _admitted_call(state, config))["messages"][0]
+
+        # Repeated questions in the same context are answered from the response cache
+        return {"messages": [await cache.fetch(key, ask_model)]}
+
+    async def _admitted_call(state: State, config: RunnableConfig):
+        if admission is None:
+            return await _call_model(state, config)
+        # Wait for one of the process-wide model-call slots (raises AdmissionRejected when shedding load)
+        async with admission.slot(config["configurable"]["thread_id"]):
+            return await _call_model(state, config)
+
+    async def _call_model(state: State, config: RunnableConfig):
+        started = time.perf_counter()
+        messages = state["messages"]
+        sent_tokens = None
+        if context is not None:
+            # Trim/summarize the history to the token budget before calling the model
+            messages, stats = await context.prepare(config["configurable"]["thread_id"], messages)
+            sent_tokens = stats["sent_tokens"]
+            logging.info(f"Context tokens: history={stats['history_tokens']} sent={stats['sent_tokens']} "
+                         f"summarized_messages={stats['summarized_messages']}")
+        llm_started = time.perf_counter()
+        response = await caller.ainvoke(messages, get_stream_writer())
+        finished = time.perf_counter()
+        metrics.LLM_SECONDS.observe(finished - llm_started)
+        metrics.observe_tokens(response, sent_tokens)
+        metrics.NODE_SECONDS.labels("agent").observe(finished - started)
         return {"messages": [response]}
 
+    async def call_tools(state: State, config: RunnableConfig):
+        started = time.perf_counter()
+        result = await tool_node.ainvoke(state, config)
+        calls = {call["id"]: call for call in state["messages"][-1].tool_calls}
+        for retry in range(1, TOOL_RETRIES + 1):
+            # Only tools declared idempotent are run again; the others' errors go back to the model
+            failed = [calls[m.tool_call_id] for m in result["messages"]
+                      if m.status == "error" and is_idempotent(tool_node.tools_by_name.get(m.name))]
+            if not failed or not await sleep_before_retry(retry):
+                break
+            for call in failed:
+                TOOL_RETRIED.labels(call["name"]).inc()
+            retried = {m.tool_call_id: m for m in (await tool_node.ainvoke(failed, config))["messages"]}
+            result = {"messages": [retried.get(m.tool_call_id, m) for m in result["messages"]]}
+        metrics.NODE_SECONDS.labels("tools").observe(time.perf_counter() - started)
+        return result
+
+    async def route(state: State, config: RunnableConfig):
+        # Profile-only messages get their premium lookup here instead of from a model call
+        return router.route(state["messages"], config)
+
+    def after_route(state: State):
+        last_message = state["messages"][-1]
+        return END if last_message.type == "ai" and not last_message.tool_calls else "agent"
+
     def should_continue(state: State):
         last_message = state["messages"][-1]
         return "tools" if last_message.tool_calls else END
 
-    memory = MemorySaver()
+    # Bounded, shared checkpointer unless the caller supplies one
+    memory = checkpointer if checkpointer is not None else get_checkpointer()
     workflow = StateGraph(State)
     workflow.add_node("agent", call_model)
-    workflow.add_node("tools", tool_node)
-    workflow.add_edge(START, "agent")
+    workflow.add_node("tools", call_tools)
+    if router is None:
+        workflow.add_edge(START, "agent")
+    else:
+        workflow.add_node("router", route)
+        workflow.add_edge(START, "router")
+        workflow.add_conditional_edges("router", after_route, ["agent", END])
     workflow.add_conditional_edges("agent", should_continue, ["tools", END])
     workflow.add_edge("tools", "agent")
     return workflow.compile(checkpointer=memory)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from chatbot.prompt import DEFAULT_LANGUAGE, DEFAULT_TMR_NAME, greeting_template
+
+# "template": fill greeting_template (English) and generate other languages once per persona/language
+# "generate": generate once per persona/language with the model and cache it
+# "llm": a full model round-trip on every connection (previous behaviour)
+GREETING_MODE = os.getenv("GREETING_MODE", "template")
+GREETING_CACHE_SIZE = int(os.getenv("GREETING_CACHE_SIZE", "1024"))
+
+# The synthetic first user turn the greeting answers
+OPENING_USER_MESSAGE = "Hi"
+
+
+def _salutation(persona: dict) -> str:
+    if persona.get("name"):
+        return persona["name"]
+    gender = str(persona.get("gender", "")).lower()
+    if gender == "male":
+        return "Mr Customer"
+    if gender == "female":
+        return "Miss Customer"
+    return "there"
+
+
+def render_greeting(persona: dict, product: str, tmr_name: str = DEFAULT_TMR_NAME) -> str:
+    return greeting_template.format(salutation=_salutation(persona), tmr_name=tmr_name, product_name=product)
+
+
+class GreetingCache:
+    """Opening greetings per compiled prompt (persona, language, product).
+
+    Concurrent connections for a greeting that is still being generated share
+    the same in-flight model call. If the connection making that call goes
+    away, the ones waiting on it generate the greeting themselves.
+    """
+
+    def __init__(self, model, mode: str = GREETING_MODE, maxsize: int = GREETING_CACHE_SIZE):
+        self.model = model
+        self.mode = mode
+        self.maxsize = maxsize
+        self._cache = OrderedDict()  # prompt text -> greeting, or a Future while generating
+
+    async def _generate(self, prompt) -> str:
+        response = await self.model.ainvoke([SystemMessage(prompt.text), HumanMessage(OPENING_USER_MESSAGE)])
+        return response.content
+
+    async def get(self, prompt):
+        """Return (greeting, source) where source is "template", "cache" or "llm"."""
+        if self.mode == "template" and prompt.language == DEFAULT_LANGUAGE:
+            return render_greeting(prompt.persona, prompt.product), "template"
+
+        key = prompt.text
+        cached = self._cache.get(key)
+        if isinstance(cached, str):
+            self._cache.move_to_end(key)
+            return cached, "cache"
+        if cached is not None:
+            greeting = await asyncio.shield(cached)
+            if greeting is not None:
+                return greeting, "cache"
+            return await self.get(prompt)  # The connection generating it went away; generate it again
+
+        future = asyncio.get_running_loop().create_future()
+        self._cache[key] = future
+        try:
+            greeting = await self._generate(prompt)
+            future.set_result(greeting)
+        except asyncio.CancelledError:
+            future.set_result(None)  # Only this connection was cancelled, not the ones waiting for it
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved: waiters re-raise it, nobody else needs to
+            raise
+        finally:
+            if self._cache.get(key) is future:
+                del self._cache[key]
+        self._cache[key] = greeting
+        self._evict()
+        return greeting, "llm"
+
+    def _evict(self) -> None:
+        """Drop the least recently used greetings beyond maxsize; ones still being generated are kept."""
+        excess = len(self._cache) - self.maxsize
+        if excess <= 0:
+            return
+        stale = []
+        for key, entry in self._cache.items():
+            if len(stale) == excess:
+                break
+            if isinstance(entry, str):
+                stale.append(key)
+        for key in stale:
+            del self._cache[key]
+
+
+async def seed_greeting(app, config: dict, prompt, greeting: str) -> None:
+    """Write the opening exchange into the thread's checkpoint as if the agent had produced it."""
+    await app.aupdate_state(
+        config,
+        {"messages": [SystemMessage(prompt.text), HumanMessage(OPENING_USER_MESSAGE), AIMessage(greeting)]},
+        as_node="agent",
+    )
+    logging.debug(f"Seeded greeting for thread {config['configurable']['thread_id']}")
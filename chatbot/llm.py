@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables once at module level
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# "openai", or "fake" for the offline stand-in in chatbot/fake_llm.py (load tests, local development)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+if LLM_BACKEND == "openai" and not OPENAI_API_KEY:
+    raise ValueError("OPENAI_API_KEY environment variable must be set")
+
+MODEL_NAME = os.getenv("OPENAI_MODEL", "gpt-4o")
+# API endpoint (the OpenAI client reads the same variable)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+# Connection pool of the process-wide LLM HTTP client
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# Seconds to open a connection to the API, and to wait for each read (a stalled stream fails after this)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "20"))
+
+_http_client = None
+_model = None
+
+
+def llm_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The pooled HTTP client shared by every LLM call in this process."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=llm_timeout(),
+        )
+    return _http_client
+
+
+def get_model():
+    """The chat model shared by every session. Sessions are separated by thread_id, not by client."""
+    global _model
+    if _model is None and LLM_BACKEND == "fake":
+        from chatbot import fake_llm
+        _model = fake_llm.from_env()
+    elif _model is None:
+        from langchain_openai import ChatOpenAI  # Imported lazily: the openai SDK is slow to import
+
+        _model = ChatOpenAI(
+            model=MODEL_NAME,
+            temperature=0,
+            api_key=OPENAI_API_KEY,
+            stream_usage=True,  # Token usage on streamed responses too (metrics)
+            http_async_client=get_http_client(),
+            timeout=llm_timeout(),
+            max_retries=0,  # Retried (with backoff, within the turn deadline) by chatbot/deadlines.py
+        )
+    return _model
+
+
+async def warm_pool(connections: int) -> int:
+    """Open pooled connections to the API ahead of the first turn. Returns how many were opened.
+
+    The requests are unauthenticated HEADs whose responses are discarded; only the
+    kept-alive TCP/TLS connections matter.
+    """
+    if LLM_BACKEND != "openai" or connections <= 0:
+        return 0
+    client = get_http_client()
+    results = await asyncio.gather(*(client.head(f"{OPENAI_BASE_URL}/models") for _ in range(connections)),
+                                   return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logging.warning(f"Could not open {len(errors)} of {connections} LLM connections: {errors[0]!r}")
+    return connections - len(errors)
+
+
+async def aclose() -> None:
+    """Close the pooled HTTP client (called on shutdown)."""
+    global _http_client, _model
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _model = None
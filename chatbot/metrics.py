@@ -0,0 +1,222 @@
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+# Bucket upper bounds (the +Inf bucket is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (0.00001, 0.000025, 0.0001, 0.00025, 0.001, 0.0025, 0.01, 0.1, 1)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """Base of the in-process metrics: a family of children keyed by label values."""
+
+    type_ = ""
+
+    def __init__(self, name: str, help_: str, labelnames=()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()  # Exported as 0 before the first observation
+        _registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A child for one set of label values (a class or factory is enough)."""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_}"]
+        for values, child in list(self._children.items()):
+            lines += child.render(self.name, self.labelnames, values)
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    type_ = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount=1) -> None:
+        self.labels().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ("function",)
+
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def set(self, value) -> None:
+        self.value = value
+
+    def dec(self, amount=1) -> None:
+        self.inc(-amount)
+
+    def render(self, name, labelnames, values):
+        if self.function is not None:
+            try:
+                self.value = self.function()
+            except Exception:
+                pass  # Keep the last value rather than failing the scrape
+        return super().render(name, labelnames, values)
+
+
+class Gauge(_Metric):
+    type_ = "gauge"
+    _new_child = _GaugeChild
+
+    def set(self, value) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount=1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount=1) -> None:
+        self.labels().dec(amount)
+
+    def set_function(self, function) -> None:
+        """Compute the value at scrape time instead of on the hot path."""
+        self.labels().function = function
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value) -> None:
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values)
+        lines += [f"{name}_sum{labels} {_format_value(total)}", f"{name}_count{labels} {cumulative}"]
+        return lines
+
+
+class Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(self, name: str, help_: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(float(b) for b in buckets)
+        super().__init__(name, help_, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value) -> None:
+        self.labels().observe(value)
+
+
+def timed(histogram):
+    """Decorator recording each call's duration in `histogram` (a metric or a labelled child)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Turn pipeline
+NODE_SECONDS = Histogram("chatbot_node_seconds", "Time spent in a graph node per call", ["node"])
+LLM_SECONDS = Histogram("chatbot_llm_seconds", "Time spent in the LLM call of the agent node")
+LLM_TOKENS = Histogram("chatbot_llm_tokens", "Tokens per LLM call", ["kind"], buckets=TOKEN_BUCKETS)
+TOOL_SECONDS = Histogram("chatbot_tool_seconds", "Time spent in a tool function per call", ["tool"],
+                         buckets=FAST_BUCKETS)
+TURN_SECONDS = Histogram("chatbot_turn_seconds", "User message to end of reply")
+FIRST_TOKEN_SECONDS = Histogram("chatbot_first_token_seconds", "User message to first streamed token")
+WS_SEND_SECONDS = Histogram("chatbot_ws_send_seconds", "Time spent in WebSocket sends per turn")
+TURNS = Counter("chatbot_turns_total", "Processed user messages", ["outcome"])
+
+# Connections
+CONNECT_SECONDS = Histogram("chatbot_connect_seconds", "WebSocket accept to greeting sent")
+CONNECTIONS = Counter("chatbot_connections_total", "Accepted WebSocket connections")
+ACTIVE_SESSIONS = Gauge("chatbot_active_sessions", "Open WebSocket sessions")
+RATE_LIMITED = Counter("chatbot_rate_limited_total", "Connections and messages rejected by a rate limit", ["limit"])
+
+# Conversation state
+CHECKPOINT_BYTES = Gauge("chatbot_checkpoint_bytes", "Bytes of conversation state held by the checkpointer")
+CHECKPOINT_THREADS = Gauge("chatbot_checkpoint_threads", "Conversations held by the checkpointer")
+
+
+def observe_tokens(response, fallback_prompt_tokens: int = None) -> None:
+    """Record prompt/completion tokens from a model response's usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.labels("prompt").observe(usage.get("input_tokens", 0))
+        LLM_TOKENS.labels("completion").observe(usage.get("output_tokens", 0))
+    elif fallback_prompt_tokens is not None:
+        LLM_TOKENS.labels("prompt").observe(fallback_prompt_tokens)
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+
+from chatbot import metrics
+from chatbot.ratelimit import get_rate_limiter
+from chatbot.sessions import CLOSE_REASONS, get_sessions
+from chatbot.streaming import MuxTransport
+from chatbot.turns import TurnScheduler
+from chatbot.websocket import (MAX_PARAM_LENGTH, detach_session, forget_thread, get_app, record, run_turn,
+                               start_session)
+
+# Sessions one multiplexed connection may have open at once
+MUX_MAX_SESSIONS = int(os.getenv("MUX_MAX_SESSIONS", "100"))
+# Messages a session holds while it is being greeted; more are rejected like rate-limited ones
+MUX_MAX_EARLY_MESSAGES = int(os.getenv("MUX_MAX_EARLY_MESSAGES", "10"))
+
+RATE_LIMITED_MESSAGE = "You're sending messages too quickly. Please wait a moment and try again."
+
+MUX_CONNECTIONS = metrics.Gauge("chatbot_mux_connections", "Open multiplexed WebSocket connections")
+
+
+class MuxSession:
+    __slots__ = ("id", "transport", "config", "scheduler", "session", "turns", "task", "early", "end_reason")
+
+    def __init__(self, session_id: str, transport):
+        self.id = session_id
+        self.transport = transport
+        self.config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        self.scheduler = None  # Set once the session is greeted or resumed
+        self.session = None
+        self.turns = None
+        self.task = None
+        self.early = []  # (text, ref) sent before the session was ready
+        self.end_reason = None  # Set when the client closes the session or the connection drops
+
+
+class MuxConnection:
+    """Many chat sessions over one WebSocket (/chat/mux).
+
+    Client frames are JSON objects:
+        {"type": "open", "session": id, ...persona params, "resume"?, "last_seq"?}
+        {"type": "message", "session": id, "id": message_id, "text": ...}
+        {"type": "close", "session": id}
+    Each session behaves like its own ?protocol=frames connection: its frames
+    carry its session id, and frames other than deltas carry `reply_to`, the
+    ids of the messages being answered. Sessions run concurrently, so replies
+    to different sessions interleave and arrive in whatever order they finish.
+    """
+
+    def __init__(self, websocket: WebSocket, max_sessions: int = MUX_MAX_SESSIONS):
+        self.websocket = websocket
+        self.max_sessions = max_sessions
+        self.app = get_app()
+        self.limiter = get_rate_limiter()
+        self.client_ip = websocket.client.host if websocket.client else "unknown"
+        self.sessions = {}  # client session id -> MuxSession
+        self._send_lock = asyncio.Lock()  # One frame at a time on the shared socket
+        self._handlers = {"open": self._open, "message": self._message, "close": self._close}
+
+    async def send(self, frame: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(orjson.dumps(frame).decode())
+
+    async def _error(self, session_id, text: str, ref=None) -> None:
+        frame = {"type": "error", "message": text}
+        if session_id is not None:
+            frame["session"] = session_id
+        if ref is not None:
+            frame["reply_to"] = [ref]
+        await self.send(frame)
+
+    async def serve(self) -> None:
+        """Read frames until the client disconnects, then end (or detach) every session."""
+        try:
+            while True:
+                raw = await self.websocket.receive_text()
+                try:
+                    frame = orjson.loads(raw)
+                except orjson.JSONDecodeError:
+                    frame = None
+                handler = self._handlers.get(frame.get("type")) if isinstance(frame, dict) else None
+                if handler is None:
+                    await self._error(None, "Expected a JSON object of type open, message or close")
+                    continue
+                await handler(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            tasks = []
+            for mux_session in list(self.sessions.values()):
+                if mux_session.end_reason is None:  # Not already ending
+                    mux_session.end_reason = "dropped"
+                    mux_session.task.cancel()
+                tasks.append(mux_session.task)
+            if tasks:
+                await asyncio.wait(tasks)
+
+    async def _open(self, frame: dict) -> None:
+        session_id = frame.get("session")
+        if not isinstance(session_id, str) or not session_id or len(session_id) > MAX_PARAM_LENGTH:
+            await self._error(None, "Session id must be a non-empty string")
+            return
+        if session_id in self.sessions:
+            await self._error(session_id, "Session already open")
+            return
+        if len(self.sessions) >= self.max_sessions:
+            await self._error(session_id, f"Too many sessions on this connection (limit {self.max_sessions})")
+            return
+        mux_session = MuxSession(session_id, MuxTransport(self.send, session_id))
+        self.sessions[session_id] = mux_session
+        # Greeting or resuming runs in its own task, so other sessions' frames keep being read
+        mux_session.task = asyncio.create_task(self._run_session(mux_session, frame))
+
+    async def _message(self, frame: dict) -> None:
+        session_id, ref, text = frame.get("session"), frame.get("id"), frame.get("text")
+        mux_session = self.sessions.get(session_id) if isinstance(session_id, str) else None
+        if mux_session is None:
+            await self._error(session_id, "Unknown session", ref)
+            return
+        if not isinstance(text, str) or not text:
+            await self._error(session_id, "Message text must be a non-empty string", ref)
+            return
+        if mux_session.scheduler is None:
+            # Held until the greeting is sent, but counted against the rate limits now
+            if len(mux_session.early) >= MUX_MAX_EARLY_MESSAGES:
+                await self._reject(mux_session, text, ref)
+            elif await self._allow(mux_session, text, ref):
+                mux_session.early.append((text, ref))
+            return
+        await self._submit(mux_session, text, ref)
+
+    async def _allow(self, mux_session: MuxSession, text: str, ref) -> bool:
+        """Charge a message to its session's and IP's rate limits; a rejected one gets an error frame."""
+        if await self.limiter.aallow_message(mux_session.config["configurable"]["thread_id"], self.client_ip):
+            return True
+        await self._reject(mux_session, text, ref)
+        return False
+
+    async def _reject(self, mux_session: MuxSession, text: str, ref) -> None:
+        metrics.RATE_LIMITED.labels("messages").inc()
+        logging.info(f"Message rate limit exceeded for IP: {self.client_ip}")
+        await record("user_message", thread_id=mux_session.config["configurable"]["thread_id"], text=text,
+                     rate_limited=True)
+        await self._error(mux_session.id, RATE_LIMITED_MESSAGE, ref)
+
+    async def _submit(self, mux_session: MuxSession, text: str, ref, charged: bool = False) -> None:
+        session = mux_session.session
+        get_sessions().touch(session)
+        if not charged and not await self._allow(mux_session, text, ref):
+            return
+        await record("user_message", thread_id=session.thread_id, text=text, rate_limited=False)
+        mux_session.scheduler.submit(text, ref)
+
+    async def _close(self, frame: dict) -> None:
+        session_id = frame.get("session")
+        mux_session = self.sessions.get(session_id) if isinstance(session_id, str) else None
+        if mux_session is None:
+            await self._error(session_id, "Unknown session")
+            return
+        if mux_session.end_reason is None:
+            mux_session.end_reason = "quit"
+            mux_session.task.cancel()
+
+    def _run_turn(self, mux_session: MuxSession, message):
+        mux_session.transport.reply_to = mux_session.scheduler.refs
+        return run_turn(self.app, message, mux_session.transport, mux_session.config,
+                        on_reply=mux_session.scheduler.reply_started)
+
+    async def _run_session(self, mux_session: MuxSession, params: dict) -> None:
+        """One session's lifetime: greet or resume, then run its turns until it is closed, reaped or dropped."""
+        opened_at = time.perf_counter()
+        metrics.ACTIVE_SESSIONS.inc()
+        sessions = get_sessions()
+        config = mux_session.config
+        try:
+            await start_session(self.app, mux_session.transport, config, params, opened_at)
+            scheduler = mux_session.scheduler = TurnScheduler(self.app, config,
+                                                              lambda message: self._run_turn(mux_session, message))
+            mux_session.session = await sessions.open(config["configurable"]["thread_id"],
+                                                      busy=lambda: not scheduler.idle)
+            mux_session.turns = asyncio.create_task(scheduler.run())
+            early, mux_session.early = mux_session.early, []
+            for text, ref in early:
+                await self._submit(mux_session, text, ref, charged=True)
+            await mux_session.session.closed.wait()
+            mux_session.end_reason = mux_session.session.reaped
+            logging.info(f"Closing mux session {mux_session.id}: {CLOSE_REASONS[mux_session.end_reason]}")
+        except asyncio.CancelledError:
+            if mux_session.end_reason is None:
+                raise
+        except Exception as e:
+            mux_session.end_reason = "error"
+            await self._error(mux_session.id, f"Session error: {str(e)}")
+        finally:
+            self.sessions.pop(mux_session.id, None)
+            metrics.ACTIVE_SESSIONS.dec()
+            await self._end_session(mux_session, sessions, opened_at)
+
+    async def _end_session(self, mux_session: MuxSession, sessions, opened_at: float) -> None:
+        reason = mux_session.end_reason or "error"
+        thread_id = mux_session.config["configurable"]["thread_id"]
+        await record("session_end", thread_id=thread_id, reason=reason,
+                     duration_s=round(time.perf_counter() - opened_at, 3))
+        if mux_session.session is not None:
+            if reason == "dropped" and not mux_session.scheduler.idle:
+                detach_session(sessions, mux_session.session, mux_session.transport, mux_session.scheduler,
+                               mux_session.turns)
+                return
+            mux_session.turns.cancel()
+            await asyncio.wait([mux_session.turns])
+            await sessions.close(mux_session.session)
+            if reason in ("idle", "max_age"):
+                await forget_thread(self.app, thread_id)
+        if reason != "dropped":
+            try:
+                await self.send({"type": "closed", "session": mux_session.id, "reason": reason})
+            except Exception:
+                pass  # The connection went away meanwhile
+
+
+async def mux_chat(websocket: WebSocket):
+    """WebSocket endpoint multiplexing many chat sessions over one connection."""
+    await websocket.accept()
+    metrics.CONNECTIONS.inc()
+    MUX_CONNECTIONS.inc()
+    try:
+        await MuxConnection(websocket).serve()
+    finally:
+        MUX_CONNECTIONS.dec()
@@ -0,0 +1,386 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+from types import MappingProxyType
+from typing import NamedTuple
+
+import orjson
+import ormsgpack
+
+# Plan options and the order stages are presented in
+OPTIONS = ("A", "B", "C")
+STAGE_ORDER = ("Early Stage", "Major Stage", "Advanced Stage")
+
+# Columns of the normalized premium table
+COLUMNS = ("Age", "Cancer_type", "Stage", "Gender", "Option A", "Option B", "Option C")
+
+# Bump when the snapshot layout or the normalization rules change
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".snapshot"
+
+
+class StageQuote(NamedTuple):
+    stage: str
+    prices: MappingProxyType  # option letter -> premium (IDR, as a string)
+
+
+class AgeBand(NamedTuple):
+    label: str
+    lower: int
+    upper: int
+
+
+def _parse_band(label: str):
+    """Parse an age band label like "20-25" into (lower, upper). Bare ages map to a one-year band."""
+    if "-" in label:
+        lower, upper = map(int, label.split("-"))
+        return lower, upper
+    lower = int(label)
+    return lower, lower + 1
+
+
+def _stage_sort_key(stage: str):
+    return (STAGE_ORDER.index(stage), stage) if stage in STAGE_ORDER else (len(STAGE_ORDER), stage)
+
+
+class PremiumIndex:
+    """Immutable premium lookup built once from the normalized premium rows.
+
+    Quotes are keyed by (age band, cancer type, gender) and hold every stage with
+    all three options, so a lookup is a single dict access. Ages are resolved
+    against a sorted array of band boundaries with a binary search.
+    """
+
+    __slots__ = ("_quotes", "_bands", "_lowers", "_batch", "ages", "genders", "cancers")
+
+    def __init__(self, rows):
+        grouped = {}
+        for row in rows:
+            key = (row["Age"], row["Cancer_type"], row["Gender"])
+            prices = MappingProxyType({opt: row[f"Option {opt}"] for opt in OPTIONS})
+            grouped.setdefault(key, {})[row["Stage"]] = prices
+
+        self._quotes = MappingProxyType({
+            key: tuple(StageQuote(stage, stages[stage]) for stage in sorted(stages, key=_stage_sort_key))
+            for key, stages in grouped.items()
+        })
+
+        # Vocabularies present in the data
+        self.ages = tuple(sorted({key[0] for key in grouped}))
+        self.cancers = tuple(sorted({key[1] for key in grouped}))
+        self.genders = tuple(sorted({key[2] for key in grouped}))
+
+        bands = []
+        for label in self.ages:
+            try:
+                bands.append(AgeBand(label, *_parse_band(label)))
+            except ValueError:
+                continue
+        bands.sort(key=lambda band: (band.lower, band.label))
+        self._bands = tuple(bands)
+        self._lowers = tuple(band.lower for band in bands)
+        self._batch = None
+
+    def __len__(self):
+        return len(self._quotes)
+
+    def resolve_age(self, age: str) -> str:
+        """Map an age or age band to one of the table's bands.
+
+        Raises ValueError if the age is neither a known band nor an integer.
+        """
+        age = str(age).strip()
+        if age in self.ages:
+            return age
+        age_int = int(age)
+        if not self._bands:
+            raise ValueError(f"No numeric age bands available for {age!r}")
+
+        # Band with the largest lower bound <= age (lower bound inclusive, upper exclusive)
+        idx = bisect_right(self._lowers, age_int) - 1
+        if idx >= 0 and age_int < self._bands[idx].upper:
+            return self._bands[idx].label
+
+        # Outside every band: fall back to the band whose lower bound is closest
+        candidates = [self._bands[i] for i in (idx, idx + 1) if 0 <= i < len(self._bands)]
+        return min(candidates, key=lambda band: (abs(band.lower - age_int), band.lower)).label
+
+    def lookup(self, age_band: str, cancer: str, gender: str):
+        """Return the ordered stage quotes for a profile, or an empty tuple if there are none."""
+        return self._quotes.get((age_band, cancer, gender), ())
+
+    def batch(self) -> "BatchQuoter":
+        """Vectorized quoter over this index, built on first use."""
+        if self._batch is None:
+            self._batch = BatchQuoter(self)
+        return self._batch
+
+
+def price_value(price: str):
+    """Premium as an int when it is a plain number (it is stored as text)."""
+    return int(price) if price.isdigit() else price
+
+
+class BatchQuoter:
+    """Quotes many profiles in one vectorized pass (numpy).
+
+    Profiles are encoded to integer codes, ages are resolved to bands with
+    searchsorted over the band lower bounds, and one fancy-indexing step over a
+    (band, cancer, gender) table yields a quote id per profile. Each quote's
+    JSON is serialized once up front, so rendering is a byte join.
+    """
+
+    # Negative ids returned by resolve()
+    INVALID_AGE, UNKNOWN_CANCER, UNKNOWN_GENDER, NO_DATA, INVALID_PROFILE, INVALID_JSON = -1, -2, -3, -4, -5, -6
+    # Numeric ages outside this range are invalid (they would overflow the int64 band arithmetic)
+    AGE_LIMIT = 2 ** 31
+    ERRORS = {
+        INVALID_AGE: b'"error":"invalid age"',
+        UNKNOWN_CANCER: b'"error":"unknown cancer type"',
+        UNKNOWN_GENDER: b'"error":"unknown gender"',
+        NO_DATA: b'"error":"no premium data for this profile"',
+        INVALID_PROFILE: b'"error":"profile needs age, cancer and gender"',
+        INVALID_JSON: b'"error":"line is not valid JSON"',
+    }
+
+    def __init__(self, index: PremiumIndex):
+        import numpy as np  # Imported lazily: only the batch API needs it
+
+        self.np = np
+        self.label_codes = {label: i for i, label in enumerate(index.ages)}
+        self.cancer_codes = {cancer: i for i, cancer in enumerate(index.cancers)}
+        self.gender_codes = {gender: i for i, gender in enumerate(index.genders)}
+        self.lowers = np.array([band.lower for band in index._bands], dtype=np.int64)
+        self.uppers = np.array([band.upper for band in index._bands], dtype=np.int64)
+        self.band_labels = np.array([self.label_codes[band.label] for band in index._bands], dtype=np.int64)
+
+        self.table = np.full((len(index.ages), len(index.cancers), len(index.genders)), self.NO_DATA, dtype=np.int64)
+        self.fragments = []  # quote id -> serialized JSON members (without braces)
+        for (band, cancer, gender), quotes in index._quotes.items():
+            self.table[self.label_codes[band], self.cancer_codes[cancer], self.gender_codes[gender]] = \
+                len(self.fragments)
+            body = orjson.dumps({
+                "age_band": band, "cancer": cancer, "gender": gender,
+                "quotes": {q.stage: {opt: price_value(q.prices[opt]) for opt in OPTIONS} for q in quotes},
+            })
+            self.fragments.append(body[1:-1])
+
+    def _resolve_ages(self, ages):
+        np = self.np
+        labels = np.full(len(ages), self.INVALID_AGE, dtype=np.int64)
+        numeric, positions = [], []
+        for i, age in enumerate(ages):
+            text = str(age).strip()
+            code = self.label_codes.get(text)
+            if code is not None:
+                labels[i] = code
+                continue
+            try:
+                value = int(text)
+            except ValueError:
+                continue
+            if -self.AGE_LIMIT < value < self.AGE_LIMIT:
+                numeric.append(value)
+                positions.append(i)
+        if numeric and len(self.lowers):
+            values = np.array(numeric, dtype=np.int64)
+            # Band with the largest lower bound <= age; outside every band, the closest lower bound wins
+            idx = np.searchsorted(self.lowers, values, side="right") - 1
+            below = np.clip(idx, 0, len(self.lowers) - 1)
+            above = np.clip(idx + 1, 0, len(self.lowers) - 1)
+            in_band = (idx >= 0) & (values < self.uppers[below])
+            d_below = np.where(idx >= 0, np.abs(self.lowers[below] - values), np.iinfo(np.int64).max)
+            d_above = np.where(idx + 1 < len(self.lowers), np.abs(self.lowers[above] - values),
+                               np.iinfo(np.int64).max)
+            band = np.where(in_band | (d_below <= d_above), below, above)
+            labels[np.array(positions)] = self.band_labels[band]
+        return labels
+
+    def resolve(self, ages, cancers, genders):
+        """Quote id per profile, or a negative error code."""
+        np = self.np
+        labels = self._resolve_ages(ages)
+        cancer_codes = np.fromiter((self.cancer_codes.get(str(c).strip().title(), -1) for c in cancers),
+                                   dtype=np.int64, count=len(cancers))
+        gender_codes = np.fromiter((self.gender_codes.get(str(g).strip().capitalize(), -1) for g in genders),
+                                   dtype=np.int64, count=len(genders))
+        valid = (labels >= 0) & (cancer_codes >= 0) & (gender_codes >= 0)
+        ids = np.full(len(labels), self.NO_DATA, dtype=np.int64)
+        ids[valid] = self.table[labels[valid], cancer_codes[valid], gender_codes[valid]]
+        ids[gender_codes < 0] = self.UNKNOWN_GENDER
+        ids[cancer_codes < 0] = self.UNKNOWN_CANCER
+        ids[labels < 0] = self.INVALID_AGE
+        return ids
+
+    def render(self, ids, start: int = 0, keys=None) -> bytes:
+        """NDJSON result lines for resolved ids; `keys` are optional client ids echoed back per line."""
+        fragments, errors = self.fragments, self.ERRORS
+        lines = []
+        for offset, quote_id in enumerate(ids.tolist()):
+            head = b'{"index":%d,' % (start + offset)
+            if keys is not None and keys[offset] is not None:
+                head += b'"id":' + orjson.dumps(keys[offset]) + b","
+            lines.append(head + (fragments[quote_id] if quote_id >= 0 else errors[quote_id]) + b"}\n")
+        return b"".join(lines)
+
+
+def read_workbook(path: str):
+    """Parse and normalize the premium workbook with pandas. Returns a list of row dicts."""
+    import pandas as pd  # Imported lazily: only needed when the snapshot is stale
+
+    df = pd.read_excel(path, sheet_name="Sheet1")
+    # Convert to string and normalize
+    df = df.astype(str)
+    df['Age'] = df['Age'].str.strip()
+    df['Cancer_type'] = df['Cancer_type'].str.strip().str.title()
+    df['Stage'] = df['Stage'].str.strip()
+    df['Gender'] = df['Gender'].str.strip().str.capitalize()
+    df['Option A'] = df['Option A'].str.strip()
+    df['Option B'] = df['Option B'].str.strip()
+    df['Option C'] = df['Option C'].str.strip()
+    return df[list(COLUMNS)].to_dict("records")
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _read_snapshot(snapshot_path: str, digest: str):
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = ormsgpack.unpackb(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ormsgpack.MsgpackDecodeError) as e:
+        logging.warning(f"Ignoring unreadable premium snapshot {snapshot_path}: {e}")
+        return None
+    if (snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("source_sha256") != digest
+            or tuple(snapshot.get("columns", ())) != COLUMNS):
+        return None
+    # Stored column-wise and dictionary-encoded; rebuild the row dicts
+    columns = [[values[code] for code in codes] for values, codes in snapshot["data"]]
+    return [dict(zip(COLUMNS, row)) for row in zip(*columns)]
+
+
+def _encode_column(values):
+    uniques = {}
+    codes = [uniques.setdefault(value, len(uniques)) for value in values]
+    return [list(uniques), codes]
+
+
+def _write_snapshot(snapshot_path: str, digest: str, rows) -> None:
+    payload = ormsgpack.packb({
+        "version": SNAPSHOT_VERSION,
+        "source_sha256": digest,
+        "columns": list(COLUMNS),
+        "data": [_encode_column([row[col] for row in rows]) for col in COLUMNS],
+    })
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, snapshot_path)  # Atomic, so concurrent workers never read a partial file
+    except OSError as e:
+        logging.warning(f"Could not write premium snapshot {snapshot_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_premium_rows(path: str, use_snapshot: bool = True, digest: str = None):
+    """Load the normalized premium rows, preferring the binary snapshot next to the workbook.
+
+    The snapshot is keyed by the SHA-256 of the workbook, so editing premium.xlsx
+    invalidates it. On a miss the workbook is parsed with pandas and the snapshot
+    is rewritten; on a hit neither pandas nor openpyxl is imported.
+    """
+    if not use_snapshot:
+        return read_workbook(path)
+
+    digest = digest or _file_digest(path)
+    snapshot_path = path + SNAPSHOT_SUFFIX
+    rows = _read_snapshot(snapshot_path, digest)
+    if rows is None:
+        rows = read_workbook(path)
+        _write_snapshot(snapshot_path, digest, rows)
+    return rows
+
+
+def _stat_signature(path: str):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class PremiumStore:
+    """Reloadable holder for the current PremiumIndex.
+
+    A reload builds a complete new index off to the side and then swaps the
+    reference in one assignment, so readers that grabbed `store.index` keep a
+    consistent table for the whole call.
+    """
+
+    def __init__(self, path: str, use_snapshot: bool = True, load: bool = True):
+        self.path = path
+        self.use_snapshot = use_snapshot
+        self.version = 0
+        self._reload_lock = threading.Lock()
+        self._signature = None
+        self.digest = None
+        self._index = None
+        self.loaded_at = None
+        if load:
+            self.reload(force=True)
+
+    @property
+    def index(self) -> PremiumIndex:
+        """The current table, loaded on first use if it wasn't loaded up front."""
+        if self._index is None:
+            self.reload()  # Concurrent first uses load it once: the others find the digest unchanged
+        return self._index
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild the index if the workbook changed (or always with force). Returns True if swapped."""
+        with self._reload_lock:
+            signature = _stat_signature(self.path)
+            digest = _file_digest(self.path)
+            if not force and digest == self.digest:
+                self._signature = signature
+                return False
+            index = PremiumIndex(load_premium_rows(self.path, use_snapshot=self.use_snapshot, digest=digest))
+            if not len(index):
+                raise ValueError(f"No premium rows found in {self.path}")
+            # Swap: a single reference assignment
+            self._index = index
+            self.digest = digest
+            self._signature = signature
+            self.version += 1
+            self.loaded_at = time.time()
+        logging.info(f"Loaded premium table v{self.version} ({len(index)} profiles) from {self.path}")
+        return True
+
+    async def areload(self, force: bool = False) -> bool:
+        """Reload in a worker thread so parsing the workbook never blocks the event loop."""
+        return await asyncio.to_thread(self.reload, force)
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return _stat_signature(self.path) != self._signature
+        except FileNotFoundError:
+            return False
+
+    async def watch(self, interval: float) -> None:
+        """Poll the workbook and reload when it changes. A failed reload keeps the current table."""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.changed_on_disk():
+                continue
+            try:
+                await self.areload()
+            except Exception as e:
+                logging.error(f"Premium table reload failed, keeping v{self.version}: {e}")
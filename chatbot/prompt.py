@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 product_name = "Personal Cancer Insurance"
 
 #Close-ended questions to generate EXCITEMENT
@@ -34,7 +36,16 @@ Unique values supported by tools are   age_unique = ['15-20', '20-25', '25-30',
 cancer_unique = ['Kidney Cancer', 'Lung Cancer', 'Throat Cancer', 'Skin Cancer','Thyroid Cancer', 'Cervical Cancer', 'Bone Cancer','Bladder Cancer'].
 In age-unique each age band includes the lower limit and excludes the upper limit (e.g., 15 ≤ age < 20).
 
-Get Age, Cancer_type and Gender of customer to call this tool. The tool will give you the premium details , your Job is to sell for `Option A`, if user doesnt agree as its costly
+Get Age, Cancer_type and Gender of customer to call this tool. It returns compact JSON with the premiums (IDR) of ALL THREE options for ALL THREE STAGES (Early, Major, Advanced) at once,
+e.g. {"age_band": "40-45", ..., "plans": {"A Premium": {"Early": 294000, "Major": 441000, "Advanced": 588000}, "B Standard": {...}, "C Basic": {...}}}.
+Call it ONCE per customer profile and reuse the result for every option; call it again only if the customer's age, gender or cancer type changes.
+If it returns "error", ask the customer to clarify using the "valid" values.
+The plans:
+- Option A (Premium): provides extensive coverage for treatments, hospital stays, and specialized care.
+- Option B (Standard): provides essential support for treatments and hospital stays at a moderate price.
+- Option C (Basic): offers basic coverage for essential treatments at our most affordable rate.
+For the Major Stage every plan offers balanced benefits for more intensive treatments and care; for the Advanced Stage it ensures appropriate support for advanced treatments and hospitalizations.
+Write premiums as "IDR 294,000". Your Job is to sell for `Option A`, if user doesnt agree as its costly
 then quote for `Option B` with all THREE STAGES (Early, Major, Advanced) still user says its costly then quote `Option C` with all THREE STAGES (Early, Major, Advanced). If still customer says its costly after `Option C` then greet them and disconnect the chat. ALWAYS Pitch QUote ONE at a time.
 """
 
@@ -85,6 +96,22 @@ STRICTLY use the 3-objection attempt rule: Make up to three attempts to encourag
 
 
 
+# Opening message sent on connect (English); other languages are generated once and cached
+greeting_template = (
+    "Hi {salutation}! This is {tmr_name} from Medical Insurance. I'm reaching out about our {product_name}, "
+    "which helps you and your family stay financially protected if cancer ever comes into the picture. "
+    "Do you have a few minutes to chat right now?"
+)
+
+# Instructions for compacting older turns of a long conversation
+summary_prompt = """
+You maintain a running summary of a sales chat between an insurance agent and a customer.
+Update the summary with the new conversation. Keep every fact about the customer (name, age, gender, cancer type,
+family, concerns, objections raised and how many), which plan options were already pitched and how the customer reacted,
+and any commitments made. Be concise and factual, write in third person, and do not invent anything.
+"""
+
+
 def get_persona_details(user_name:str = None , user_gender:str = None, user_age:int = None, user_marital_status:str = None, user_occupation:str = None, user_country:str = None, addl_info:str = None):
         """
         Retrieves the persona details of a potential insurance sales customer.
@@ -112,26 +139,26 @@ def get_persona_details(user_name:str = None , user_gender:str = None, user_age:
 
 
 
-def get_prompt(persona_info:dict, tmr_name:str, product_name:str, language:str, close_ended_ques_excitement: str,
+def get_static_prompt(tmr_name:str, product_name:str, close_ended_ques_excitement: str,
                unpredictable_reasons: str, open_ended_ques, key_selling_points: str, coverage_benefits: str, policy_details_and_exclusions: str, terms_and_conditions: str, value_proposition: str, product_benefits: str, statistical_examples: str, objection_rule: str):
     """
-    This method is used to generate the prompt.
-
-    Args:
-        persona_info
+    This method is used to generate the static part of the prompt.
 
+    It contains nothing session specific, so it is byte-identical across sessions
+    and can be served from the provider's prompt cache. Persona and language
+    go in the session prompt that follows it.
     """
     prompt = f"""
             Assume the role of a highly skilled insurance salesperson named "{tmr_name}" working at Medical Insurance. You should ALWAYS sound like a HUMAN and not a bot. Your PRIMARY TASK is to persuade the customer and see their interest to buy a `{product_name}` product.
             You should be able to provide the customer with appropriate product information and suggest them with the Insurance Policy with the Maximum Premium that the customer can afford.
-            Your goal is to engage in a persuasive and informative conversation with a potential customer to understand their needs and then recommend a product and see if they are interested in buying the product. You should make sure that your output is aligned to the INSTRUCTIONS. You should only speak in {language}.
+            Your goal is to engage in a persuasive and informative conversation with a potential customer to understand their needs and then recommend a product and see if they are interested in buying the product. You should make sure that your output is aligned to the INSTRUCTIONS. You should only speak in the LANGUAGE given in the SESSION DETAILS at the end.
 
 
 
             INSTRUCTIONS -
             ```
             1. PERSONA DETAILS - This refers to the specific details and characteristics of an individual or target audience that are relevant to the insurance product or campaign. It helps in tailoring the message and approach to cater to the needs and preferences of the intended audience.
-            {persona_info}
+            The persona details of this customer are given in the SESSION DETAILS at the end.
 
             Note :
                 1. If you don't get any of the persona details and some value as None. Try to get necessary details as part of the conversation. If still you cant get proceed as it is, AVOID the case where even if you don't have the full persona details you get stuck. CONTINUE the conversation.
@@ -268,14 +295,98 @@ def get_prompt(persona_info:dict, tmr_name:str, product_name:str, language:str,
     return prompt
 
 
+def get_session_prompt(persona_info:dict, language:str):
+    """
+    This method is used to generate the per-session part of the prompt (persona and language).
+    """
+    return f"""
+            SESSION DETAILS -
+            ```
+            LANGUAGE: {language}
+            PERSONA DETAILS: {persona_info}
+            ```
+    """
+
+
+def get_prompt(persona_info:dict, tmr_name:str, product_name:str, language:str, close_ended_ques_excitement: str,
+               unpredictable_reasons: str, open_ended_ques, key_selling_points: str, coverage_benefits: str, policy_details_and_exclusions: str, terms_and_conditions: str, value_proposition: str, product_benefits: str, statistical_examples: str, objection_rule: str):
+    """
+    This method is used to generate the full prompt: the static part followed by the session part.
+
+    Args:
+        persona_info
+
+    """
+    static = get_static_prompt(tmr_name, product_name, close_ended_ques_excitement, unpredictable_reasons,
+                               open_ended_ques, key_selling_points, coverage_benefits, policy_details_and_exclusions,
+                               terms_and_conditions, value_proposition, product_benefits, statistical_examples,
+                               objection_rule)
+    return static + get_session_prompt(persona_info, language)
+
+
+_token_counter = None
+DEFAULT_TMR_NAME = 'Jordan Belfort'
+DEFAULT_LANGUAGE = 'English'
+PROMPT_CACHE_SIZE = 256
+
+
+class CompiledPrompt:
+    """A system prompt split into a cacheable static prefix and a per-session suffix."""
+
+    __slots__ = ("prefix", "suffix", "text", "persona", "language", "product", "_section_tokens")
+
+    def __init__(self, prefix: str, suffix: str, persona: dict = None, language: str = DEFAULT_LANGUAGE,
+                 product: str = product_name):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.text = prefix + suffix
+        self.persona = persona or {}
+        self.language = language
+        self.product = product
+        self._section_tokens = None
+
+    @property
+    def section_tokens(self) -> dict:
+        """Token count of each section: the prefix is what provider-side prompt caching can reuse."""
+        if self._section_tokens is None:
+            self._section_tokens = {"prefix": _count_tokens(self.prefix), "suffix": _count_tokens(self.suffix)}
+        return self._section_tokens
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _count_tokens(text: str) -> int:
+    from chatbot.context import TokenCounter  # Imported here: chatbot.context imports this module
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter.count_text(text)
+
+
+@lru_cache(maxsize=16)
+def get_static_prefix(product: str = product_name) -> str:
+    """The static prompt for a product. Memoized so every session shares the exact same string."""
+    return get_static_prompt(tmr_name=DEFAULT_TMR_NAME, product_name=product,
+                             close_ended_ques_excitement=close_ended_ques_excitement,
+                             unpredictable_reasons=unpredictable_reasons, open_ended_ques=open_ended_ques,
+                             key_selling_points=key_selling_points, coverage_benefits=coverage_benefits,
+                             policy_details_and_exclusions=policy_details_and_exclusions,
+                             terms_and_conditions=terms_and_conditions, value_proposition=value_proposition,
+                             product_benefits=product_benefits, statistical_examples=statistical_examples,
+                             objection_rule=objection_rule)
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _compile(persona_items: tuple, language: str, product: str) -> CompiledPrompt:
+    persona = dict(persona_items)
+    return CompiledPrompt(get_static_prefix(product), get_session_prompt(persona, language), persona, language, product)
+
+
+def compile_prompt(persona_info: dict, language: str = DEFAULT_LANGUAGE, product: str = product_name) -> CompiledPrompt:
+    """Compile the system prompt for a (persona, language, product), memoized with an LRU."""
+    return _compile(tuple(persona_info.items()), language, product)
+
 
 # Now define persona_info and sys_prompt
 persona_info = get_persona_details(user_name='Patricia Perva', user_gender='Male', user_country='Indonesia', addl_info='...')
-sys_prompt = get_prompt(persona_info, tmr_name='Jordan Belfort', product_name=product_name, language='English',
-                        close_ended_ques_excitement=close_ended_ques_excitement,
-                        unpredictable_reasons=unpredictable_reasons, open_ended_ques=open_ended_ques,
-                        key_selling_points=key_selling_points, coverage_benefits=coverage_benefits,
-                        policy_details_and_exclusions=policy_details_and_exclusions,
-                        terms_and_conditions=terms_and_conditions, value_proposition=value_proposition,
-                        product_benefits=product_benefits, statistical_examples=statistical_examples,
-                        objection_rule=objection_rule)
+default_prompt = compile_prompt(persona_info)
+sys_prompt = default_prompt.text
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens added per second
+    burst: float  # bucket capacity
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        """Parse "100/hour" (burst = 100) or "20/minute:5" (burst = 5)."""
+        amount, _, rest = spec.partition("/")
+        unit, _, burst = rest.partition(":")
+        per = _UNITS[unit.strip().rstrip("s") or "second"]
+        return cls(rate=float(amount) / per, burst=float(burst or amount))
+
+
+# Limits ("count/unit[:burst]")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" or "sqlite"
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "ratelimit.sqlite")
+RATE_LIMIT_SWEEP_INTERVAL = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "60"))
+LIMITS = {
+    "connections_per_ip": Limit.parse(os.getenv("RATE_LIMIT_CONNECTIONS_PER_IP", "100/hour")),
+    "messages_per_ip": Limit.parse(os.getenv("RATE_LIMIT_MESSAGES_PER_IP", "120/minute")),
+    "messages_per_session": Limit.parse(os.getenv("RATE_LIMIT_MESSAGES_PER_SESSION", "20/minute:10")),
+}
+
+
+def _refill(tokens: float, updated: float, now: float, limit: Limit) -> float:
+    # A clock stepped backwards refills nothing rather than draining the bucket
+    return min(limit.burst, tokens + max(0.0, now - updated) * limit.rate)
+
+
+def _full_at(tokens: float, now: float, limit: Limit) -> float:
+    # When the bucket is full again; from then on the key is indistinguishable from a new one
+    return now + (limit.burst - tokens) / limit.rate if limit.rate else float("inf")
+
+
+class InProcessBackend:
+    """Token buckets in a dict; fastest, but each worker process counts separately."""
+
+    clock = staticmethod(time.monotonic)
+    blocking = False  # Cheap enough to call on the event loop
+
+    def __init__(self):
+        self._buckets = {}  # key -> [tokens, updated, full_at]
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, limit: Limit, cost: float, now: float) -> bool:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = limit.burst if bucket is None else _refill(bucket[0], bucket[1], now, limit)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = [tokens, now, _full_at(tokens, now, limit)]
+            return allowed
+
+    def sweep(self, now: float) -> int:
+        with self._lock:
+            expired = [key for key, bucket in self._buckets.items() if bucket[2] <= now]
+            for key in expired:
+                del self._buckets[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteBackend:
+    """Token buckets in a local SQLite file (WAL mode) shared by every worker on the host.
+
+    Timestamps are wall-clock time (time.time()): the file outlives the
+    processes and reboots, and a monotonic clock restarts from zero on boot.
+    Calls can wait on other workers' writes, so the limiter's async methods
+    make them in a worker thread.
+    """
+
+    clock = staticmethod(time.time)
+    blocking = True
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                           "updated REAL NOT NULL, full_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+
+    def acquire(self, key: str, limit: Limit, cost: float, now: float) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key=?", (key,)).fetchone()
+                tokens = limit.burst if row is None else _refill(row[0], row[1], now, limit)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self._conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                                   (key, tokens, now, _full_at(tokens, now, limit)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return allowed
+
+    def sweep(self, now: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class RateLimiter:
+    """Named token-bucket limits over a pluggable backend."""
+
+    def __init__(self, backend, limits: dict = None, clock=None):
+        self.backend = backend
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.clock = clock if clock is not None else backend.clock  # The backend's timestamps must persist
+
+    def allow(self, name: str, key: str, cost: float = 1.0) -> bool:
+        return self.backend.acquire(f"{name}:{key}", self.limits[name], cost, self.clock())
+
+    def allow_connection(self, ip: str) -> bool:
+        return self.allow("connections_per_ip", ip)
+
+    def allow_message(self, session_id: str, ip: str) -> bool:
+        # Session first, so one noisy session doesn't use up its IP's budget with rejected messages
+        return self.allow("messages_per_session", session_id) and self.allow("messages_per_ip", ip)
+
+    def sweep(self) -> int:
+        """Drop buckets that have refilled completely: they behave exactly like absent keys."""
+        return self.backend.sweep(self.clock())
+
+    # For the event loop: a blocking backend is called from a worker thread
+    async def _run(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def aallow_connection(self, ip: str) -> bool:
+        return await self._run(self.allow_connection, ip)
+
+    async def aallow_message(self, session_id: str, ip: str) -> bool:
+        return await self._run(self.allow_message, session_id, ip)
+
+    async def asweep(self) -> int:
+        return await self._run(self.sweep)
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The process-wide rate limiter selected by RATE_LIMIT_BACKEND."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        if RATE_LIMIT_BACKEND == "sqlite":
+            backend = SqliteBackend(RATE_LIMIT_SQLITE_PATH)
+        elif RATE_LIMIT_BACKEND == "memory":
+            backend = InProcessBackend()
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND {RATE_LIMIT_BACKEND!r} (expected 'memory' or 'sqlite')")
+        _rate_limiter = RateLimiter(backend)
+    return _rate_limiter
+
+
+async def run_sweeper(limiter: RateLimiter, interval: float = RATE_LIMIT_SWEEP_INTERVAL) -> None:
+    """Periodically expire idle rate-limit keys."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await limiter.asweep()
+            if removed:
+                logging.info(f"Rate limiter: expired {removed} idle keys")
+        except Exception as e:
+            logging.error(f"Rate limiter sweep failed: {e}")
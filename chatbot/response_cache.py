@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+import orjson
+from langchain_core.messages import AIMessage, HumanMessage
+
+from chatbot import metrics
+from chatbot.tools import premium_store
+
+# Set to 1 to enable the response cache for this deployment
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+# Seconds a cached reply may be served
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+LOOKUPS = metrics.Counter("chatbot_response_cache_total", "Response cache lookups", ["result"])
+ENTRIES = metrics.Gauge("chatbot_response_cache_entries", "Replies held in the response cache")
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a user message."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+class ResponseCache:
+    """Exact-match cache of model replies, consulted before call_model.
+
+    The key is the normalized user message plus a digest of everything the
+    reply depends on: the whole conversation before it (system prompt with
+    persona, language and product, earlier turns, premium lookups) and the
+    premium table version. A reply is only reused for a conversation that is
+    identical up to the question, so one session never gets an answer shaped
+    by another's history. Editing the prompt or reloading the premium data
+    changes every key. Only plain text replies are cached (not tool calls);
+    concurrent identical requests share one model call.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._cache = OrderedDict()  # key -> (expires_at, reply), or a Future while the model is called
+
+    def __len__(self):
+        return len(self._cache)
+
+    def key(self, messages: list):
+        """Cache key for the reply to messages, or None when the turn isn't cacheable."""
+        if not messages or not isinstance(messages[-1], HumanMessage) or not isinstance(messages[-1].content, str):
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"premiums:{premium_store.version}\0".encode())
+        for message in messages[:-1]:
+            digest.update(f"{message.type}:{message.content}\0".encode())
+            if isinstance(message, AIMessage) and message.tool_calls:
+                digest.update(orjson.dumps([(call["name"], call["args"]) for call in message.tool_calls]) + b"\0")
+        return digest.digest(), normalize(messages[-1].content)
+
+    async def fetch(self, key, call):
+        """The reply for key: cached, shared with a concurrent identical request, or from call() (a coroutine
+        function returning the model's AIMessage)."""
+        entry = self._cache.get(key)
+        if isinstance(entry, tuple):
+            if entry[0] > self.clock():
+                self._cache.move_to_end(key)
+                LOOKUPS.labels("hit").inc()
+                return AIMessage(entry[1])
+            del self._cache[key]
+        elif entry is not None:
+            reply = await asyncio.shield(entry)
+            if reply is not None:
+                LOOKUPS.labels("coalesced").inc()
+                return AIMessage(reply)
+            LOOKUPS.labels("miss").inc()
+            return await call()  # The shared call produced a tool call, which isn't shared
+
+        LOOKUPS.labels("miss").inc()
+        future = asyncio.get_running_loop().create_future()
+        self._cache[key] = future
+        try:
+            response = await call()
+            cacheable = not response.tool_calls and isinstance(response.content, str) and response.content
+            future.set_result(response.content if cacheable else None)
+        except asyncio.CancelledError:
+            future.set_result(None)  # Only this turn was cancelled; waiters call the model themselves
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved: waiters re-raise it, nobody else needs to
+            raise
+        finally:
+            if self._cache.get(key) is future:
+                del self._cache[key]
+        if not cacheable:
+            return response
+        self._cache[key] = (self.clock() + self.ttl, response.content)
+        self._evict()
+        return response
+
+    def _evict(self) -> None:
+        """Drop the least recently used replies beyond maxsize; calls still in flight are never evicted."""
+        excess = len(self._cache) - self.maxsize
+        if excess <= 0:
+            return
+        stale = []
+        for key, entry in self._cache.items():
+            if len(stale) == excess:
+                break
+            if isinstance(entry, tuple):
+                stale.append(key)
+        for key in stale:
+            del self._cache[key]
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """The process-wide response cache, or None when RESPONSE_CACHE=0."""
+    global _response_cache
+    if _response_cache is None and RESPONSE_CACHE:
+        _response_cache = ResponseCache()
+        ENTRIES.set_function(lambda: len(_response_cache))
+    return _response_cache
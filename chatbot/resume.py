@@ -0,0 +1,251 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from chatbot import metrics
+from chatbot.checkpoint import CHECKPOINT_TTL
+
+# Key for signing resume tokens; when unset a random per-process key is used,
+# so tokens only work against the process that issued them
+RESUME_SECRET = os.getenv("RESUME_SECRET")
+# Seconds a resume token stays valid (the thread must also still be checkpointed)
+RESUME_TOKEN_TTL = float(os.getenv("RESUME_TOKEN_TTL", str(CHECKPOINT_TTL)))
+# Assistant messages kept per thread for replay after a reconnect
+RESUME_OUTBOX_SIZE = int(os.getenv("RESUME_OUTBOX_SIZE", "20"))
+# Threads with an outbox (least recently used are dropped; memory backend only)
+RESUME_OUTBOX_THREADS = int(os.getenv("RESUME_OUTBOX_THREADS", "50000"))
+# "memory" (this process) or "sqlite" (shared by every worker on the host)
+RESUME_OUTBOX_BACKEND = os.getenv("RESUME_OUTBOX_BACKEND", "memory")
+RESUME_OUTBOX_SQLITE_PATH = os.getenv("RESUME_OUTBOX_SQLITE_PATH", "outbox.sqlite")
+RESUME_OUTBOX_SWEEP_INTERVAL = 60.0
+# Seconds a turn may keep running after its client dropped, so its reply can be replayed on resume
+RESUME_FINISH_TIMEOUT = float(os.getenv("RESUME_FINISH_TIMEOUT", "60"))
+
+RESUMES = metrics.Counter("chatbot_resumes_total", "Reconnects presenting a resume token", ["outcome"])
+REPLAYED = metrics.Counter("chatbot_resume_replayed_messages_total", "Missed messages replayed on resume")
+RESUME_SECONDS = metrics.Histogram("chatbot_resume_seconds", "Time from accept to a resumed session being ready",
+                                   buckets=metrics.FAST_BUCKETS)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+class ResumeTokens:
+    """HMAC-signed tokens naming a thread: "<thread_id>.<expires>.<signature>"."""
+
+    def __init__(self, secret: bytes = None, ttl: float = RESUME_TOKEN_TTL, clock=time.time):
+        if secret is None:
+            logging.info("RESUME_SECRET is not set; resume tokens are only valid for this process")
+            secret = secrets.token_bytes(32)
+        self.secret = secret
+        self.ttl = ttl
+        self.clock = clock
+
+    def _sign(self, payload: str) -> str:
+        return _b64(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()[:16])
+
+    def issue(self, thread_id: str) -> str:
+        payload = f"{thread_id}.{int(self.clock() + self.ttl)}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str):
+        """(thread_id, None) for a valid token, else (None, "invalid" or "expired")."""
+        payload, _, signature = token.rpartition(".")
+        thread_id, _, expires = payload.rpartition(".")
+        if not thread_id or not expires.isdigit() or not hmac.compare_digest(signature, self._sign(payload)):
+            return None, "invalid"
+        if int(expires) < self.clock():
+            return None, "expired"
+        return thread_id, None
+
+
+class Outbox:
+    """The last few assistant messages sent on each thread, numbered by a per-thread sequence."""
+
+    def __init__(self, size: int = RESUME_OUTBOX_SIZE, max_threads: int = RESUME_OUTBOX_THREADS):
+        self.size = size
+        self.max_threads = max_threads
+        self._threads = OrderedDict()  # thread_id -> [last seq, deque of (seq, text)]
+
+    def __len__(self):
+        return len(self._threads)
+
+    def append(self, thread_id: str, text: str) -> int:
+        entry = self._threads.get(thread_id)
+        if entry is None:
+            entry = self._threads[thread_id] = [0, deque(maxlen=self.size)]
+            if len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        else:
+            self._threads.move_to_end(thread_id)
+        entry[0] += 1
+        entry[1].append((entry[0], text))
+        return entry[0]
+
+    def last_seq(self, thread_id: str) -> int:
+        entry = self._threads.get(thread_id)
+        return entry[0] if entry else 0
+
+    def since(self, thread_id: str, seq: int):
+        """Messages after seq, oldest first, and whether any in between were already dropped."""
+        entry = self._threads.get(thread_id)
+        if entry is None:
+            return [], seq > 0
+        oldest = entry[1][0][0] if entry[1] else entry[0] + 1
+        return [(s, text) for s, text in entry[1] if s > seq], seq + 1 < oldest
+
+    def resume(self, thread_id: str, seq: int) -> None:
+        """Continue numbering after the client's last seen seq when the thread's outbox was dropped."""
+        if thread_id not in self._threads:
+            self._threads[thread_id] = [seq, deque(maxlen=self.size)]
+
+    def forget(self, thread_id: str) -> None:
+        self._threads.pop(thread_id, None)
+
+    # Async API shared with SqliteOutbox; nothing here blocks
+    async def aappend(self, thread_id: str, text: str) -> int:
+        return self.append(thread_id, text)
+
+    async def alast_seq(self, thread_id: str) -> int:
+        return self.last_seq(thread_id)
+
+    async def asince(self, thread_id: str, seq: int):
+        return self.since(thread_id, seq)
+
+    async def aresume(self, thread_id: str, seq: int) -> None:
+        self.resume(thread_id, seq)
+
+    async def aforget(self, thread_id: str) -> None:
+        self.forget(thread_id)
+
+
+class SqliteOutbox:
+    """Outbox in a local SQLite file (WAL mode), so a client can resume on any worker of the host.
+
+    Threads untouched for `ttl` seconds (resume tokens for them have expired)
+    are swept now and then on append. The async methods, used on the event
+    loop, run the blocking calls in a worker thread.
+    """
+
+    def __init__(self, path: str = RESUME_OUTBOX_SQLITE_PATH, size: int = RESUME_OUTBOX_SIZE,
+                 ttl: float = RESUME_TOKEN_TTL, sweep_interval: float = RESUME_OUTBOX_SWEEP_INTERVAL):
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, last_seq INTEGER NOT NULL,
+                                                updated REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS messages (thread_id TEXT NOT NULL, seq INTEGER NOT NULL, text TEXT NOT NULL,
+                                                 PRIMARY KEY (thread_id, seq));
+            CREATE INDEX IF NOT EXISTS threads_updated ON threads (updated);
+        """)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+
+    def append(self, thread_id: str, text: str) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT INTO threads VALUES (?, 1, ?) ON CONFLICT (thread_id) "
+                                   "DO UPDATE SET last_seq=last_seq + 1, updated=excluded.updated",
+                                   (thread_id, time.time()))
+                seq = self._conn.execute("SELECT last_seq FROM threads WHERE thread_id=?", (thread_id,)).fetchone()[0]
+                self._conn.execute("INSERT OR REPLACE INTO messages VALUES (?, ?, ?)", (thread_id, seq, text))
+                self._conn.execute("DELETE FROM messages WHERE thread_id=? AND seq<=?", (thread_id, seq - self.size))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if time.monotonic() >= self._next_sweep:
+            self.sweep()
+        return seq
+
+    def last_seq(self, thread_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT last_seq FROM threads WHERE thread_id=?", (thread_id,)).fetchone()
+        return row[0] if row else 0
+
+    def since(self, thread_id: str, seq: int):
+        with self._lock:
+            row = self._conn.execute("SELECT last_seq FROM threads WHERE thread_id=?", (thread_id,)).fetchone()
+            rows = self._conn.execute("SELECT seq, text FROM messages WHERE thread_id=? ORDER BY seq",
+                                      (thread_id,)).fetchall()
+        if row is None:
+            return [], seq > 0
+        oldest = rows[0][0] if rows else row[0] + 1
+        return [(s, text) for s, text in rows if s > seq], seq + 1 < oldest
+
+    def resume(self, thread_id: str, seq: int) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO threads VALUES (?, ?, ?)", (thread_id, seq, time.time()))
+
+    def forget(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("threads", "messages"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (thread_id,))
+
+    def sweep(self) -> int:
+        """Delete threads whose resume tokens have expired."""
+        with self._lock:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT thread_id FROM threads WHERE updated < ?", (time.time() - self.ttl,)).fetchall()]
+        for thread_id in expired:
+            self.forget(thread_id)
+        return len(expired)
+
+    async def aappend(self, thread_id: str, text: str) -> int:
+        return await asyncio.to_thread(self.append, thread_id, text)
+
+    async def alast_seq(self, thread_id: str) -> int:
+        return await asyncio.to_thread(self.last_seq, thread_id)
+
+    async def asince(self, thread_id: str, seq: int):
+        return await asyncio.to_thread(self.since, thread_id, seq)
+
+    async def aresume(self, thread_id: str, seq: int) -> None:
+        await asyncio.to_thread(self.resume, thread_id, seq)
+
+    async def aforget(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.forget, thread_id)
+
+
+_tokens = None
+_outbox = None
+
+
+def get_resume_tokens() -> ResumeTokens:
+    global _tokens
+    if _tokens is None:
+        _tokens = ResumeTokens(RESUME_SECRET.encode() if RESUME_SECRET else None)
+    return _tokens
+
+
+def get_outbox():
+    """The outbox selected by RESUME_OUTBOX_BACKEND."""
+    global _outbox
+    if _outbox is None:
+        if RESUME_OUTBOX_BACKEND == "sqlite":
+            _outbox = SqliteOutbox(RESUME_OUTBOX_SQLITE_PATH)
+        elif RESUME_OUTBOX_BACKEND == "memory":
+            _outbox = Outbox()
+        else:
+            raise ValueError(f"Unknown RESUME_OUTBOX_BACKEND {RESUME_OUTBOX_BACKEND!r} (expected 'memory' or 'sqlite')")
+    return _outbox
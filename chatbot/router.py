@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import time
+import uuid
+
+import orjson
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from chatbot import metrics
+from chatbot.prompt import DEFAULT_LANGUAGE
+from chatbot.tools import premium_filter, premium_store
+
+# "off", "tool" (inject the premium lookup so one model call phrases it) or
+# "template" (also answer short English profile-only messages without the model)
+ROUTER_MODE = os.getenv("ROUTER_MODE", "off")
+# Longest message (in words) answered from the template
+ROUTER_TEMPLATE_MAX_WORDS = int(os.getenv("ROUTER_TEMPLATE_MAX_WORDS", "15"))
+
+ROUTED = metrics.Counter("chatbot_router_turns_total", "User messages seen by the premium router", ["outcome"])
+ROUTER_SECONDS = metrics.Histogram("chatbot_router_seconds", "Time spent in the premium router",
+                                   buckets=metrics.FAST_BUCKETS)
+MODEL_CALLS_AVOIDED = metrics.Counter("chatbot_router_model_calls_avoided_total", "Model calls the router made unnecessary")
+SAVED_SECONDS = metrics.Counter("chatbot_router_saved_seconds_total",
+                                "Estimated model time saved by the router (avoided calls x mean LLM call time)")
+
+_GENDER_WORDS = {
+    "male": "Male", "man": "Male", "boy": "Male", "guy": "Male", "gentleman": "Male",
+    "female": "Female", "woman": "Female", "girl": "Female", "lady": "Female",
+}
+_AGE_CONTEXT = re.compile(r"(?:\b(?:age|aged|i'?m|i am)\s*(?:is\s*)?(\d{2})\b)|(?:\b(\d{2})\s*(?:years?|yrs?|y/?o)\b)")
+_TWO_DIGITS = re.compile(r"(?<![\d.,])\b(\d{2})\b(?![\d%]|[.,]\d)")  # Not part of 1,500 or 2.5 or 30%
+_WORDS = re.compile(r"[a-z]+")
+
+
+def extract_profile(text: str, index=None):
+    """(age, cancer, gender) when a message names exactly one of each, else None.
+
+    Matching is against the live premium table: an age band label or a two-digit
+    age, a gender word, and a cancer type by its full name or first word
+    ("lung"). Anything ambiguous is a miss and is left to the model.
+    """
+    index = index or premium_store.index
+    lowered = text.lower()
+
+    band = [label for label in index.ages if "-" in label and label in lowered]
+    ages = {a or b for a, b in _AGE_CONTEXT.findall(lowered)} or set(_TWO_DIGITS.findall(lowered))
+    if len(band) == 1:
+        age = band[0]
+    elif len(ages) == 1 and not band:
+        age = ages.pop()
+    else:
+        return None
+
+    words = set(_WORDS.findall(lowered))
+    genders = {_GENDER_WORDS[w] for w in words if w in _GENDER_WORDS}
+    cancers = [c for c in index.cancers if c.lower() in lowered or c.split()[0].lower() in words]
+    if len(genders) != 1 or len(cancers) != 1:
+        return None
+    return age, cancers[0], genders.pop()
+
+
+def render_quote(result: dict) -> str:
+    """Template pitch of Option A (the sales flow starts there) from a premium_filter result."""
+    plan = result["plans"]["A Premium"]
+    prices = ", ".join(f"IDR {price:,} for the {stage} Stage" if isinstance(price, int) else
+                       f"IDR {price} for the {stage} Stage" for stage, price in plan.items())
+    return (f"Thank you! For {result['cancer']} cover in the {result['age_band']} age band, our Premium plan "
+            f"(Option A) is "
+            f"{prices}. It provides extensive coverage for treatments, hospital stays, and specialized care, so you "
+            f"can focus on your recovery. Would you like to hear more about this plan?")
+
+
+class PremiumRouter:
+    """Pre-model graph stage that performs obvious premium lookups without asking the model.
+
+    When the latest user message names an age, gender and cancer type, the
+    router runs premium_filter itself and adds the tool call and its result to
+    the state, so the agent only has to phrase the answer (one model call
+    instead of two). In "template" mode short English profile-only messages
+    are answered from a template and the model is not called at all.
+    """
+
+    def __init__(self, mode: str = ROUTER_MODE, template_max_words: int = ROUTER_TEMPLATE_MAX_WORDS):
+        self.mode = mode
+        self.template_max_words = template_max_words
+
+    def _use_template(self, text: str, config: dict) -> bool:
+        language = config.get("configurable", {}).get("language", DEFAULT_LANGUAGE)
+        return (self.mode == "template" and language.lower() == "english" and "?" not in text
+                and len(text.split()) <= self.template_max_words)
+
+    def route(self, messages: list, config: dict) -> dict:
+        """State update for the latest message: the injected tool call/result (and reply), or nothing."""
+        if self.mode == "off" or not messages or not isinstance(messages[-1], HumanMessage):
+            return {}
+        started = time.perf_counter()
+        text = messages[-1].content if isinstance(messages[-1].content, str) else ""
+        profile = extract_profile(text)
+        if profile is None:
+            ROUTED.labels("miss").inc()
+            ROUTER_SECONDS.observe(time.perf_counter() - started)
+            return {}
+
+        age, cancer, gender = profile
+        call_id = f"call_router_{uuid.uuid4().hex[:24]}"
+        args = {"age": age, "cancer": cancer, "gender": gender}
+        content = premium_filter.invoke(args)
+        update = [AIMessage("", tool_calls=[{"name": "premium_filter", "args": args, "id": call_id}]),
+                  ToolMessage(content, tool_call_id=call_id, name="premium_filter")]
+        result = orjson.loads(content)
+        avoided = 1
+        if "error" not in result and self._use_template(text, config):
+            update.append(AIMessage(render_quote(result)))
+            avoided = 2
+        ROUTED.labels("template" if avoided == 2 else "tool").inc()
+        ROUTER_SECONDS.observe(time.perf_counter() - started)
+        MODEL_CALLS_AVOIDED.inc(avoided)
+        llm = metrics.LLM_SECONDS.labels()
+        if any(llm.counts):
+            SAVED_SECONDS.inc(avoided * llm.sum / sum(llm.counts))
+        logging.info(f"Router: {avoided} model call(s) avoided for {args}")
+        return {"messages": update}
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from chatbot import metrics
+
+# Seconds without a user message before an idle session is closed (0 disables)
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "900"))
+# Seconds after which any session is closed, active or not (0 disables)
+SESSION_MAX_AGE = float(os.getenv("SESSION_MAX_AGE", str(4 * 3600)))
+SESSION_REAP_INTERVAL = float(os.getenv("SESSION_REAP_INTERVAL", "30"))
+# Where thread ownership is recorded: "memory" (this process) or "sqlite" (shared by every worker on the host)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite")
+# WebSocket ping/pong heartbeat (uvicorn): seconds between pings, and to wait for the pong
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "20"))
+
+# Sessions count as idle in the gauge after this many seconds without a message or a running turn
+IDLE_AFTER = 60.0
+
+IDLE_SESSIONS = metrics.Gauge("chatbot_sessions_idle", "Open sessions with no message in the last minute and no turn running")
+REAPED = metrics.Counter("chatbot_sessions_reaped_total", "Sessions closed by the reaper", ["reason"])
+
+# Close codes and reasons sent to reaped clients
+CLOSE_CODE = 1001  # Going away
+CLOSE_REASONS = {"idle": "Session idle timeout", "max_age": "Session expired",
+                 "replaced": "Session resumed on another connection"}
+
+
+class Session:
+    __slots__ = ("thread_id", "owner", "opened_at", "last_active", "busy", "reaped", "detached", "closed")
+
+    def __init__(self, thread_id: str, now: float, busy=None):
+        self.thread_id = thread_id
+        self.owner = uuid.uuid4().hex  # Identifies this connection in the shared ownership table
+        self.opened_at = now
+        self.last_active = now
+        self.busy = busy or (lambda: False)  # () -> True while a turn is running
+        self.reaped = None  # Reason, once reaped
+        self.detached = False  # Client gone, turn still finishing
+        self.closed = asyncio.Event()
+
+
+class SqliteOwnership:
+    """Which connection owns each thread, in a local SQLite file (WAL mode) shared by every worker.
+
+    A connection claims its thread when it opens. A reconnect that lands on
+    another worker claims the thread too, and the old connection's worker
+    notices on its next reap. Rows of detached sessions (turn still finishing
+    after the client dropped) tell a resuming worker to wait for the reply.
+    Calls block on the file (and on other workers' writes), so SessionRegistry
+    makes them in a worker thread.
+    """
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS owners (thread_id TEXT PRIMARY KEY, owner TEXT NOT NULL, "
+                           "detached INTEGER NOT NULL, updated REAL NOT NULL)")
+
+    def claim(self, thread_id: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO owners VALUES (?, ?, 0, ?)", (thread_id, owner, time.time()))
+
+    def detach(self, thread_id: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE owners SET detached=1, updated=? WHERE thread_id=? AND owner=?",
+                               (time.time(), thread_id, owner))
+
+    def release(self, thread_id: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM owners WHERE thread_id=? AND owner=?", (thread_id, owner))
+
+    def owners(self, thread_ids) -> dict:
+        """thread_id -> owner for the given threads that have one."""
+        thread_ids = list(thread_ids)
+        result = {}
+        with self._lock:
+            for start in range(0, len(thread_ids), 500):  # Stay under SQLite's bound-parameter limit
+                chunk = thread_ids[start:start + 500]
+                result.update(self._conn.execute(
+                    f"SELECT thread_id, owner FROM owners WHERE thread_id IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall())
+        return result
+
+    def detached(self, thread_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT detached FROM owners WHERE thread_id=?", (thread_id,)).fetchone()
+        return bool(row and row[0])
+
+    def sweep(self, older_than: float) -> int:
+        """Drop rows left behind by workers that exited without releasing them."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM owners WHERE updated < ?", (older_than,)).rowcount
+
+
+class SessionRegistry:
+    """Open WebSocket sessions in this process, and the reaper that closes dead ones.
+
+    A session is reaped when it has had no user message for `idle_timeout`
+    seconds (and no turn is running), or when it is older than `max_age`.
+    Reaping sets the session's `closed` event; the connection handler then
+    closes the socket and drops the thread's state. Half-open sockets are
+    normally noticed sooner by the ping/pong heartbeat, which ends the session
+    as an ordinary disconnect. With shared `ownership`, a session whose thread
+    was claimed by a connection on another worker is reaped as "replaced".
+    """
+
+    def __init__(self, idle_timeout: float = SESSION_IDLE_TIMEOUT, max_age: float = SESSION_MAX_AGE,
+                 clock=time.monotonic, ownership: SqliteOwnership = None):
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.clock = clock
+        self.ownership = ownership  # Shared with other workers, if any
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def open(self, thread_id: str, busy=None) -> Session:
+        """Register a session; an older connection still holding the thread is closed."""
+        session = Session(thread_id, self.clock(), busy)
+        if self.ownership is not None:
+            # Claimed before it is registered, so the reaper never sees it without its row
+            await asyncio.to_thread(self.ownership.claim, thread_id, session.owner)
+        previous = self._sessions.get(thread_id)
+        if previous is not None and not previous.reaped:
+            previous.reaped = "replaced"
+            REAPED.labels("replaced").inc()
+            previous.closed.set()
+        self._sessions[thread_id] = session
+        return session
+
+    async def close(self, session: Session) -> None:
+        if self._sessions.get(session.thread_id) is session:
+            del self._sessions[session.thread_id]
+        if self.ownership is not None:
+            await asyncio.to_thread(self.ownership.release, session.thread_id, session.owner)
+
+    async def detach(self, session: Session) -> None:
+        """The client dropped but its turn keeps running; close() follows once it is done."""
+        session.detached = True
+        if self.ownership is not None:
+            await asyncio.to_thread(self.ownership.detach, session.thread_id, session.owner)
+
+    async def wait_detached(self, thread_id: str, timeout: float) -> None:
+        """Wait while another worker finishes a turn for a thread whose client dropped."""
+        if self.ownership is None:
+            return
+        deadline = self.clock() + timeout
+        while self.clock() < deadline and await asyncio.to_thread(self.ownership.detached, thread_id):
+            await asyncio.sleep(0.1)
+
+    def touch(self, session: Session) -> None:
+        session.last_active = self.clock()
+
+    def idle_count(self) -> int:
+        now = self.clock()
+        return sum(1 for s in self._sessions.values() if now - s.last_active >= IDLE_AFTER and not s.busy())
+
+    async def reap(self) -> int:
+        """Mark expired sessions closed. Returns how many were reaped."""
+        now = self.clock()
+        reaped = 0
+        live = [session for session in self._sessions.values() if not session.reaped and not session.detached]
+        owners = None
+        if self.ownership is not None:
+            owners = await asyncio.to_thread(self.ownership.owners, [s.thread_id for s in live])
+        for session in live:
+            if session.reaped or self._sessions.get(session.thread_id) is not session:
+                continue  # Closed or replaced while ownership was read
+            if owners is not None and owners.get(session.thread_id) != session.owner:
+                session.reaped = "replaced"  # Resumed on another worker
+            elif self.max_age and now - session.opened_at >= self.max_age:
+                session.reaped = "max_age"
+            elif self.idle_timeout and now - session.last_active >= self.idle_timeout and not session.busy():
+                session.reaped = "idle"
+            else:
+                continue
+            REAPED.labels(session.reaped).inc()
+            session.closed.set()
+            reaped += 1
+        if self.ownership is not None and self.max_age:
+            await asyncio.to_thread(self.ownership.sweep, time.time() - 2 * self.max_age)
+        return reaped
+
+
+_sessions = None
+
+
+def get_sessions() -> SessionRegistry:
+    global _sessions
+    if _sessions is None:
+        if SESSION_BACKEND == "sqlite":
+            ownership = SqliteOwnership(SESSION_SQLITE_PATH)
+        elif SESSION_BACKEND == "memory":
+            ownership = None
+        else:
+            raise ValueError(f"Unknown SESSION_BACKEND {SESSION_BACKEND!r} (expected 'memory' or 'sqlite')")
+        _sessions = SessionRegistry(ownership=ownership)
+        IDLE_SESSIONS.set_function(_sessions.idle_count)
+    return _sessions
+
+
+async def run_reaper(sessions: SessionRegistry, interval: float = SESSION_REAP_INTERVAL) -> None:
+    """Periodically close idle and expired sessions."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reaped = await sessions.reap()
+            if reaped:
+                logging.info(f"Reaped {reaped} sessions ({len(sessions)} open, {sessions.idle_count()} idle)")
+        except Exception as e:
+            logging.error(f"Session reaper failed: {e}")
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import time
+import uuid
+from contextlib import aclosing
+
+import orjson
+from fastapi import WebSocket
+from langchain_core.messages import AIMessage
+
+# Deltas are coalesced into one frame until this many characters are buffered...
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "48"))
+# ...or this many seconds have passed since the last frame
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+
+
+class TextTransport:
+    """Plain-text protocol (default): one WebSocket text frame per complete assistant message."""
+
+    framed = False
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.send_seconds = 0.0  # Total time spent in websocket sends
+        self.detached = False  # The client is gone; sends are dropped
+        self._parts = []
+
+    async def _send_text(self, text: str) -> None:
+        if self.detached:
+            return
+        started = time.perf_counter()
+        await self.websocket.send_text(text)
+        self.send_seconds += time.perf_counter() - started
+
+    async def start(self, message_id: str) -> None:
+        self._parts = []
+
+    async def delta(self, text: str) -> None:
+        self._parts.append(text)
+
+    async def end(self, discard: bool = False) -> None:
+        text = "".join(self._parts)
+        self._parts = []
+        if text and not discard:
+            await self._send_text(text)
+
+    async def send_message(self, text: str) -> None:
+        await self._send_text(text)
+
+    async def send_error(self, text: str) -> None:
+        await self._send_text(text)
+
+    async def send_event(self, type_: str, **fields) -> None:
+        pass  # Plain-text clients only ever receive assistant messages
+
+
+class FrameTransport:
+    """Framed JSON protocol (?protocol=frames).
+
+    Each assistant message is sent as {"type": "start"}, one or more
+    {"type": "delta", "text": ...} frames and {"type": "end"}, all carrying the
+    message id. Tokens are coalesced so a frame is sent per `flush_chars`
+    characters or `flush_interval` seconds rather than per token; the first
+    delta of a message is sent right away.
+    """
+
+    framed = True
+
+    def __init__(self, websocket: WebSocket, flush_chars: int = STREAM_FLUSH_CHARS,
+                 flush_interval: float = STREAM_FLUSH_INTERVAL):
+        self.websocket = websocket
+        self.send_seconds = 0.0  # Total time spent in websocket sends
+        self.detached = False  # The client is gone; sends are dropped (messages are still recorded)
+        # Optional coroutine function(text) -> seq recording each complete message; the seq is sent in its end frame
+        self.on_message = None
+        self.flush_chars = flush_chars
+        self.flush_interval = flush_interval
+        self._id = None
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = 0.0
+        self._sent_delta = False
+        self._text = []  # The whole current message, for on_message
+
+    async def _send(self, frame: dict) -> None:
+        if self.detached:
+            return
+        started = time.perf_counter()
+        await self.websocket.send_text(orjson.dumps(frame).decode())
+        self.send_seconds += time.perf_counter() - started
+
+    async def _flush(self) -> None:
+        if self._buffer:
+            text = "".join(self._buffer)
+            self._buffer, self._buffered = [], 0
+            self._last_flush = time.monotonic()
+            self._sent_delta = True
+            await self._send({"type": "delta", "id": self._id, "text": text})
+
+    async def start(self, message_id: str) -> None:
+        self._id = message_id
+        self._buffer, self._buffered, self._sent_delta, self._text = [], 0, False, []
+        self._last_flush = time.monotonic()
+        await self._send({"type": "start", "id": message_id})
+
+    async def delta(self, text: str) -> None:
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self.on_message is not None:
+            self._text.append(text)
+        if (not self._sent_delta or self._buffered >= self.flush_chars
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            await self._flush()
+
+    async def end(self, discard: bool = False) -> None:
+        if discard:
+            self._buffer, self._buffered = [], 0
+            await self._send({"type": "end", "id": self._id, "discarded": True})
+        else:
+            await self._flush()
+            frame = {"type": "end", "id": self._id}
+            if self.on_message is not None:
+                frame["seq"] = await self.on_message("".join(self._text))
+            await self._send(frame)
+        self._id, self._text = None, []
+
+    async def send_message(self, text: str) -> None:
+        await self.start(f"msg-{uuid.uuid4()}")
+        await self.delta(text)
+        await self.end()
+
+    async def replay(self, seq: int, text: str) -> None:
+        """Resend a message the client missed, under its original seq."""
+        message_id = f"msg-{uuid.uuid4()}"
+        await self._send({"type": "start", "id": message_id})
+        await self._send({"type": "delta", "id": message_id, "text": text})
+        await self._send({"type": "end", "id": message_id, "seq": seq, "replayed": True})
+
+    async def send_error(self, text: str) -> None:
+        await self._send({"type": "error", "message": text})
+
+    async def send_event(self, type_: str, **fields) -> None:
+        await self._send({"type": type_, **fields})
+
+
+class MuxTransport(FrameTransport):
+    """One session of a multiplexed connection (/chat/mux).
+
+    Sends the frames of FrameTransport, tagged with the client's session id,
+    through the connection's shared `send` coroutine. Frames other than deltas
+    also carry `reply_to`: the ids of the client messages the running turn
+    answers (several when messages were coalesced).
+    """
+
+    def __init__(self, send, session_id: str, **kwargs):
+        super().__init__(None, **kwargs)
+        self.session_id = session_id
+        self.reply_to = []
+        self._send_frame = send
+
+    async def _send(self, frame: dict) -> None:
+        if self.detached:
+            return
+        frame["session"] = self.session_id
+        if self.reply_to and frame["type"] != "delta":
+            frame["reply_to"] = self.reply_to
+        started = time.perf_counter()
+        await self._send_frame(frame)
+        self.send_seconds += time.perf_counter() - started
+
+
+def make_transport(websocket: WebSocket):
+    if websocket.query_params.get("protocol") == "frames":
+        return FrameTransport(websocket)
+    return TextTransport(websocket)
+
+
+async def stream_turn(app, inputs: dict, config: dict, transport, on_reply=None) -> dict:
+    """Run one graph turn, streaming assistant tokens to the transport.
+
+    Model replies arrive as chunks on the custom stream (written by the graph's
+    ModelCaller, which keeps retried and hedged attempts private); messages
+    nodes add whole (cached answers, routed replies) come on the messages
+    stream. Tool-call messages are never shown to the user, and a message cut
+    short by cancellation is discarded. `on_reply` is called when the first token is
+    sent. Returns timings in seconds (time to first token and total turn time)
+    and the complete messages the turn's nodes added, for transcripts.
+    """
+    started = time.perf_counter()
+    first_token = None
+    current = None  # id of the message being streamed
+    suppressed = None  # id of a message that turned out to be a tool call
+    added = []
+    streamed = set()  # ids of messages streamed from the custom stream, re-emitted whole on the messages stream
+    try:
+        async with aclosing(app.astream(inputs, config, stream_mode=["messages", "updates", "custom"])) as stream:
+            async for mode, data in stream:
+                if mode == "updates":
+                    for update in data.values():
+                        if isinstance(update, dict):
+                            added.extend(update.get("messages", ()))
+                    continue
+                chunk = data if mode == "custom" else data[0]
+                if not isinstance(chunk, AIMessage):
+                    continue  # Tool results and echoed inputs
+                if mode == "custom":
+                    streamed.add(chunk.id)
+                elif chunk.id in streamed:
+                    continue
+                if current is not None and chunk.id != current:
+                    await transport.end()
+                    current = None
+                if chunk.tool_calls or getattr(chunk, "tool_call_chunks", None):
+                    if current is not None:
+                        await transport.end(discard=True)
+                        current = None
+                    suppressed = chunk.id
+                    continue
+                if chunk.id == suppressed or not isinstance(chunk.content, str) or not chunk.content:
+                    continue
+                if current is None:
+                    current = chunk.id or f"msg-{uuid.uuid4()}"
+                    await transport.start(current)
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                    if on_reply is not None:
+                        on_reply()
+                await transport.delta(chunk.content)
+    except asyncio.CancelledError:
+        if current is not None:
+            await transport.end(discard=True)
+        raise
+    if current is not None:
+        await transport.end()
+    return {"first_token": first_token, "total": time.perf_counter() - started, "messages": added}
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+
+import orjson
+
+from chatbot import metrics
+
+# Conversation transcripts for audits: JSONL events, zstd-compressed, written off the event loop.
+# Off unless enabled: they hold everything customers type (names, ages, diagnoses)
+TRANSCRIPTS = os.getenv("TRANSCRIPTS", "0") == "1"
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", "transcripts")
+# Events waiting to be written; when full, "drop" discards new events and "block" makes the turn wait
+TRANSCRIPT_QUEUE_SIZE = int(os.getenv("TRANSCRIPT_QUEUE_SIZE", "10000"))
+TRANSCRIPT_FULL_POLICY = os.getenv("TRANSCRIPT_FULL_POLICY", "drop")
+# Events per write, and the longest an event waits for its batch to fill
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", "500"))
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", "1.0"))
+# A new file is started past this many compressed bytes or seconds
+TRANSCRIPT_ROTATE_BYTES = int(os.getenv("TRANSCRIPT_ROTATE_BYTES", str(64 * 1024 * 1024)))
+TRANSCRIPT_ROTATE_SECONDS = float(os.getenv("TRANSCRIPT_ROTATE_SECONDS", "3600"))
+TRANSCRIPT_ZSTD_LEVEL = int(os.getenv("TRANSCRIPT_ZSTD_LEVEL", "3"))
+
+EVENTS = metrics.Counter("chatbot_transcript_events_total", "Transcript events by outcome", ["outcome"])
+QUEUED = metrics.Gauge("chatbot_transcript_queue_depth", "Transcript events waiting to be written")
+BATCH_SECONDS = metrics.Histogram("chatbot_transcript_batch_seconds", "Time to compress and write one batch")
+WRITTEN_BYTES = metrics.Counter("chatbot_transcript_bytes_total", "Compressed transcript bytes written")
+
+
+class TranscriptSink:
+    """Batched, asynchronous writer of transcript events.
+
+    `emit` only puts the event on a bounded queue. A writer task takes up to
+    `batch_size` events at a time, serializes them as JSON lines and hands the
+    batch to a thread that compresses it into one zstd frame and appends it to
+    the current file. Files are named transcript-<start time>-<pid>.jsonl.zst,
+    so workers never share one, and concatenated frames decompress as a
+    single stream (`zstd -dc`).
+    """
+
+    def __init__(self, directory: str = TRANSCRIPT_DIR, queue_size: int = TRANSCRIPT_QUEUE_SIZE,
+                 policy: str = TRANSCRIPT_FULL_POLICY, batch_size: int = TRANSCRIPT_BATCH_SIZE,
+                 flush_interval: float = TRANSCRIPT_FLUSH_INTERVAL, rotate_bytes: int = TRANSCRIPT_ROTATE_BYTES,
+                 rotate_seconds: float = TRANSCRIPT_ROTATE_SECONDS, level: int = TRANSCRIPT_ZSTD_LEVEL):
+        import zstandard  # Imported lazily: only needed when transcripts are enabled
+
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown TRANSCRIPT_FULL_POLICY {policy!r} (expected 'drop' or 'block')")
+        self.directory = directory
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._task = None
+        self._file = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+        self.path = None
+        QUEUED.set_function(self._queue.qsize)
+
+    async def emit(self, type_: str, **fields) -> None:
+        """Queue an event; never waits for disk (with the "block" policy, only for queue space)."""
+        event = {"ts": time.time(), "type": type_, **fields}
+        if self.policy == "block":
+            await self._queue.put(event)
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            EVENTS.labels("dropped").inc()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def aclose(self) -> None:
+        """Write out every queued event and close the file."""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        await asyncio.to_thread(self._close_file)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            closing = batch[-1] is None
+            events = batch[:-1] if closing else batch
+            if events:
+                data = b"".join(orjson.dumps(event, default=str) + b"\n" for event in events)
+                try:
+                    await asyncio.to_thread(self._write, data)
+                    EVENTS.labels("written").inc(len(events))
+                except Exception as e:
+                    EVENTS.labels("failed").inc(len(events))
+                    logging.error(f"Transcript write failed, {len(events)} events lost: {e}")
+            if closing:
+                return
+
+    def _write(self, data: bytes) -> None:
+        started = time.perf_counter()
+        now = time.time()
+        if self._file is not None and (self._file_bytes >= self.rotate_bytes
+                                       or now - self._file_opened >= self.rotate_seconds):
+            self._close_file()
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))
+            self.path = os.path.join(self.directory, f"transcript-{stamp}-{os.getpid()}.jsonl.zst")
+            self._file = open(self.path, "ab")
+            self._file_bytes = self._file.tell()
+            self._file_opened = now
+        frame = self._compressor.compress(data)
+        self._file.write(frame)
+        self._file.flush()
+        self._file_bytes += len(frame)
+        WRITTEN_BYTES.inc(len(frame))
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_sink = None
+
+
+def get_transcripts():
+    """The process-wide transcript sink, or None when TRANSCRIPTS=0."""
+    global _sink
+    if _sink is None and TRANSCRIPTS:
+        _sink = TranscriptSink()
+    return _sink
+
+
+async def close_transcripts() -> None:
+    """Write out and close the sink on shutdown; the next get_transcripts() builds one for the new event loop."""
+    global _sink
+    if _sink is not None:
+        await _sink.aclose()
+    _sink = None
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from chatbot import metrics
+
+# What a new message does to a turn that is still running:
+# "never" (wait for it), "before_reply" (cancel it until its reply starts reaching the client) or "always"
+TURN_SUPERSEDE = os.getenv("TURN_SUPERSEDE", "never")
+
+COALESCED = metrics.Counter("chatbot_turn_messages_coalesced_total", "User messages merged into another turn")
+CANCELLED = metrics.Counter("chatbot_turns_cancelled_total", "Turns cancelled because the user sent a new message")
+
+CANCELLED_TOOL_RESULT = "Cancelled: the customer sent a new message before this finished."
+
+
+async def repair_thread(app, config: dict, message_id: str) -> bool:
+    """Make a thread consistent after a turn was cancelled mid-way.
+
+    Tool calls left without results are closed with a "cancelled" result, since
+    the model rejects histories with dangling tool calls. Returns whether the
+    cancelled turn's user message (by id) made it into the thread.
+    """
+    messages = (await app.aget_state(config)).values.get("messages", [])
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+    dangling = [call for m in messages if isinstance(m, AIMessage) for call in m.tool_calls
+                if call["id"] not in answered]
+    if dangling:
+        await app.aupdate_state(config, {"messages": [
+            ToolMessage(CANCELLED_TOOL_RESULT, tool_call_id=call["id"], name=call["name"]) for call in dangling
+        ]}, as_node="tools")
+    return any(m.id == message_id for m in messages)
+
+
+class TurnScheduler:
+    """Runs one session's turns one at a time, independently of the WebSocket reader.
+
+    Messages that arrive while a turn is running are sent together as the next
+    turn. Depending on `supersede`, a new message also cancels the running
+    turn; the thread is then repaired and the cancelled turn's messages are
+    answered together with the new ones. Messages may carry a client `ref`;
+    `refs` lists those answered by the running turn.
+    """
+
+    def __init__(self, app, config: dict, run_turn, supersede: str = TURN_SUPERSEDE):
+        self.app = app
+        self.config = config
+        self.run_turn = run_turn  # async (HumanMessage) -> None
+        self.supersede = supersede
+        self.replying = False  # Part of the running turn's reply has been sent
+        self.refs = []  # Client refs of the messages the running turn answers
+        self._pending = []  # (text, ref)
+        self._carried = []  # Refs of cancelled messages already in the thread
+        self._wakeup = asyncio.Event()
+        self._turn = None
+
+    @property
+    def idle(self) -> bool:
+        """No turn running and no message waiting."""
+        return not self._pending and (self._turn is None or self._turn.done())
+
+    async def drain(self) -> None:
+        """Wait until every submitted message has been answered."""
+        while not self.idle:
+            if self._turn is not None and not self._turn.done():
+                await asyncio.wait([self._turn])
+            else:
+                await asyncio.sleep(0.01)  # Submitted, not picked up by run() yet
+
+    def reply_started(self) -> None:
+        self.replying = True
+
+    def submit(self, text: str, ref=None) -> None:
+        self._pending.append((text, ref))
+        self._wakeup.set()
+        if self._turn is None or self._turn.done():
+            return
+        if self.supersede == "always" or (self.supersede == "before_reply" and not self.replying):
+            self._turn.cancel()
+
+    async def run(self) -> None:
+        """Process turns until cancelled (when the connection closes)."""
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if not self._pending:
+                    continue
+                items, self._pending = self._pending, []
+                carried, self._carried = self._carried, []
+                texts = [text for text, _ in items]
+                if len(texts) > 1:
+                    COALESCED.inc(len(texts) - 1)
+                message = HumanMessage("\n".join(texts), id=f"turn-{uuid.uuid4()}")
+                self.replying = False
+                self.refs = carried + [ref for _, ref in items if ref is not None]
+                self._turn = asyncio.create_task(self.run_turn(message))
+                await asyncio.wait([self._turn])
+                if self._turn.cancelled():
+                    CANCELLED.inc()
+                    metrics.TURNS.labels("cancelled").inc()
+                    recorded = await repair_thread(self.app, self.config, message.id)
+                    if recorded:
+                        COALESCED.inc(len(texts))  # Already in the thread; answered by the next turn
+                        self._carried = self.refs
+                    else:
+                        self._pending[:0] = items
+                        self._carried = carried
+                    logging.info(f"Turn superseded by a new message (user message recorded={recorded})")
+        finally:
+            if self._turn is not None and not self._turn.done():
+                self._turn.cancel()
+                await asyncio.wait([self._turn])
@@ -0,0 +1,113 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+
+from chatbot import llm, metrics
+
+# "background": warm up after the server starts listening (/ready reports when done); "blocking":
+# before it listens; "off": everything is built on first use
+WARMUP = os.getenv("WARMUP", "background")
+# LLM connections opened during warm-up, so the first turns skip TCP and TLS setup
+WARMUP_LLM_CONNECTIONS = int(os.getenv("WARMUP_LLM_CONNECTIONS", "4"))
+
+STEP_SECONDS = metrics.Gauge("chatbot_warmup_step_seconds", "Time each warm-up step took", ["step"])
+READY = metrics.Gauge("chatbot_ready", "1 once warm-up has finished and the worker is ready to serve")
+
+# Modules kept out of `import main` and loaded by the "imports" step
+HEAVY_MODULES = ("chatbot.graph", "langchain_openai" if llm.LLM_BACKEND == "openai" else "chatbot.fake_llm")
+
+status = {"state": "pending", "seconds": None, "steps": {}, "error": None}
+_done = None  # asyncio.Event, set when warm-up has finished (or failed)
+
+
+def _import_heavy() -> None:
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def _load_premiums() -> None:
+    from chatbot.tools import premium_store
+
+    premium_store.index
+
+
+def _tokenize_prompt() -> None:
+    from chatbot.prompt import default_prompt
+
+    default_prompt.section_tokens  # Loads the tokenizer and counts the prefix every session shares
+
+
+def _build_graph() -> None:
+    from chatbot.websocket import get_app, get_greetings
+
+    get_app()
+    get_greetings()
+
+
+async def _open_pool() -> None:
+    await llm.warm_pool(WARMUP_LLM_CONNECTIONS)
+
+
+# (name, callable, runs in a worker thread). The graph is built on the event loop: it creates
+# loop-bound objects, and the slow part (importing langgraph) is already done by then.
+STEPS = (("imports", _import_heavy, True), ("premiums", _load_premiums, True), ("prompt", _tokenize_prompt, True),
+         ("graph", _build_graph, False), ("llm_pool", _open_pool, False))
+
+
+def is_ready() -> bool:
+    return status["state"] in ("ready", "off")
+
+
+async def warm_up() -> bool:
+    """Build everything the first session needs. Returns True if the worker is ready to serve."""
+    global _done
+    if _done is None or _done.is_set():
+        _done = asyncio.Event()
+    status.update(state="warming", steps={}, error=None)
+    started = time.perf_counter()
+    try:
+        for name, step, threaded in STEPS:
+            step_started = time.perf_counter()
+            if threaded:
+                await asyncio.to_thread(step)
+            elif asyncio.iscoroutinefunction(step):
+                await step()
+            else:
+                step()
+            seconds = time.perf_counter() - step_started
+            status["steps"][name] = round(seconds * 1000, 1)
+            STEP_SECONDS.labels(name).set(seconds)
+        status["state"] = "ready"
+        READY.set(1)
+    except Exception as e:
+        status.update(state="failed", error=str(e))
+        logging.error(f"Warm-up failed at step {name}: {e}")
+    finally:
+        status["seconds"] = round(time.perf_counter() - started, 3)
+        _done.set()
+    logging.info(f"Warm-up {status['state']} in {status['seconds'] * 1000:.0f} ms: {status['steps']}")
+    return status["state"] == "ready"
+
+
+async def start(mode: str = WARMUP):
+    """Warm up as configured by WARMUP. Returns the background task, if any."""
+    global _done
+    if mode == "off":
+        status["state"] = "off"
+        READY.set(1)
+        return None
+    if mode == "blocking":
+        await warm_up()
+        return None
+    if mode != "background":
+        raise ValueError(f"Unknown WARMUP {mode!r} (expected 'background', 'blocking' or 'off')")
+    _done = asyncio.Event()  # Before the task runs: connections accepted meanwhile must wait for it
+    return asyncio.create_task(warm_up())
+
+
+async def wait() -> None:
+    """Wait for a running warm-up, so early connections don't race it to build the shared graph."""
+    if _done is not None:
+        await _done.wait()
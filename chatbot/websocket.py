@@ -1,88 +1,411 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from chatbot.graph import setup_graph
-from chatbot.prompt import sys_prompt
-from langchain_openai import ChatOpenAI
+from chatbot import metrics
+from chatbot.admission import ADMISSION_REJECT, AdmissionRejected, get_admission
+from chatbot.context import ContextManager
+from chatbot.deadlines import DEADLINE_MISSES, TURN_DEADLINE, turn_deadline
+from chatbot.greeting import GreetingCache, OPENING_USER_MESSAGE, seed_greeting
+from langchain_core.messages import AIMessage, ToolMessage
+from chatbot.llm import get_model
+from chatbot.prompt import DEFAULT_LANGUAGE, compile_prompt, get_persona_details, persona_info
+from chatbot.ratelimit import get_rate_limiter
+from chatbot.response_cache import get_response_cache
+from chatbot.resume import (REPLAYED, RESUME_FINISH_TIMEOUT, RESUME_SECONDS, RESUMES, get_outbox,
+                            get_resume_tokens)
+from chatbot.router import PremiumRouter
+from chatbot.sessions import CLOSE_CODE, CLOSE_REASONS, get_sessions
+from chatbot.streaming import make_transport, stream_turn
+from chatbot.transcripts import get_transcripts
+import asyncio
+import logging
 import os
+import re
+import time
 import uuid
-from langchain_core.messages import AIMessage, ToolMessage
-from dotenv import load_dotenv
 from chatbot.tools import premium_filter
+from chatbot.turns import TurnScheduler, repair_thread
+
+_app = None
+_context = None
+_greetings = None
+_detached = {}  # thread_id -> task finishing a turn whose client dropped
+
+
+def get_app():
+    """The compiled graph shared by every connection in this process."""
+    global _app, _context
+    if _app is None:
+        from chatbot.graph import setup_graph  # Imported lazily (langgraph): normally during warm-up
+
+        model = get_model()
+        router = PremiumRouter()
+        _context = ContextManager(summarizer=model)
+        _app = setup_graph(model.bind_tools([premium_filter]), context=_context,
+                           admission=get_admission(), router=router if router.mode != "off" else None,
+                           cache=get_response_cache())
+    return _app
+
+
+def get_greetings() -> GreetingCache:
+    global _greetings
+    if _greetings is None:
+        _greetings = GreetingCache(get_model())
+    return _greetings
+
+
+async def _send_greeting(app, transport, config: dict, prompt):
+    """Send the opening message and record it in the thread. Returns the greeting and where it came from."""
+    greetings = get_greetings()
+    if greetings.mode == "llm":
+        timings = await stream_turn(app, {"messages": [("system", prompt.text), ("user", OPENING_USER_MESSAGE)]},
+                                    config, transport)
+        return "\n".join(_replies(timings["messages"])), "llm"
+    greeting, source = await greetings.get(prompt)
+    await transport.send_message(greeting)
+    await seed_greeting(app, config, prompt, greeting)
+    return greeting, source
+
+
+async def record(type_: str, **fields) -> None:
+    """Add an event to the conversation transcript (if transcripts are enabled)."""
+    transcripts = get_transcripts()
+    if transcripts is not None:
+        await transcripts.emit(type_, **fields)
+
+
+def _replies(messages) -> list:
+    return [m.content for m in messages if isinstance(m, AIMessage) and not m.tool_calls
+            and isinstance(m.content, str) and m.content]
+
+# Longest value accepted from the connection URL (session ids, resume tokens)
+MAX_PARAM_LENGTH = 100
+# Languages a session may ask for (comma-separated); anything else gets DEFAULT_LANGUAGE
+SESSION_LANGUAGES = os.getenv("SESSION_LANGUAGES", "English,Bahasa Indonesia")
+LANGUAGES = {language.strip().lower(): language.strip()
+             for language in SESSION_LANGUAGES.split(",") if language.strip()}
 
+# Persona values go into the system prompt and the prompt cache key, so only these are accepted:
+# fixed choices, an age, and short plain names (letters, spaces, . ' -) for the free-text fields
+PERSONA_CHOICES = {"gender": {"male": "Male", "female": "Female"},
+                   "marital_status": {s.lower(): s for s in ("Single", "Married", "Divorced", "Widowed")}}
+PERSONA_TEXT = re.compile(r"[^\W\d_]+(?:[ .'-]+[^\W\d_]+)*\.?")
+PERSONA_TEXT_LENGTH = 40
+MAX_AGE = 120
 
-# Load environment variables once at module level
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable must be set")
+def _persona_value(key: str, value):
+    """The persona parameter as it may appear in the prompt, or None if it isn't acceptable."""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if key in PERSONA_CHOICES:
+        return PERSONA_CHOICES[key].get(value.lower())
+    if key == "age":
+        return value if value.isdigit() and len(value) <= 3 and int(value) <= MAX_AGE else None
+    if len(value) <= PERSONA_TEXT_LENGTH and PERSONA_TEXT.fullmatch(value):
+        return value
+    return None
+
+
+def _session_prompt(params):
+    """Compiled prompt for a session's persona and language (query parameters), memoized per combination.
+
+    Values outside the allowlists are ignored.
+    """
+    persona = get_persona_details(**{f"user_{key}": _persona_value(key, params.get(key))
+                                     for key in ("name", "gender", "age", "marital_status", "occupation", "country")})
+    language = params.get("language")
+    language = LANGUAGES.get(language.strip().lower()) if isinstance(language, str) else None
+    compiled = compile_prompt(persona or persona_info, language=language or DEFAULT_LANGUAGE)
+    tokens = compiled.section_tokens
+    logging.info(f"Session prompt tokens: cached prefix={tokens['prefix']} fresh suffix={tokens['suffix']}")
+    return compiled
+
 
 async def websocket_chat(websocket: WebSocket):
     """WebSocket endpoint for chatbot interaction."""
     await websocket.accept()
+    connected_at = time.perf_counter()
     thread_id = str(uuid.uuid4())
     config = {"configurable": {"thread_id": thread_id}}
     
-    # Initialize model and graph once per connection
+    transport = make_transport(websocket)
+    limiter = get_rate_limiter()
+    client_ip = websocket.client.host if websocket.client else "unknown"
+    metrics.CONNECTIONS.inc()
+    metrics.ACTIVE_SESSIONS.inc()
+
+    # Model and graph are shared; this session is isolated by its thread_id
     try:
-        model = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0,
-            api_key=OPENAI_API_KEY
-        ).bind_tools([premium_filter])
-        app = setup_graph(model)
+        app = get_app()
+        await start_session(app, transport, config, websocket.query_params, connected_at)
+        thread_id = config["configurable"]["thread_id"]
+
+        # Turns run in their own task so reading never waits for a reply; messages sent
+        # meanwhile are coalesced into the next turn (and may cancel the running one)
+        scheduler = TurnScheduler(app, config, lambda message: run_turn(
+            app, message, transport, config, websocket, on_reply=scheduler.reply_started))
+        sessions = get_sessions()
+        session = await sessions.open(thread_id, busy=lambda: not scheduler.idle)
+        turns = asyncio.create_task(scheduler.run())
+        reader = asyncio.create_task(_read_messages(websocket, transport, scheduler, sessions, session,
+                                                    limiter, client_ip))
+        reaped = asyncio.create_task(session.closed.wait())
+        dropped = False
+        end_reason = "error"
+        try:
+            await asyncio.wait([reader, reaped], return_when=asyncio.FIRST_COMPLETED)
+            if session.reaped:
+                end_reason = session.reaped
+                await _close_reaped(app, websocket, session, reader, turns)
+            else:
+                dropped = await reader  # Re-raise whatever ended the connection
+                end_reason = "dropped" if dropped else "quit"
+        finally:
+            reader.cancel()
+            reaped.cancel()
+            await record("session_end", thread_id=thread_id, reason=end_reason,
+                          duration_s=round(time.perf_counter() - connected_at, 3))
+            if dropped and transport.framed and not scheduler.idle:
+                detach_session(sessions, session, transport, scheduler, turns)
+            else:
+                turns.cancel()
+                await sessions.close(session)
 
+    except Exception as e:
+        await transport.send_error(f"Connection error: {str(e)}")
+        await websocket.close(code=1011)  # Internal error
+    finally:
+        metrics.ACTIVE_SESSIONS.dec()
+
+async def start_session(app, transport, config: dict, params, connected_at: float) -> None:
+    """Resume the thread named by params["resume"] or greet a new one.
+
+    Sets the session's language (and, when resumed, its thread_id) in `config`.
+    """
+    prompt = _session_prompt(params)
+    # The router only answers from its (English) template in English sessions
+    config["configurable"]["language"] = prompt.language
+    thread_id = config["configurable"]["thread_id"]
+
+    resumed = False
+    if transport.framed:
+        # Framed clients can reconnect to this thread later with the resume token
+        resumed_thread = await _resume_thread(app, params.get("resume"))
+        if resumed_thread is not None:
+            thread_id = config["configurable"]["thread_id"] = resumed_thread
+            resumed = True
+        outbox = get_outbox()
+        transport.on_message = lambda text: outbox.aappend(thread_id, text)
+        await transport.send_event("session", resume_token=get_resume_tokens().issue(thread_id),
+                                   resumed=resumed)
+
+    if resumed:
+        # Replay only what the client missed instead of greeting again
+        await _replay_missed(transport, thread_id, params.get("last_seq"))
+        resume_seconds = time.perf_counter() - connected_at
+        RESUME_SECONDS.observe(resume_seconds)
+        logging.info(f"Resumed thread {thread_id} in {resume_seconds * 1000:.1f} ms")
+        await record("session_start", thread_id=thread_id, resumed=True, framed=transport.framed,
+                      language=prompt.language, setup_ms=round(resume_seconds * 1000, 1))
+    else:
         # Send initial greeting
-        initial_message = await app.ainvoke(
-            {"messages": [("system", sys_prompt), ("user", "Hi")]},
-            config=config
-        )
-        await websocket.send_text(initial_message["messages"][-1].content)
+        greeting, source = await _send_greeting(app, transport, config, prompt)
+        setup_seconds = time.perf_counter() - connected_at
+        metrics.CONNECT_SECONDS.observe(setup_seconds)
+        logging.info(f"Connect to first message: {setup_seconds * 1000:.1f} ms (greeting source={source})")
+        await record("session_start", thread_id=thread_id, resumed=False, framed=transport.framed,
+                      language=prompt.language, setup_ms=round(setup_seconds * 1000, 1),
+                      greeting=greeting, greeting_source=source)
+
+
+async def _resume_thread(app, token: str):
+    """The thread a resume token names, if it is still checkpointed; else None (start a new session)."""
+    if not token or not isinstance(token, str):
+        return None
+    thread_id, error = get_resume_tokens().verify(token[:MAX_PARAM_LENGTH * 2])
+    if thread_id is None:
+        RESUMES.labels(error).inc()
+        return None
+    config = {"configurable": {"thread_id": thread_id}}
+    if thread_id in _detached:
+        # The reply to the last message is still being generated; it is replayed once done
+        await asyncio.wait([_detached[thread_id]], timeout=RESUME_FINISH_TIMEOUT)
+    else:
+        await get_sessions().wait_detached(thread_id, RESUME_FINISH_TIMEOUT)  # ... possibly on another worker
+    if not (await app.aget_state(config)).values.get("messages"):
+        RESUMES.labels("thread_gone").inc()
+        return None
+    # A turn cut off with the old connection may have left tool calls without results
+    await repair_thread(app, config, "")
+    RESUMES.labels("resumed").inc()
+    return thread_id
 
-        # Main chat loop
+
+async def _replay_missed(transport, thread_id: str, last_seq) -> None:
+    """Resend the assistant messages sent after the client's last_seq, from the outbox."""
+    last_seq = str(last_seq or "")
+    last_seq = int(last_seq) if last_seq.isdigit() else 0
+    outbox = get_outbox()
+    await outbox.aresume(thread_id, last_seq)
+    missed, incomplete = await outbox.asince(thread_id, last_seq)
+    for seq, text in missed:
+        await transport.replay(seq, text)
+    REPLAYED.inc(len(missed))
+    await transport.send_event("resumed", seq=await outbox.alast_seq(thread_id), replayed=len(missed),
+                               incomplete=incomplete)
+
+
+async def _read_messages(websocket: WebSocket, transport, scheduler, sessions, session, limiter,
+                         client_ip: str) -> bool:
+    """Read the client's messages and hand them to the turn scheduler until the connection ends.
+
+    Returns True if the client dropped, False if it said goodbye.
+    """
+    try:
         while True:
-            try:
-                user_input = await websocket.receive_text()
-                
-                # Handle exit commands
-                if user_input.lower() in {"quit", "exit", "q"}:
-                    await _handle_disconnect(websocket)
-                    return
-
-                # Process user input
-                await _process_message(app, user_input, websocket, config)
-
-            except WebSocketDisconnect:
-                await _handle_disconnect(websocket)
-                return
-            except Exception as e:
-                await websocket.send_text(f"Error processing message: {str(e)}")
+            user_input = await websocket.receive_text()
+            sessions.touch(session)
+
+            # Handle exit commands
+            if user_input.lower() in {"quit", "exit", "q"}:
+                await _handle_disconnect(websocket, transport)
+                return False
+
+            if not await limiter.aallow_message(session.thread_id, client_ip):
+                metrics.RATE_LIMITED.labels("messages").inc()
+                logging.info(f"Message rate limit exceeded for IP: {client_ip}")
+                await record("user_message", thread_id=session.thread_id, text=user_input, rate_limited=True)
+                await transport.send_error("You're sending messages too quickly. Please wait a moment and try again.")
+                continue
+
+            await record("user_message", thread_id=session.thread_id, text=user_input, rate_limited=False)
+            scheduler.submit(user_input)
+    except WebSocketDisconnect:
+        return True  # Nothing can be sent on a closed socket; state is kept for a resume
 
+
+def detach_session(sessions, session, transport, scheduler, turns) -> None:
+    """Finish a dropped client's running turn without it, so a resumed session can replay its reply."""
+    transport.detached = True
+    _detached[session.thread_id] = asyncio.create_task(_finish_detached(sessions, session, scheduler, turns))
+
+
+async def _finish_detached(sessions, session, scheduler, turns) -> None:
+    try:
+        await sessions.detach(session)
+        await asyncio.wait_for(scheduler.drain(), RESUME_FINISH_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        turns.cancel()
+        await asyncio.wait([turns])
+        await sessions.close(session)
+        _detached.pop(session.thread_id, None)
+
+
+async def _close_reaped(app, websocket: WebSocket, session, reader, turns) -> None:
+    """Close a session the reaper expired (or a newer connection took over) and drop its state."""
+    logging.info(f"Closing session {session.thread_id}: {CLOSE_REASONS[session.reaped]}")
+    reader.cancel()
+    turns.cancel()
+    await asyncio.wait([reader, turns])
+    try:
+        await asyncio.wait_for(websocket.close(code=CLOSE_CODE, reason=CLOSE_REASONS[session.reaped]), 5)
+    except Exception:
+        pass  # Most reaped sockets are already dead
+    if session.reaped == "replaced":
+        return  # The thread lives on in the resumed connection
+    await forget_thread(app, session.thread_id)
+
+
+async def forget_thread(app, thread_id: str) -> None:
+    """Drop an expired session's checkpoints, outbox and context state."""
+    await app.checkpointer.adelete_thread(thread_id)
+    await get_outbox().aforget(thread_id)
+    if _context is not None:
+        _context.forget(thread_id)
+
+
+async def run_turn(app, message, transport, config: dict, websocket: WebSocket = None, on_reply=None) -> None:
+    """Run one (possibly coalesced) user turn, reporting failures to the client.
+
+    Without a `websocket` (a multiplexed session) a rejected turn is always answered with "busy".
+    A turn still running at TURN_DEADLINE is cut off and answered with "timeout".
+    """
+    deadline = None
+    try:
+        async with turn_deadline() as deadline:
+            await _process_message(app, message, transport, config, on_reply)
+    except AdmissionRejected as e:
+        logging.info(f"Turn rejected by admission control ({e.reason}), retry after {e.retry_after}s")
+        await record("turn", thread_id=config["configurable"]["thread_id"], user=message.content, outcome="busy")
+        if ADMISSION_REJECT == "close" and websocket is not None:
+            await websocket.close(code=1013, reason="Server busy, try again later")
+            return
+        await _send_busy(app, transport, config, e)
     except Exception as e:
-        await websocket.send_text(f"Connection error: {str(e)}")
-        await websocket.close(code=1011)  # Internal error
+        if isinstance(e, TimeoutError) and deadline is not None and deadline.expired():
+            await _send_timeout(app, message, transport, config)
+            return
+        metrics.TURNS.labels("error").inc()
+        await record("turn", thread_id=config["configurable"]["thread_id"], user=message.content, outcome="error",
+                      error=str(e))
+        await transport.send_error(f"Error processing message: {str(e)}")
+
+async def _process_message(app, message, transport, config: dict, on_reply=None) -> None:
+    """Process a user message and stream the reply tokens to the client."""
+    sent_before = transport.send_seconds
+    timings = await stream_turn(app, {"messages": [message]}, config, transport, on_reply)
+    metrics.TURNS.labels("ok").inc()
+    metrics.TURN_SECONDS.observe(timings["total"])
+    metrics.WS_SEND_SECONDS.observe(transport.send_seconds - sent_before)
+    if timings["first_token"] is not None:
+        metrics.FIRST_TOKEN_SECONDS.observe(timings["first_token"])
+    first_token = f"{timings['first_token'] * 1000:.1f} ms" if timings["first_token"] is not None else "n/a"
+    logging.info(f"Turn: first token {first_token}, total {timings['total'] * 1000:.1f} ms")
+    results = {m.tool_call_id: m.content for m in timings["messages"] if isinstance(m, ToolMessage)}
+    await record("turn", thread_id=config["configurable"]["thread_id"], user=message.content, outcome="ok",
+                  replies=_replies(timings["messages"]),
+                  tool_calls=[{"name": call["name"], "args": call["args"], "result": results.get(call["id"])}
+                              for m in timings["messages"] if isinstance(m, AIMessage) for call in m.tool_calls],
+                  first_token_ms=round(timings["first_token"] * 1000, 1) if timings["first_token"] is not None
+                  else None,
+                  total_ms=round(timings["total"] * 1000, 1))
+
+BUSY_MESSAGE = "We're experiencing high demand right now. Please send your message again in a moment."
+
+
+async def _send_busy(app, transport, config: dict, rejection: AdmissionRejected) -> None:
+    """Tell the client its message was not processed, and close the turn in the thread's history."""
+    if transport.framed:
+        await transport.send_event("busy", message=BUSY_MESSAGE, retry_after=rejection.retry_after)
+    else:
+        await transport.send_error(BUSY_MESSAGE)
+    # The user message is already checkpointed; record the busy reply so the history stays well-formed
+    await app.aupdate_state(config, {"messages": [AIMessage(BUSY_MESSAGE)]}, as_node="agent")
+
+TIMEOUT_MESSAGE = "Sorry, that took too long to answer. Please send your message again."
+
+
+async def _send_timeout(app, message, transport, config: dict) -> None:
+    """Tell the client its turn was cut off at the deadline, and close the turn in the thread's history."""
+    thread_id = config["configurable"]["thread_id"]
+    DEADLINE_MISSES.inc()
+    metrics.TURNS.labels("timeout").inc()
+    logging.warning(f"Turn in thread {thread_id} cut off at its {TURN_DEADLINE:g} s deadline")
+    await record("turn", thread_id=thread_id, user=message.content, outcome="timeout")
+    if transport.framed:
+        await transport.send_event("timeout", message=TIMEOUT_MESSAGE)
+    else:
+        await transport.send_error(TIMEOUT_MESSAGE)
+    # Like a cancelled turn: close dangling tool calls, then answer the user message if it was recorded
+    if await repair_thread(app, config, message.id):
+        await app.aupdate_state(config, {"messages": [AIMessage(TIMEOUT_MESSAGE)]}, as_node="agent")
 
-async def _process_message(app, user_input: str, websocket: WebSocket, config: dict) -> None:
-    """Process a single user message and stream responses."""
-    async for event in app.astream(
-        {"messages": [("user", user_input)]},
-        config,
-        stream_mode="values"
-    ):
-        last_message = event["messages"][-1]
-        
-        if isinstance(last_message, AIMessage):
-            if last_message.tool_calls:
-                # Don't send tool processing messages to the user
-                pass
-            elif last_message.response_metadata.get('finish_reason') == 'stop':
-                await websocket.send_text(last_message.content)
-        elif isinstance(last_message, ToolMessage):
-            # Don't send tool results directly to the user
-            pass
-
-async def _handle_disconnect(websocket: WebSocket) -> None:
+async def _handle_disconnect(websocket: WebSocket, transport) -> None:
     """Handle WebSocket disconnection gracefully."""
-    await websocket.send_text("Goodbye!")
+    transport.on_message = None  # Not part of the conversation a resumed session replays
+    await transport.send_message("Goodbye!")
     await websocket.close(code=1000)  # Normal closure
 
     
@@ -1,23 +1,80 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from chatbot.websocket import websocket_chat
+from chatbot.mux import mux_chat
+from chatbot.tools import premium_store
+from chatbot import llm
+from chatbot.checkpoint import get_checkpointer, run_sweeper
+from chatbot import ratelimit
+from chatbot import metrics
+from chatbot.sessions import WS_PING_INTERVAL, WS_PING_TIMEOUT, get_sessions, run_reaper
+from chatbot.transcripts import close_transcripts, get_transcripts
+from chatbot import warmup
+from chatbot.batch import (PREMIUM_BATCH_MAX_PROFILES, BatchTooLarge, DuplexStreamingResponse, chunked,
+                           ndjson_chunks, stream_quotes)
+import asyncio
+import atexit
+import hmac
+import secrets
+import orjson
+import queue
 import uvicorn
 import logging
+import logging.handlers
 import os
 from contextlib import asynccontextmanager
-from collections import defaultdict
-from datetime import datetime, timedelta
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()]
-)
+
+# Configure logging: records are queued and written to stderr by a background thread, so a slow
+# terminal or log collector never blocks the event loop. force replaces the default handler that
+# logging installs if a chatbot module logged while being imported.
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter("%(message)s"))  # Formatted once, by log_handler
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler], force=True)
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush queued records on exit
+
+# Seconds between checks of premium.xlsx for changes (0 disables the watcher)
+PREMIUM_RELOAD_INTERVAL = float(os.getenv("PREMIUM_RELOAD_INTERVAL", "30"))
+# Token required by the admin endpoints (they are disabled when unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Worker processes started by `python main.py`; with more than one, per-session state is kept in SQLite
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# State every worker must see for sessions to survive landing on another worker. Each of these
+# defaults to SQLite with several workers, so each must make its SQLite calls off the event loop
+SHARED_BACKENDS = ("CHECKPOINT_BACKEND", "RATE_LIMIT_BACKEND", "SESSION_BACKEND", "RESUME_OUTBOX_BACKEND")
+
+# Lifespan event handler
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.info("Starting up application...")
+    tasks = [asyncio.create_task(run_sweeper(get_checkpointer())),
+             asyncio.create_task(ratelimit.run_sweeper(ratelimit.get_rate_limiter())),
+             asyncio.create_task(run_reaper(get_sessions()))]
+    if PREMIUM_RELOAD_INTERVAL > 0:
+        tasks.append(asyncio.create_task(premium_store.watch(PREMIUM_RELOAD_INTERVAL)))
+    transcripts = get_transcripts()
+    if transcripts is not None:
+        transcripts.start()
+    # Build the graph, load the premium table and tokenizer and open LLM connections (see /ready)
+    warming = await warmup.start()
+    if warming is not None:
+        tasks.append(warming)
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)  # Nothing still sweeps or reloads as things close
+    await close_transcripts()  # Write out queued events
+    await llm.aclose()
+    logging.info("Shutting down application...")
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware - replace with your frontend domain in production
 app.add_middleware(
@@ -28,24 +85,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory rate limiting storage (IP -> (count, reset_time))
-rate_limit_store = defaultdict(lambda: {"count": 0, "reset_time": datetime.now() + timedelta(hours=1)})
-RATE_LIMIT = 100  # Max 100 connections per hour per IP
-
-# Manual rate limiting for WebSocket
+# Token-bucket rate limiting for WebSocket connections (see chatbot/ratelimit.py for the limits)
 async def check_rate_limit(websocket: WebSocket) -> bool:
-    client_ip = websocket.client.host
-    now = datetime.now()
-    
-    # Reset count if the hour has passed
-    if now >= rate_limit_store[client_ip]["reset_time"]:
-        rate_limit_store[client_ip] = {"count": 0, "reset_time": now + timedelta(hours=1)}
-    
-    # Check and increment
-    if rate_limit_store[client_ip]["count"] >= RATE_LIMIT:
-        return False
-    rate_limit_store[client_ip]["count"] += 1
-    return True
+    return await ratelimit.get_rate_limiter().aallow_connection(websocket.client.host)
 
 # Root endpoint
 @app.get("/")
@@ -55,13 +97,20 @@ async def root():
         "websocket_info": "Connect to the WebSocket endpoint at /chat"
     }
 
+# Readiness probe: 503 until warm-up has finished (the root endpoint answers as soon as the server listens)
+@app.get("/ready")
+async def ready():
+    return JSONResponse(status_code=200 if warmup.is_ready() else 503, content=warmup.status)
+
 # WebSocket endpoint with manual rate limiting
 @app.websocket("/chat")
 async def websocket_endpoint(websocket: WebSocket):
     if not await check_rate_limit(websocket):
-        await websocket.close(code=1013, reason="Rate limit exceeded (100/hour)")
+        metrics.RATE_LIMITED.labels("connections").inc()
+        await websocket.close(code=1013, reason="Rate limit exceeded")
         logging.info(f"Rate limit exceeded for IP: {websocket.client.host}")
         return
+    await warmup.wait()  # Connections that arrive during warm-up are accepted once it is done
     
     logging.info("WebSocket connection established")
     try:
@@ -72,26 +121,105 @@ async def websocket_endpoint(websocket: WebSocket):
         logging.error(f"Error in WebSocket: {e}")
         await websocket.close(code=1011)  # Internal error
 
+# Many sessions over one WebSocket (see chatbot/mux.py for the protocol)
+@app.websocket("/chat/mux")
+async def mux_endpoint(websocket: WebSocket):
+    if not await check_rate_limit(websocket):
+        metrics.RATE_LIMITED.labels("connections").inc()
+        await websocket.close(code=1013, reason="Rate limit exceeded")
+        logging.info(f"Rate limit exceeded for IP: {websocket.client.host}")
+        return
+    await warmup.wait()
+
+    logging.info("Multiplexed WebSocket connection established")
+    try:
+        await mux_chat(websocket)
+    except WebSocketDisconnect:
+        logging.info("Multiplexed WebSocket disconnected")
+    except Exception as e:
+        logging.error(f"Error in multiplexed WebSocket: {e}")
+        await websocket.close(code=1011)  # Internal error
+
+# Prometheus metrics; checkpoint gauges are computed at scrape time
+metrics.CHECKPOINT_BYTES.set_function(lambda: get_checkpointer().stats()["bytes"])
+metrics.CHECKPOINT_THREADS.set_function(lambda: get_checkpointer().stats()["threads"])
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Bulk quotes: a JSON list or an NDJSON stream of {"age", "cancer", "gender", "id"?} in, NDJSON results out
+@app.post("/premiums/batch")
+async def premiums_batch(request: Request):
+    quoter = premium_store.index.batch()  # One table version for the whole request
+    headers = {"X-Premium-Version": str(premium_store.version)}
+    if "ndjson" in request.headers.get("content-type", ""):
+        async def results():
+            try:
+                async for lines in stream_quotes(quoter, ndjson_chunks(request.stream())):
+                    yield lines
+            except BatchTooLarge as e:
+                # Headers are already sent; report the problem as a final line
+                yield orjson.dumps({"error": f"Batch aborted: {e}"}) + b"\n"
+        return DuplexStreamingResponse(results(), media_type="application/x-ndjson", headers=headers)
+
+    try:
+        profiles = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON list of profiles or NDJSON")
+    if not isinstance(profiles, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON list of profiles or NDJSON")
+    if len(profiles) > PREMIUM_BATCH_MAX_PROFILES:
+        raise HTTPException(status_code=413, detail=f"At most {PREMIUM_BATCH_MAX_PROFILES} profiles per request")
+    return StreamingResponse(stream_quotes(quoter, chunked(profiles)), media_type="application/x-ndjson",
+                             headers=headers)
+
+# Reload the premium table without restarting the worker
+@app.post("/admin/premiums/reload")
+async def reload_premiums(force: bool = False, x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        reloaded = await premium_store.areload(force=force)
+    except Exception as e:
+        logging.error(f"Premium table reload failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Reload failed, keeping version {premium_store.version}")
+    return {"reloaded": reloaded, "version": premium_store.version, "profiles": len(premium_store.index)}
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def exception_handler(request: Request, exc: Exception):
     logging.error(f"Unhandled exception at {request.url}: {str(exc)}", exc_info=True)
     return JSONResponse(status_code=500, content={"message": "Internal server error"})
 
-# Lifespan event handler
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    logging.info("Starting up application...")
-    yield
-    logging.info("Shutting down application...")
+def configure_workers(workers: int) -> None:
+    """Point every worker at the shared SQLite stores and one resume-token key.
 
-app.lifespan = lifespan
+    Workers are spawned as fresh interpreters that read their settings from the
+    environment, so defaults set here apply to all of them. Settings given
+    explicitly are kept (with a warning if they are per-process).
+    """
+    for name in SHARED_BACKENDS:
+        os.environ.setdefault(name, "sqlite")
+        if os.environ[name] != "sqlite":
+            logging.warning(f"{name}={os.environ[name]} keeps that state per worker; "
+                            "reconnects and limits will not carry over between workers")
+    os.environ.setdefault("RESUME_SECRET", secrets.token_hex(32))
+    # Loaded here first, so the premium snapshot is current: workers load it instead of the workbook
+    logging.info(f"Starting {workers} workers (premium table v{premium_store.version}, "
+                 f"{len(premium_store.index)} profiles)")
 
 # Run the app
 if __name__ == "__main__":
-    uvicorn.run(
-        app,
+    options = dict(
         host=os.getenv("HOST", "0.0.0.0"),
         port=int(os.getenv("PORT", 8000)),
+        ws_ping_interval=WS_PING_INTERVAL,
+        ws_ping_timeout=WS_PING_TIMEOUT,
     )
+    if WORKERS > 1:
+        configure_workers(WORKERS)
+        uvicorn.run("main:app", workers=WORKERS, **options)
+    else:
+        uvicorn.run(app, **options)
 